@@ -42,6 +42,8 @@ CREATE TABLE expediente (
   FOREIGN KEY (caso_id) REFERENCES caso(id)
   );
 
+# Índices para los filtros de la API: ver migraciones/ (python migrar.py)
+
 
  #Poblacion de tablas
 
@@ -1,11 +1,45 @@
 
-from flask import Flask, request, jsonify, session, redirect, url_for, render_template_string
+from flask import Flask, Response, request, jsonify, session, redirect, url_for, stream_with_context
 from functools import wraps
+from collections import Counter
 from datetime import datetime
-from conexion import getConexion
+import os
+import time
+import queue
+import base64
+import codecs
+import csv
+import io
+import json
+import mysql.connector
+from werkzeug.datastructures import MultiDict
+from conexion import pool, pool_lectura, replica_disponible, PoolAgotado
+import bd
+from bd import get_db_lectura, cursor, transaccion, lectura_primario
+from catalogos import CATALOGOS, catalogo_cache, tokens
+from cache_resultados import cache_expedientes, cache_conteos
+from formatos import FORMATOS_LISTA, formatear_filas
+import compresion
+from compresion import comprimir, conviene, con_gzip
+import estaticos
+from estaticos import assets_ui
+import resumen
+import cambios
+import archivo
+import eventos
+from eventos import difusor
+import metricas
+import consultas_lentas
+from consultas_lentas import consultas_lentas as registro_lentas
 
 app = Flask(__name__)
 app.secret_key = "llaveultrasecreta"
+bd.init_app(app)  # una conexión por request, devuelta al pool en el teardown
+metricas.init_app(app)  # Server-Timing y /metrics (antes de los demás after_request)
+consultas_lentas.init_app(app)  # consultas > SLOW_QUERY_MS, por forma, con EXPLAIN
+compresion.init_app(app)  # gzip de respuestas de texto (JSON/HTML/CSS/JS)
+estaticos.init_app(app)  # /assets/<nombre con hash>
+eventos.init_app(app)  # despierta al difusor SSE tras cada escritura
 
 
 # -------------------- Utilidades --------------------
@@ -21,14 +55,103 @@ def parse_date(date_str):
     except Exception:
         return None
 
-def fk_exists(table, fk_id):
-    conn = getConexion()
-    cur = conn.cursor(buffered=True)
-    cur.execute(f"SELECT 1 FROM {table} WHERE id = %s", (fk_id,))
-    ok = cur.fetchone() is not None
-    cur.close()
-    conn.close()
-    return ok
+def parse_id(valor):
+    """
+    Id entero de un valor JSON: int (no bool) o texto de dígitos. Devuelve
+    None para cualquier otra cosa (1.5, True, "1a"), en vez de truncarla.
+    """
+    if isinstance(valor, str) and valor.strip().isdigit():
+        return int(valor)
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return valor
+    return None
+
+def encode_cursor(after_id=None, before_id=None):
+    """
+    Cursor opaco para paginación por keyset: base64 de {"a": id} o {"b": id}.
+    """
+    payload = {"a": after_id} if after_id is not None else {"b": before_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token):
+    """
+    Devuelve (after_id, before_id) o None si el cursor no es válido.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        after_id, before_id = payload.get("a"), payload.get("b")
+        if isinstance(after_id, int) and before_id is None:
+            return after_id, None
+        if isinstance(before_id, int) and after_id is None:
+            return None, before_id
+    except Exception:
+        pass
+    return None
+
+# Campo FK de expediente -> tabla de catálogo
+FK_TABLAS = {
+    "aseguradora_id": "aseguradora",
+    "usuario_id": "usuario",
+    "juzgado_id": "juzgado",
+    "caso_id": "caso",
+}
+
+def fks_existentes(cur, ids_por_campo):
+    """
+    Recibe {campo: {ids}} y devuelve {campo: {ids que existen}}. Los ids ya
+    presentes en la caché de catálogos no se consultan; el resto se verifica
+    en una sola consulta con el cursor de la escritura (misma conexión y
+    transacción). Sin entrada vigente en la caché todos se consultan.
+    """
+    existentes, partes, params, vigentes = {}, [], [], set()
+    for campo, ids in ids_por_campo.items():
+        cacheados = catalogo_cache.ids_cacheados(FK_TABLAS[campo])
+        if cacheados is not None:
+            vigentes.add(campo)
+        cacheados = cacheados or frozenset()
+        existentes[campo] = {i for i in ids if i in cacheados}
+        faltan = [i for i in ids if i not in cacheados]
+        if faltan:
+            marcas = ", ".join(["%s"] * len(faltan))
+            partes.append(f"SELECT %s AS campo, id FROM {FK_TABLAS[campo]} WHERE id IN ({marcas})")
+            params += [campo, *faltan]
+    if partes:
+        cur.execute(" UNION ALL ".join(partes), tuple(params))
+        desactualizadas = set()
+        for campo, fk_id in cur.fetchall():
+            existentes[campo].add(fk_id)
+            if campo in vigentes:
+                # existe en la base pero no en la caché vigente: está desactualizada
+                desactualizadas.add(FK_TABLAS[campo])
+        for tabla in desactualizadas:
+            catalogo_cache.invalidar(tabla)
+    return existentes
+
+def normalizar_fks(datos):
+    """
+    FKs presentes en datos como ids enteros (ver parse_id): el mismo valor se
+    valida y se guarda, así MySQL no trunca un 1.5 que ya pasó la validación.
+    Devuelve (refs, error).
+    """
+    refs = {k: parse_id(datos[k]) for k in FK_TABLAS if k in datos}
+    no_enteros = [k for k, v in refs.items() if v is None]
+    if no_enteros:
+        return None, f"Deben ser ids enteros: {', '.join(no_enteros)}"
+    return refs, None
+
+def fks_invalidas(cur, refs):
+    """
+    Valida juntos los FKs de refs ({campo: id entero}, ver normalizar_fks) y
+    devuelve los campos cuyo id no existe (todos, no sólo el primero).
+    """
+    existentes = fks_existentes(cur, {campo: {fk_id} for campo, fk_id in refs.items()})
+    return [campo for campo in refs if not existentes[campo]]
+
+def fk_error(campos):
+    mensaje = "; ".join(f"{campo} no existe" for campo in campos)
+    return jsonify({"error": mensaje, "fk_invalidas": campos}), 400
 
 def is_admin():
     return session.get("username") == "admin"
@@ -57,29 +180,25 @@ def ensure_admin_user():
     Inserta si no está. (Texto plano según tu esquema actual).
     """
     try:
-        conn = getConexion()
-        cur = conn.cursor(buffered=True, dictionary=True)
-        cur.execute("SELECT id FROM usuario WHERE username = %s", ("admin",))
-        row = cur.fetchone()
+        with transaccion(buffered=True) as cur:
+            cur.execute("SELECT id FROM usuario WHERE username = %s", ("admin",))
+            row = cur.fetchone()
+            if not row:
+                cur.execute(
+                    "INSERT INTO usuario (nombre, apellido, username, pass) VALUES (%s, %s, %s, %s)",
+                    ("Admin", "User", "admin", "admin"),
+                )
         if not row:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO usuario (nombre, apellido, username, pass) VALUES (%s, %s, %s, %s)",
-                ("Admin", "User", "admin", "admin"),
-            )
-            conn.commit()
+            catalogo_cache.invalidar("usuario")
     except Exception as e:
-        try:
-            conn.rollback()
-        except:
-            pass
         print("No se pudo crear admin:", e)
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except:
-            pass
+
+@app.errorhandler(PoolAgotado)
+def pool_agotado(e):
+    # Se esperó DB_POOL_TIMEOUT sin conseguir conexión: saturación temporal
+    resp = jsonify({"error": "Servicio saturado, intente de nuevo"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
 
 # -------------------- Health/Inicio --------------------
 @app.route("/", methods=["GET"])
@@ -92,15 +211,44 @@ def root_redirect():
 @app.route("/status", methods=["GET"])
 def status():
     try:
-        conn = getConexion()
-        cur = conn.cursor(buffered=True)
-        cur.execute("SELECT 1")
-        cur.fetchone()
-        cur.close()
-        conn.close()
-        return jsonify({"status": "ok", "db": "conectada"}), 200
+        with cursor(buffered=True) as cur:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+        return jsonify({
+            "status": "ok",
+            "db": "conectada",
+            "pool": pool.estadisticas(),
+            "pool_lectura": pool_lectura.estadisticas() if pool_lectura else None,
+            "replica_disponible": replica_disponible(),
+            "cache_expedientes": cache_expedientes.estadisticas(),
+            "sse_clientes": difusor.clientes(),
+        }), 200
     except Exception as e:
-        return jsonify({"status": "error", "db_error": str(e)}), 500
+        return jsonify({"status": "error", "db_error": str(e), "pool": pool.estadisticas()}), 500
+
+LENTAS_ORDEN = {"total": "total_ms", "media": "media_ms", "max": "max_ms", "n": "n"}
+
+@app.route("/admin/consultas-lentas", methods=["GET"])
+@require_admin
+def listar_consultas_lentas():
+    """
+    Consultas más lentas que SLOW_QUERY_MS agrupadas por forma (sumando todos
+    los workers), con el último plan capturado. ?orden=total|media|max|n
+    """
+    orden = request.args.get("orden", "total")
+    if orden not in LENTAS_ORDEN:
+        return json_error(f"orden inválido. Use: {' | '.join(LENTAS_ORDEN)}", 400)
+    try:
+        limite = min(500, max(1, int(request.args.get("limit", 50))))
+    except ValueError:
+        return json_error("limit debe ser entero", 400)
+    formas, recientes = consultas_lentas.agregar(metricas.metricas.recolectar("consultas_lentas"),
+                                                 LENTAS_ORDEN[orden], limite)
+    return jsonify({
+        "umbral_ms": registro_lentas.umbral * 1000,
+        "formas": formas,
+        "recientes": recientes,
+    }), 200
 
 # -------------------- Auth: login/logout/me --------------------
 @app.route("/login", methods=["POST"])
@@ -111,15 +259,12 @@ def login():
     if not username or not password:
         return json_error("username y pass son obligatorios", 400)
 
-    conn = getConexion()
-    cur = conn.cursor(buffered=True, dictionary=True)
-    cur.execute(
-        "SELECT id, nombre, apellido, username, pass FROM usuario WHERE username = %s",
-        (username,),
-    )
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+    with cursor(buffered=True, dictionary=True) as cur:
+        cur.execute(
+            "SELECT id, nombre, apellido, username, pass FROM usuario WHERE username = %s",
+            (username,),
+        )
+        user = cur.fetchone()
 
     if not user or user["pass"] != password:
         return json_error("Credenciales inválidas", 401)
@@ -160,75 +305,176 @@ def me():
     }), 200
 
 # -------------------- Lecturas auxiliares (listas para UI) --------------------
+def formato_lista():
+    """Valor de ?format= para listados, o None si es inválido."""
+    formato = request.args.get("format", "objects")
+    return formato if formato in FORMATOS_LISTA else None
+
+def catalogo_response(nombre):
+    """
+    Sirve un catálogo desde la caché con ETag fuerte; responde 304 si el
+    cliente envía If-None-Match con el mismo ETag. Acepta ?format=.
+    """
+    formato = formato_lista()
+    if not formato:
+        return json_error(f"format inválido. Use: {' | '.join(FORMATOS_LISTA)}", 400)
+    entrada = catalogo_cache.get(nombre)
+    body = entrada["bodies"][formato]
+    resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(entrada["etags"][formato])
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp = resp.make_conditional(request)
+    if resp.status_code == 200 and conviene(body):
+        con_gzip(resp, entrada["gzips"][formato])
+    return resp
+
 @app.route("/aseguradoras", methods=["GET"])
 @require_auth
 def listar_aseguradoras():
-    conn = getConexion()
-    cur = conn.cursor(buffered=True, dictionary=True)
-    cur.execute("SELECT id, nombre_aseguradora FROM aseguradora ORDER BY id ASC")
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(data), 200
+    return catalogo_response("aseguradora")
 
 @app.route("/juzgados", methods=["GET"])
 @require_auth
 def listar_juzgados():
-    conn = getConexion()
-    cur = conn.cursor(buffered=True, dictionary=True)
-    cur.execute("SELECT id, nombre_juzgado FROM juzgado ORDER BY id ASC")
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(data), 200
+    return catalogo_response("juzgado")
 
 @app.route("/casos", methods=["GET"])
 @require_auth
 def listar_casos():
-    conn = getConexion()
-    cur = conn.cursor(buffered=True, dictionary=True)
-    cur.execute("SELECT id, nombre_caso FROM caso ORDER BY id ASC")
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(data), 200
+    return catalogo_response("caso")
 
 @app.route("/usuarios", methods=["GET"])
 @require_auth
 def listar_usuarios():
     # Nota: sólo lectura para poblar combos (no devolvemos 'pass')
-    conn = getConexion()
-    cur = conn.cursor(buffered=True, dictionary=True)
-    cur.execute("SELECT id, nombre, apellido, username FROM usuario ORDER BY id ASC")
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(data), 200
+    return catalogo_response("usuario")
+
+@app.route("/catalogos/invalidar", methods=["POST"])
+@require_admin
+def invalidar_catalogos():
+    # Invalidación explícita tras cambios hechos por fuera de la app
+    nombre = (request.json or {}).get("catalogo") if request.is_json else None
+    if nombre is not None and nombre not in CATALOGOS:
+        return json_error(f"Catálogo inválido. Use: {' | '.join(CATALOGOS)}", 400)
+    catalogo_cache.invalidar(nombre)
+    cache_expedientes.invalidar()  # los listados incluyen nombres de catálogos
+    return jsonify({"mensaje": "Caché invalidada", "catalogo": nombre or "todos"}), 200
 
 # -------------------- EXPEDIENTES (lectura: todos; CRUD: solo admin) --------------------
-@app.route("/expedientes", methods=["GET"])
-@require_auth
-def listar_expedientes():
-    # Paginación
-    page = request.args.get("page", default=1, type=int)
-    page_size = request.args.get("page_size", default=50, type=int)
-    offset = (page - 1) * page_size
+# Columnas de detalle: nombre -> (expresión SQL, alias del JOIN que necesita)
+CAMPOS_DETALLE = {
+    "id": ("e.id", None),
+    "estado": ("e.estado", None),
+    "fecha": ("e.fecha", None),
+    "aseguradora_id": ("e.aseguradora_id", None),
+    "aseguradora": ("a.nombre_aseguradora", "a"),
+    "usuario_id": ("e.usuario_id", None),
+    "usuario_nombre": ("u.nombre", "u"),
+    "usuario_apellido": ("u.apellido", "u"),
+    "usuario_username": ("u.username", "u"),
+    "juzgado_id": ("e.juzgado_id", None),
+    "juzgado": ("j.nombre_juzgado", "j"),
+    "caso_id": ("e.caso_id", None),
+    "caso": ("c.nombre_caso", "c"),
+}
 
-    # Filtros
-    estado = request.args.get("estado")  # Pendiente | En Curso | Cerrado
-    aseguradora_id = request.args.get("aseguradora_id", type=int)
-    usuario_id = request.args.get("usuario_id", type=int)
-    juzgado_id = request.args.get("juzgado_id", type=int)
-    caso_id = request.args.get("caso_id", type=int)  # <-- NUEVO
-    fecha_desde = request.args.get("fecha_desde")  # YYYY-MM-DD
-    fecha_hasta = request.args.get("fecha_hasta")  # YYYY-MM-DD
+JOINS_DETALLE = {
+    "a": "JOIN aseguradora a ON e.aseguradora_id = a.id",
+    "u": "JOIN usuario u ON e.usuario_id = u.id",
+    "j": "JOIN juzgado j ON e.juzgado_id = j.id",
+    "c": "JOIN caso c ON e.caso_id = c.id",
+}
+
+def select_expediente(campos=None, tabla="expediente"):
+    """
+    SELECT ... FROM expediente e con sólo los JOINs que piden los campos
+    (todos por defecto). Los FKs son NOT NULL y con restricción, así que
+    omitir un JOIN no cambia las filas; con campos de e solamente la
+    consulta queda sobre una sola tabla. tabla="expediente_archivo" da la
+    misma consulta sobre los archivados.
+    """
+    campos = campos or list(CAMPOS_DETALLE)
+    columnas = []
+    joins = []
+    for campo in campos:
+        expr, alias = CAMPOS_DETALLE[campo]
+        columnas.append(expr if expr == f"e.{campo}" else f"{expr} AS {campo}")
+        if alias and JOINS_DETALLE[alias] not in joins:
+            joins.append(JOINS_DETALLE[alias])
+    # JOINs en orden fijo para que la misma proyección dé el mismo SQL
+    joins.sort(key=list(JOINS_DETALLE.values()).index)
+    return "SELECT " + ", ".join(columnas) + f" FROM {tabla} e " + " ".join(joins)
+
+def campos_solicitados(args):
+    """
+    ?fields=id,estado,fecha -> (campos, error). id siempre va primero (lo
+    usan los cursores); sin fields se devuelve el detalle completo.
+    """
+    fields = args.get("fields")
+    if not fields:
+        return list(CAMPOS_DETALLE), None
+    pedidos = [f.strip() for f in fields.split(",") if f.strip()]
+    invalidos = [f for f in pedidos if f not in CAMPOS_DETALLE]
+    if invalidos:
+        return None, f"fields inválidos: {', '.join(invalidos)}. Use: {', '.join(CAMPOS_DETALLE)}"
+    return [c for c in CAMPOS_DETALLE if c == "id" or c in pedidos], None
+
+# Detalle completo (con nombres de catálogos) usado por defecto
+SELECT_EXPEDIENTE_DETALLE = select_expediente()
+
+# Búsqueda ?q=: catálogo cuyos nombres se buscan -> columna FK en expediente
+BUSQUEDA_CATALOGOS = {
+    "usuario": "e.usuario_id",
+    "aseguradora": "e.aseguradora_id",
+    "juzgado": "e.juzgado_id",
+    "caso": "e.caso_id",
+}
+BUSQUEDA_MAX_PALABRAS = 5
+
+def filtro_busqueda(q):
+    """
+    Condiciones para ?q=: cada palabra debe ser prefijo de alguna palabra del
+    usuario (nombre/apellido/username), la aseguradora, el juzgado o el caso
+    del expediente. Las palabras se resuelven a ids con el índice en memoria
+    de los catálogos, así la consulta queda como IN (...) sobre los índices
+    de FK en vez de LIKE '%x%' con JOINs. Devuelve (where, params, error).
+    """
+    palabras = tokens(q)
+    if len(palabras) > BUSQUEDA_MAX_PALABRAS:
+        return None, None, f"q admite hasta {BUSQUEDA_MAX_PALABRAS} palabras"
+
+    where, params = [], []
+    for palabra in palabras:
+        alternativas = []
+        for nombre, columna in BUSQUEDA_CATALOGOS.items():
+            ids = sorted(catalogo_cache.buscar(nombre, palabra))
+            if ids:
+                alternativas.append(f"{columna} IN ({', '.join(['%s'] * len(ids))})")
+                params.extend(ids)
+        # Palabra sin coincidencias en ningún catálogo: no hay resultados
+        where.append("(" + " OR ".join(alternativas) + ")" if alternativas else "1 = 0")
+    return where, params, None
+
+def filtros_expediente(args):
+    """
+    Traduce los filtros de listar_expedientes (estado, aseguradora_id,
+    usuario_id, juzgado_id, caso_id, fecha_desde, fecha_hasta, q) a
+    condiciones sobre el alias e. Devuelve (where, params, error).
+    """
+    estado = args.get("estado")  # Pendiente | En Curso | Cerrado
+    aseguradora_id = args.get("aseguradora_id", type=int)
+    usuario_id = args.get("usuario_id", type=int)
+    juzgado_id = args.get("juzgado_id", type=int)
+    caso_id = args.get("caso_id", type=int)
+    fecha_desde = args.get("fecha_desde")  # YYYY-MM-DD
+    fecha_hasta = args.get("fecha_hasta")  # YYYY-MM-DD
 
     where = []
     params = []
 
     if estado:
         if not validate_estado(estado):
-            return json_error("Estado inválido. Use: Pendiente | En Curso | Cerrado", 400)
+            return None, None, "Estado inválido. Use: Pendiente | En Curso | Cerrado"
         where.append("e.estado = %s")
         params.append(estado)
 
@@ -238,98 +484,289 @@ def listar_expedientes():
         where.append("e.usuario_id = %s"); params.append(usuario_id)
     if juzgado_id is not None:
         where.append("e.juzgado_id = %s"); params.append(juzgado_id)
-    if caso_id is not None:  # <-- NUEVO
+    if caso_id is not None:
         where.append("e.caso_id = %s"); params.append(caso_id)
 
     if fecha_desde:
-        try:
-            _ = datetime.strptime(fecha_desde, "%Y-%m-%d").date()
-        except Exception:
-            return json_error("fecha_desde inválida. Use YYYY-MM-DD", 400)
+        if not parse_date(fecha_desde):
+            return None, None, "fecha_desde inválida. Use YYYY-MM-DD"
         where.append("e.fecha >= %s"); params.append(fecha_desde)
 
     if fecha_hasta:
-        try:
-            _ = datetime.strptime(fecha_hasta, "%Y-%m-%d").date()
-        except Exception:
-            return json_error("fecha_hasta inválida. Use YYYY-MM-DD", 400)
+        if not parse_date(fecha_hasta):
+            return None, None, "fecha_hasta inválida. Use YYYY-MM-DD"
         where.append("e.fecha <= %s"); params.append(fecha_hasta)
 
+    q = args.get("q", "").strip()
+    if q:
+        where_q, params_q, error = filtro_busqueda(q)
+        if error:
+            return None, None, error
+        where += where_q; params += params_q
+
+    return where, params, None
+
+def incluye_archivo(args):
+    """Si los filtros (ya validados) de args pueden alcanzar expedientes archivados."""
+    return archivo.incluye_archivo(args.get("estado"), parse_date(args.get("fecha_desde") or ""))
+
+def contar_expedientes(cur, where, params, con_archivo):
+    where_clause = ("WHERE " + " AND ".join(where)) if where else ""
+    if con_archivo:
+        cur.execute(f"""
+            SELECT (SELECT COUNT(*) FROM expediente e {where_clause})
+                 + (SELECT COUNT(*) FROM expediente_archivo e {where_clause}) AS total
+        """, tuple(params + params))
+    else:
+        cur.execute(f"SELECT COUNT(*) AS total FROM expediente e {where_clause}", tuple(params))
+    return cur.fetchone()[0]
+
+# ?count=: exact (COUNT(*), por defecto) | estimated | none (sin total, sólo has_more)
+CONTEOS = ("exact", "estimated", "none")
+# Filtros que expediente_resumen tiene agrupados (sin fecha ni q)
+FILTROS_RESUMEN = ("aseguradora_id", "usuario_id", "juzgado_id", "caso_id")
+
+def filtros_resumen(args):
+    """{columna: valor} si el total de los filtros de args sale de expediente_resumen; si no None."""
+    if args.get("fecha_desde") or args.get("fecha_hasta") or args.get("q", "").strip():
+        return None
+    filtros = {k: args.get(k, type=int) for k in FILTROS_RESUMEN}
+    filtros = {k: v for k, v in filtros.items() if v is not None}
+    if args.get("estado"):
+        filtros["estado"] = args.get("estado")
+    return filtros
+
+def estimar_expedientes(cur, where, params, con_archivo):
+    """Filas que estima el optimizador para el conteo (EXPLAIN: rows x filtered)."""
     where_clause = ("WHERE " + " AND ".join(where)) if where else ""
+    total = 0.0
+    for tabla in ("expediente", "expediente_archivo") if con_archivo else ("expediente",):
+        cur.execute(f"EXPLAIN SELECT COUNT(*) FROM {tabla} e {where_clause}", tuple(params))
+        columnas = cur.column_names
+        for fila in cur.fetchall():
+            plan = dict(zip(columnas, fila))
+            if plan.get("table") == "e":
+                total += (plan.get("rows") or 0) * float(plan.get("filtered") or 100) / 100
+    return int(total)
+
+def total_expedientes(cur, args, where, params, con_archivo, modo):
+    """
+    Total de listar_expedientes según ?count= -> (total, es_estimacion).
+    exact: COUNT(*), salvo que ya se haya contado en la generación vigente
+    (vale para todas las páginas del mismo filtro).
+    estimated: expediente_resumen si los filtros lo permiten (exacto); si
+    no, un total contado en una generación anterior o la estimación del
+    optimizador, que no recorren filas.
+    """
+    clave = (tuple(where), tuple(params), con_archivo)
+    if modo == "estimated":
+        filtros = filtros_resumen(args)
+        if filtros is not None:
+            return resumen.total(cur, filtros), False
+        cacheado = cache_conteos.get(clave, exacto=False)
+        if cacheado is not None:
+            return cacheado
+        return estimar_expedientes(cur, where, params, con_archivo), True
+    cacheado = cache_conteos.get(clave)
+    if cacheado is not None:
+        return cacheado
+    generacion = cache_expedientes.generacion
+    total = contar_expedientes(cur, where, params, con_archivo)
+    cache_conteos.guardar(clave, generacion, total)
+    return total, False
+
+def pagina_expedientes(campos, where, params, orden, limite, offset=None, con_archivo=False):
+    """
+    (sql, params) de una página ordenada por e.id. Con el archivo, cada
+    tabla aporta sus primeras limite + offset filas por su PK y se mezclan.
+    """
+    where_clause = ("WHERE " + " AND ".join(where)) if where else ""
+    if not con_archivo:
+        sql = f"{select_expediente(campos)} {where_clause} ORDER BY e.id {orden} LIMIT %s"
+        if offset is None:
+            return sql, params + [limite]
+        return sql + " OFFSET %s", params + [limite, offset]
+    tope = limite + (offset or 0)
+    partes = [
+        f"({select_expediente(campos, tabla)} {where_clause} ORDER BY e.id {orden} LIMIT %s)"
+        for tabla in ("expediente", "expediente_archivo")
+    ]
+    sql = f"SELECT * FROM ({' UNION ALL '.join(partes)}) t ORDER BY id {orden} LIMIT %s OFFSET %s"
+    return sql, params + [tope] + params + [tope, limite, offset or 0]
+
+def respuesta_json_cacheada(entrada, estado_cache):
+    body = entrada["body"]
+    resp = app.response_class(body, mimetype="application/json")
+    resp.headers["X-Cache"] = estado_cache
+    if conviene(body):
+        # Se comprime una vez por entrada de caché, no en cada HIT
+        if entrada["gzip"] is None:
+            entrada["gzip"] = comprimir(body)
+        con_gzip(resp, entrada["gzip"])
+    return resp
+
+PAGE_SIZE_MAX = 1000
 
-    conn = getConexion()
-    cur = conn.cursor(buffered=True, dictionary=True)
-
-    # Total con filtros
-    cur.execute(f"SELECT COUNT(*) AS total FROM expediente e {where_clause}", tuple(params))
-    total = cur.fetchone()["total"]
-
-    # Selección con joins y filtros
-    cur.execute(f"""
-        SELECT
-            e.id,
-            e.estado,
-            e.fecha,
-            e.aseguradora_id,
-            a.nombre_aseguradora AS aseguradora,
-            e.usuario_id,
-            u.nombre AS usuario_nombre,
-            u.apellido AS usuario_apellido,
-            u.username AS usuario_username,
-            e.juzgado_id,
-            j.nombre_juzgado AS juzgado,
-            e.caso_id,
-            c.nombre_caso AS caso
-        FROM expediente e
-        JOIN aseguradora a ON e.aseguradora_id = a.id
-        JOIN usuario u ON e.usuario_id = u.id
-        JOIN juzgado j ON e.juzgado_id = j.id
-        JOIN caso c ON e.caso_id = c.id
-        {where_clause}
-        ORDER BY e.id DESC
-        LIMIT %s OFFSET %s
-    """, tuple(params + [page_size, offset]))
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    return jsonify({"page": page, "page_size": page_size, "total": total, "data": data}), 200
+@app.route("/expedientes", methods=["GET"])
+@require_auth
+def listar_expedientes():
+    # Paginación
+    page = request.args.get("page", default=1, type=int)
+    page_size = request.args.get("page_size", default=50, type=int)
+    if page < 1:
+        return json_error("page debe ser >= 1", 400)
+    if not 1 <= page_size <= PAGE_SIZE_MAX:
+        return json_error(f"page_size debe estar entre 1 y {PAGE_SIZE_MAX}", 400)
+    offset = (page - 1) * page_size
+
+    # Paginación por cursor (keyset sobre e.id): after_id | before_id | cursor opaco.
+    # Si no viene ninguno de estos parámetros se mantiene page/page_size.
+    after_id = request.args.get("after_id", type=int)
+    before_id = request.args.get("before_id", type=int)
+    cursor_token = request.args.get("cursor")
+    if cursor_token:
+        decoded = decode_cursor(cursor_token)
+        if not decoded:
+            return json_error("cursor inválido", 400)
+        after_id, before_id = decoded
+    if after_id is not None and before_id is not None:
+        return json_error("Use after_id o before_id, no ambos", 400)
+    modo_cursor = "cursor" in request.args or after_id is not None or before_id is not None
+
+    # Formato de la respuesta: objects (por defecto) | rows | columns
+    formato = formato_lista()
+    if not formato:
+        return json_error(f"format inválido. Use: {' | '.join(FORMATOS_LISTA)}", 400)
+
+    # Proyección (?fields=): sólo los JOINs que hacen falta
+    campos, error = campos_solicitados(request.args)
+    if error:
+        return json_error(error, 400)
+
+    # Filtros
+    where, params, error = filtros_expediente(request.args)
+    if error:
+        return json_error(error, 400)
+
+    # Total: exact | estimated | none
+    conteo = request.args.get("count", "exact")
+    if conteo not in CONTEOS:
+        return json_error(f"count inválido. Use: {' | '.join(CONTEOS)}", 400)
+
+    # Caché de resultados: clave = filtros normalizados + página/cursor
+    if modo_cursor:
+        clave = (tuple(where), tuple(params), tuple(campos), formato, page_size, conteo, "cursor", after_id, before_id)
+    else:
+        clave = (tuple(where), tuple(params), tuple(campos), formato, page_size, conteo, "page", page)
+    entrada = cache_expedientes.get(clave)
+    if entrada is not None:
+        return respuesta_json_cacheada(entrada, "HIT")
+    generacion = cache_expedientes.generacion
+    # Los archivados (Cerrado antiguos) sólo se consultan si los filtros los alcanzan
+    con_archivo = incluye_archivo(request.args)
+
+    if modo_cursor:
+        # Seek sobre la PK: no recorre ni descarta las filas de páginas anteriores
+        seek, seek_params = list(where), list(params)
+        if after_id is not None:
+            seek.append("e.id < %s"); seek_params.append(after_id)
+        elif before_id is not None:
+            seek.append("e.id > %s"); seek_params.append(before_id)
+        orden = "ASC" if before_id is not None else "DESC"
+
+        # Las filas se leen como tuplas (e.id es la primera columna) y se
+        # serializan directo al formato pedido
+        with cursor(buffered=True) as cur:
+            # Total con filtros
+            total, estimado = None, False
+            if conteo != "none":
+                total, estimado = total_expedientes(cur, request.args, where, params, con_archivo, conteo)
+
+            # Se pide una fila extra para saber si hay más resultados
+            sql, sql_params = pagina_expedientes(campos, seek, seek_params, orden, page_size + 1,
+                                                 con_archivo=con_archivo)
+            cur.execute(sql, tuple(sql_params))
+            columnas, filas = cur.column_names, cur.fetchall()
+
+        has_more = len(filas) > page_size
+        filas = filas[:page_size]
+        if before_id is not None:
+            filas.reverse()
+            next_cursor = encode_cursor(after_id=filas[-1][0]) if filas else None
+            prev_cursor = encode_cursor(before_id=filas[0][0]) if has_more else None
+        else:
+            next_cursor = encode_cursor(after_id=filas[-1][0]) if has_more else None
+            prev_cursor = encode_cursor(before_id=filas[0][0]) if filas and after_id is not None else None
+
+        payload = {
+            "page_size": page_size,
+            "total": total,
+            "total_is_estimate": estimado,
+            **formatear_filas(columnas, filas, formato),
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+        }
+    else:
+        with cursor(buffered=True) as cur:
+            # Total con filtros
+            total, estimado = None, False
+            if conteo != "none":
+                total, estimado = total_expedientes(cur, request.args, where, params, con_archivo, conteo)
+
+            # Selección con joins y filtros. Sin total exacto has_more sale
+            # de pedir una fila extra
+            extra = 0 if conteo == "exact" else 1
+            sql, sql_params = pagina_expedientes(campos, where, params, "DESC", page_size + extra, offset,
+                                                 con_archivo)
+            cur.execute(sql, tuple(sql_params))
+            columnas, filas = cur.column_names, cur.fetchall()
+
+        if conteo == "exact":
+            has_more = offset + len(filas) < total
+        else:
+            has_more = len(filas) > page_size
+            filas = filas[:page_size]
+        payload = {"page": page, "page_size": page_size, "total": total, "total_is_estimate": estimado,
+                   **formatear_filas(columnas, filas, formato), "has_more": has_more}
+
+    entrada = cache_expedientes.guardar(clave, generacion, jsonify(payload).get_data())
+    return respuesta_json_cacheada(entrada, "MISS")
 
 @app.route("/expedientes/<int:e_id>", methods=["GET"])
 @require_auth
 def obtener_expediente(e_id):
-    conn = getConexion()
-    cur = conn.cursor(buffered=True, dictionary=True)
-    cur.execute("""
-        SELECT
-            e.id,
-            e.estado,
-            e.fecha,
-            e.aseguradora_id,
-            a.nombre_aseguradora AS aseguradora,
-            e.usuario_id,
-            u.nombre AS usuario_nombre,
-            u.apellido AS usuario_apellido,
-            u.username AS usuario_username,
-            e.juzgado_id,
-            j.nombre_juzgado AS juzgado,
-            e.caso_id,
-            c.nombre_caso AS caso
-        FROM expediente e
-        JOIN aseguradora a ON e.aseguradora_id = a.id
-        JOIN usuario u ON e.usuario_id = u.id
-        JOIN juzgado j ON e.juzgado_id = j.id
-        JOIN caso c ON e.caso_id = c.id
-        WHERE e.id = %s
-    """, (e_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    campos, error = campos_solicitados(request.args)
+    if error:
+        return json_error(error, 400)
+    with cursor(buffered=True, dictionary=True) as cur:
+        cur.execute(select_expediente(campos) + " WHERE e.id = %s", (e_id,))
+        row = cur.fetchone()
+        if not row and archivo.corte() is not None:
+            cur.execute(select_expediente(campos, "expediente_archivo") + " WHERE e.id = %s", (e_id,))
+            row = cur.fetchone()
 
     if not row:
         return json_error("Expediente no encontrado", 404)
     return jsonify(row), 200
 
+def leer_para_escritura(cur, e_id):
+    """
+    Columnas de un expediente (CAMPOS_EXPEDIENTE), con FOR UPDATE (o None).
+    Si estaba archivado primero vuelve a expediente, en la misma transacción.
+    """
+    sql = f"SELECT {', '.join(CAMPOS_EXPEDIENTE)} FROM expediente WHERE id = %s FOR UPDATE"
+    cur.execute(sql, (e_id,))
+    row = cur.fetchone()
+    if not row and archivo.restaurar(cur, [e_id]):
+        cur.execute(sql, (e_id,))
+        row = cur.fetchone()
+    return dict(zip(CAMPOS_EXPEDIENTE, row)) if row else None
+
+def fila_cambio(e_id, fila):
+    """Valores nuevos de un expediente para el registro de cambios."""
+    return {"id": e_id, **{c: int(fila[c]) if c in FK_TABLAS else fila[c] for c in CAMPOS_EXPEDIENTE}}
+
 @app.route("/expedientes", methods=["POST"])
 @require_admin
 def crear_expediente():
@@ -345,632 +782,738 @@ def crear_expediente():
     if not fecha:
         return json_error("Formato de fecha inválido. Use YYYY-MM-DD")
 
-    # Validar FKs
-    if not fk_exists("aseguradora", datos["aseguradora_id"]): return json_error("aseguradora_id no existe")
-    if not fk_exists("usuario", datos["usuario_id"]): return json_error("usuario_id no existe")
-    if not fk_exists("juzgado", datos["juzgado_id"]): return json_error("juzgado_id no existe")
-    if not fk_exists("caso", datos["caso_id"]): return json_error("caso_id no existe")  # <-- NUEVO
+    refs, error = normalizar_fks(datos)
+    if error:
+        return json_error(error)
+    nueva = {**datos, **refs, "fecha": fecha}
 
-    conn = getConexion()
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            INSERT INTO expediente (aseguradora_id, usuario_id, juzgado_id, caso_id, estado, fecha)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (datos["aseguradora_id"], datos["usuario_id"], datos["juzgado_id"],
-              datos["caso_id"], datos["estado"], fecha))
-        conn.commit()
-        return jsonify({"mensaje": "Expediente creado", "id": cur.lastrowid}), 201
-    except Exception as e:
-        conn.rollback()
+        with transaccion() as cur:
+            # Validar FKs (una sola consulta, en la transacción del INSERT)
+            invalidos = fks_invalidas(cur, refs)
+            if invalidos:
+                return fk_error(invalidos)
+
+            cur.execute("""
+                INSERT INTO expediente (aseguradora_id, usuario_id, juzgado_id, caso_id, estado, fecha)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (nueva["aseguradora_id"], nueva["usuario_id"], nueva["juzgado_id"],
+                  nueva["caso_id"], nueva["estado"], fecha))
+            nuevo_id = cur.lastrowid
+            resumen.mover(cur, None, nueva)
+            cambios.registrar(cur, [("I", nuevo_id, fila_cambio(nuevo_id, nueva))])
+        cache_expedientes.invalidar()  # después del commit
+        return jsonify({"mensaje": "Expediente creado", "id": nuevo_id}), 201
+    except mysql.connector.Error as e:
         return json_error(str(e))
-    finally:
-        cur.close()
-        conn.close()
 
 @app.route("/expedientes/<int:e_id>", methods=["PUT"])
 @require_admin
 def actualizar_expediente(e_id):
     datos = request.json or {}
     fields, values = [], []
+    nuevos = {}  # columna -> valor ya validado
 
-    if "aseguradora_id" in datos:
-        if not fk_exists("aseguradora", datos["aseguradora_id"]): return json_error("aseguradora_id no existe")
-        fields.append("aseguradora_id = %s"); values.append(datos["aseguradora_id"])
-
-    if "usuario_id" in datos:
-        if not fk_exists("usuario", datos["usuario_id"]): return json_error("usuario_id no existe")
-        fields.append("usuario_id = %s"); values.append(datos["usuario_id"])
-
-    if "juzgado_id" in datos:
-        if not fk_exists("juzgado", datos["juzgado_id"]): return json_error("juzgado_id no existe")
-        fields.append("juzgado_id = %s"); values.append(datos["juzgado_id"])
-
-    if "caso_id" in datos:  # <-- NUEVO
-        if not fk_exists("caso", datos["caso_id"]): return json_error("caso_id no existe")
-        fields.append("caso_id = %s"); values.append(datos["caso_id"])
+    # FKs presentes (se validan juntas, ya dentro de la transacción)
+    refs, error = normalizar_fks(datos)
+    if error:
+        return json_error(error)
+    for campo, fk_id in refs.items():
+        fields.append(f"{campo} = %s"); values.append(fk_id); nuevos[campo] = fk_id
 
     if "estado" in datos:
         if not validate_estado(datos["estado"]): return json_error("Estado inválido. Use: Pendiente | En Curso | Cerrado")
-        fields.append("estado = %s"); values.append(datos["estado"])
+        fields.append("estado = %s"); values.append(datos["estado"]); nuevos["estado"] = datos["estado"]
 
     if "fecha" in datos:
         fecha = parse_date(datos["fecha"])
         if not fecha: return json_error("Formato de fecha inválido. Use YYYY-MM-DD")
-        fields.append("fecha = %s"); values.append(fecha)
+        fields.append("fecha = %s"); values.append(fecha); nuevos["fecha"] = fecha
 
     if not fields:
         return json_error("Sin cambios", 400)
 
     values.append(e_id)
 
-    conn = getConexion()
-    cur = conn.cursor()
     try:
-        cur.execute(f"UPDATE expediente SET {', '.join(fields)} WHERE id = %s", tuple(values))
-        if cur.rowcount == 0:
-            conn.rollback()
-            return json_error("Expediente no encontrado", 404)
-        conn.commit()
+        with transaccion(buffered=True) as cur:
+            # Valores previos (bloqueados) para mover el conteo en expediente_resumen
+            anterior = leer_para_escritura(cur, e_id)
+            if not anterior:
+                return json_error("Expediente no encontrado", 404)
+
+            invalidos = fks_invalidas(cur, refs)
+            if invalidos:
+                return fk_error(invalidos)
+
+            cur.execute(f"UPDATE expediente SET {', '.join(fields)} WHERE id = %s", tuple(values))
+            nueva = {**anterior, **nuevos}
+            if resumen.clave(nueva) != resumen.clave(anterior):
+                resumen.mover(cur, anterior, nueva)
+            cambios.registrar(cur, [("U", e_id, fila_cambio(e_id, nueva))])
+        cache_expedientes.invalidar()
         return jsonify({"mensaje": "Expediente actualizado"}), 200
-    except Exception as e:
-        conn.rollback()
+    except mysql.connector.Error as e:
         return json_error(str(e))
-    finally:
-        cur.close()
-        conn.close()
 
 @app.route("/expedientes/<int:e_id>", methods=["DELETE"])
 @require_admin
 def eliminar_expediente(e_id):
-    conn = getConexion()
-    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM expediente WHERE id = %s", (e_id,))
-        if cur.rowcount == 0:
-            conn.rollback()
-            return json_error("Expediente no encontrado", 404)
-        conn.commit()
+        with transaccion(buffered=True) as cur:
+            anterior = leer_para_escritura(cur, e_id)
+            if not anterior:
+                return json_error("Expediente no encontrado", 404)
+            cur.execute("DELETE FROM expediente WHERE id = %s", (e_id,))
+            resumen.mover(cur, anterior, None)
+            cambios.registrar(cur, [("D", e_id, None)])
+        cache_expedientes.invalidar()
         return jsonify({"mensaje": "Expediente eliminado"}), 200
-    except Exception as e:
-        conn.rollback()
+    except mysql.connector.Error as e:
         return json_error(str(e))
-    finally:
-        cur.close()
-        conn.close()
 
-# -------------------- UI: Login y Vista de Expedientes --------------------
-@app.route("/login-ui", methods=["GET"])
-def login_ui():
-    html = """
-<!doctype html>
-<html lang="es">
-<head>
-<meta charset="utf-8">
-<title>Login</title>
-<style>
-  body { font-family: Arial, sans-serif; margin: 24px; }
-  form { max-width: 360px; display: grid; gap: 12px; }
-  input { padding: 8px; font-size: 16px; }
-  button { padding: 10px; }
-  .msg { margin-top: 12px; }
-  .hint { margin-top: 8px; color: #555; }
-</style>
-</head>
-<body>
-<h1>Iniciar sesión</h1>
-<form id="f">
-  <input name="username" placeholder="Usuario" required />
-  <input name="pass" type="password" placeholder="Contraseña" required />
-  <button type="submit">Entrar</button>
-</form>
-<div class="msg" id="msg"></div>
-<div class="hint">Tip: admin/admin para gestionar expedientes.</div>
-<script>
-const f = document.getElementById('f');
-const msg = document.getElementById('msg');
-f.addEventListener('submit', async (e) => {
-  e.preventDefault();
-  const payload = {
-    username: f.username.value.trim(),
-    pass: f.pass.value
-  };
-  msg.textContent = 'Validando...';
-  try {
-    const r = await fetch('/login', {
-      method: 'POST',
-      headers: {'Content-Type': 'application/json'},
-      body: JSON.stringify(payload)
-    });
-    const j = await r.json();
-    if (r.ok) {
-      msg.textContent = 'Login correcto. Redirigiendo...';
-      setTimeout(() => { window.location.href = '/ui'; }, 500);
-    } else {
-      msg.textContent = 'Error: ' + (j.error ?? 'Error desconocido');
-    }
-  } catch (err) {
-    msg.textContent = 'Error de red';
-  }
-});
-</script>
-</body>
-</html>
-    """
-    return html
+# -------------------- EXPEDIENTES: registro de cambios --------------------
+CHANGES_LIMIT_MAX = 5000
 
-@app.route("/ui", methods=["GET"])
-def ui():
-    html = """
-<!doctype html>
-<html lang="es">
-<head>
-<meta charset="utf-8">
-<title>Expedientes</title>
-<style>
-  body { font-family: Arial, sans-serif; margin: 24px; }
-  table { border-collapse: collapse; width: 100%; }
-  th, td { border: 1px solid #ddd; padding: 8px; }
-  th { background: #f3f3f3; }
-  .top { display: flex; gap: 12px; align-items: center; margin-bottom: 12px; }
-  button { padding: 8px 12px; cursor: pointer; }
-  .btn-danger { background: #dc2626; color: #fff; border: none; border-radius: 4px; }
-  .btn-secondary { background: #6b7280; color: #fff; border: none; border-radius: 4px; }
-  .btn { background: #2563eb; color: #fff; border: none; border-radius: 4px; }
-  .card { border: 1px solid #ddd; padding: 12px; border-radius: 8px; margin-top: 10px; }
-  form.grid { display: grid; grid-template-columns: repeat(6, 1fr); gap: 8px; align-items: end; }
-  form.grid label { font-size: 12px; color: #555; }
-  select, input { padding: 6px; }
-  #adminPanel { border: 1px dashed #0a8; }
-  #editPanel { border: 1px dashed #d97706; }
-  .msg { margin-top: 8px; color: #555; }
-  .actions { display: flex; gap: 8px; }
-</style>
-</head>
-<body>
-<div class="top">
-  <h1 style="flex:1">Expedientes</h1>
-  <div id="user">Verificando sesión...</div>
-  <button id="logout" class="btn-secondary">Cerrar sesión</button>
-</div>
-
-<!-- Panel de filtros (visible para todos los autenticados) -->
-<div class="card" id="filterPanel">
-  <h3>Filtros</h3>
-  <form class="grid" id="formFiltros">
-    <div>
-      <label>Estado</label>
-      <select id="f_estado">
-        <option value="">Todos</option>
-        <option value="Pendiente">Pendiente</option>
-        <option value="En Curso">En Curso</option>
-        <option value="Cerrado">Cerrado</option>
-      </select>
-    </div>
-    <div>
-      <label>Aseguradora</label>
-      <select id="f_aseguradora_id">
-        <option value="">Todas</option>
-      </select>
-    </div>
-    <div>
-      <label>Usuario</label>
-      <select id="f_usuario_id">
-        <option value="">Todos</option>
-      </select>
-    </div>
-    <div>
-      <label>Juzgado</label>
-      <select id="f_juzgado_id">
-        <option value="">Todos</option>
-      </select>
-    </div>
-    <div>
-      <label>Caso</label>
-      <select id="f_caso_id">
-        <option value="">Todos</option>
-      </select>
-    </div>
-    <div>
-      <label>Fecha desde</label>
-      <input id="f_fecha_desde" type="date" />
-    </div>
-    <div>
-      <label>Fecha hasta</label>
-      <input id="f_fecha_hasta" type="date" />
-    </div>
-    <div style="grid-column: span 6; display:flex; gap:8px; justify-content:flex-end; margin-top:6px;">
-      <button type="button" id="btnFiltrar" class="btn">Aplicar filtros</button>
-      <button type="button" id="btnLimpiar" class="btn-secondary">Limpiar</button>
-    </div>
-  </form>
-  <div id="filterMsg" class="msg"></div>
-</div>
-
-<!-- Panel de creación -->
-<div id="adminPanel" class="card" style="display:none;">
-  <h3>Crear expediente </h3>
-  <form id="formNuevo" class="grid">
-    <div>
-      <label>Aseguradora</label>
-      <select id="aseguradora_id"></select>
-    </div>
-    <div>
-      <label>Usuario</label>
-      <select id="usuario_id"></select>
-    </div>
-    <div>
-      <label>Juzgado</label>
-      <select id="juzgado_id"></select>
-    </div>
-    <div>
-      <label>Caso</label>
-      <select id="caso_id"></select>
-    </div>
-    <div>
-      <label>Estado</label>
-      <select id="estado">
-        <option>Pendiente</option>
-        <option>En Curso</option>
-        <option>Cerrado</option>
-      </select>
-    </div>
-    <div>
-      <label>Fecha</label>
-      <input id="fecha" type="date" />
-    </div>
-    <button type="submit" class="btn">Crear</button>
-  </form>
-  <div id="adminMsg" class="msg"></div>
-</div>
-
-<!-- Panel de edición -->
-<div id="editPanel" class="card" style="display:none;">
-  <h3>Editar expediente </h3>
-  <form id="formEdit" class="grid">
-    <input type="hidden" id="edit_id" />
-    <div>
-      <label>Aseguradora</label>
-      <select id="edit_aseguradora_id"></select>
-    </div>
-    <div>
-      <label>Usuario</label>
-      <select id="edit_usuario_id"></select>
-    </div>
-    <div>
-      <label>Juzgado</label>
-      <select id="edit_juzgado_id"></select>
-    </div>
-    <div>
-      <label>Caso</label>
-      <select id="edit_caso_id"></select>
-    </div>
-    <div>
-      <label>Estado</label>
-      <select id="edit_estado">
-        <option>Pendiente</option>
-        <option>En Curso</option>
-        <option>Cerrado</option>
-      </select>
-    </div>
-    <div>
-      <label>Fecha</label>
-      <input id="edit_fecha" type="date" />
-    </div>
-    <button type="submit" class="btn">Guardar cambios</button>
-    <button type="button" id="cancelEdit" class="btn-secondary">Cancelar</button>
-  </form>
-  <div id="editMsg" class="msg"></div>
-</div>
-
-<!-- Tabla de expedientes -->
-<div class="card">
-  <table id="tabla">
-    <thead>
-      <tr>
-        <th>ID</th>
-        <th>Estado</th>
-        <th>Fecha</th>
-        <th>Aseguradora</th>
-        <th>Usuario</th>
-        <th>Juzgado</th>
-        <th>Caso</th>
-        <th id="th-acciones">Acciones</th>
-      </tr>
-    </thead>
-    <tbody></tbody>
-  </table>
-  <div id="tableMsg" class="msg"></div>
-</div>
-
-<script>
-async function fetchJSON(url, opts = {}) {
-  const r = await fetch(url, opts);
-  const j = await r.json().catch(() => ({}));
-  if (!r.ok) {
-    const err = new Error(j.error ?? ('HTTP ' + r.status));
-    err.status = r.status;
-    err.payload = j;
-    throw err;
-  }
-  return j;
-}
+@app.route("/expedientes/changes", methods=["GET"])
+@require_auth
+def listar_cambios():
+    """
+    Cambios con seq > since, en orden de confirmación. Cada cambio trae op
+    (insert | update | delete), id y data (la fila completa; null en delete).
+    Los cambios viejos se compactan, así que un update puede ser el primer
+    cambio que un cliente ve de un id: aplicarlo como upsert. El cliente
+    guarda next_since y repite mientras has_more sea true. Si since quedó
+    detrás de lo compactado responde 410 y hay que resincronizar completo:
+    anotar latest_seq, recorrer /expedientes y seguir desde ese seq.
+    """
+    since = request.args.get("since", default=0, type=int)
+    limit = request.args.get("limit", default=500, type=int)
+    if since < 0:
+        return json_error("since inválido", 400)
+    if not 1 <= limit <= CHANGES_LIMIT_MAX:
+        return json_error(f"limit debe estar entre 1 y {CHANGES_LIMIT_MAX}", 400)
+
+    with cursor(buffered=True) as cur:
+        lista, compactado_hasta, ultimo_seq = cambios.leer(cur, since, limit)
+    if since < compactado_hasta:
+        return jsonify({
+            "error": "since es anterior al registro disponible; resincronice desde /expedientes",
+            "min_since": compactado_hasta,
+            "latest_seq": ultimo_seq,
+        }), 410
 
-async function me() { return fetchJSON('/me'); }
-
-// Carga catálogos para filtros y para paneles admin
-async function cargarCatalogos() {
-  const [ases, usrs, juzgs, casos] = await Promise.all([
-    fetchJSON('/aseguradoras'),
-    fetchJSON('/usuarios'),
-    fetchJSON('/juzgados'),
-    fetchJSON('/casos')
-  ]);
-
-  // Filtros (con opción "Todos/Todas")
-  const fA = document.getElementById('f_aseguradora_id');
-  const fU = document.getElementById('f_usuario_id');
-  const fJ = document.getElementById('f_juzgado_id');
-  const fC = document.getElementById('f_caso_id');
-
-  fA.innerHTML = '<option value="">Todas</option>' +
-    ases.map(a => `<option value="${a.id}">${a.nombre_aseguradora}</option>`).join('');
-  fU.innerHTML = '<option value="">Todos</option>' +
-    usrs.map(u => `<option value="${u.id}">${u.nombre} ${u.apellido}</option>`).join('');
-  fJ.innerHTML = '<option value="">Todos</option>' +
-    juzgs.map(j => `<option value="${j.id}">${j.nombre_juzgado}</option>`).join('');
-  fC.innerHTML = '<option value="">Todos</option>' +
-    casos.map(c => `<option value="${c.id}">${c.nombre_caso}</option>`).join('');
-
-  // Panel crear/editar (copiamos las opciones)
-  document.getElementById('aseguradora_id').innerHTML =
-    ases.map(a => `<option value="${a.id}">${a.nombre_aseguradora}</option>`).join('');
-  document.getElementById('usuario_id').innerHTML =
-    usrs.map(u => `<option value="${u.id}">${u.nombre} ${u.apellido}</option>`).join('');
-  document.getElementById('juzgado_id').innerHTML =
-    juzgs.map(j => `<option value="${j.id}">${j.nombre_juzgado}</option>`).join('');
-  document.getElementById('caso_id').innerHTML =
-    casos.map(c => `<option value="${c.id}">${c.nombre_caso}</option>`).join('');
-
-  document.getElementById('edit_aseguradora_id').innerHTML = document.getElementById('aseguradora_id').innerHTML;
-  document.getElementById('edit_usuario_id').innerHTML = document.getElementById('usuario_id').innerHTML;
-  document.getElementById('edit_juzgado_id').innerHTML = document.getElementById('juzgado_id').innerHTML;
-  document.getElementById('edit_caso_id').innerHTML = document.getElementById('caso_id').innerHTML;
-}
+    return jsonify({
+        "changes": lista,
+        "next_since": lista[-1]["seq"] if lista else since,
+        "has_more": len(lista) == limit and lista[-1]["seq"] < ultimo_seq,
+        "latest_seq": ultimo_seq,
+    }), 200
 
-function buildQueryFromFilters() {
-  const params = new URLSearchParams();
-  params.set('page', '1');
-  params.set('page_size', '100');
-
-  const estado = document.getElementById('f_estado').value;
-  const aseguradora_id = document.getElementById('f_aseguradora_id').value;
-  const usuario_id = document.getElementById('f_usuario_id').value;
-  const juzgado_id = document.getElementById('f_juzgado_id').value;
-  const caso_id = document.getElementById('f_caso_id').value;
-  const fecha_desde = document.getElementById('f_fecha_desde').value;
-  const fecha_hasta = document.getElementById('f_fecha_hasta').value;
-
-  if (estado) params.set('estado', estado);
-  if (aseguradora_id) params.set('aseguradora_id', aseguradora_id);
-  if (usuario_id) params.set('usuario_id', usuario_id);
-  if (juzgado_id) params.set('juzgado_id', juzgado_id);
-  if (caso_id) params.set('caso_id', caso_id);
-  if (fecha_desde) params.set('fecha_desde', fecha_desde);
-  if (fecha_hasta) params.set('fecha_hasta', fecha_hasta);
-
-  return params.toString();
-}
+# -------------------- EXPEDIENTES: eventos (SSE) --------------------
+SSE_HEARTBEAT_SEGUNDOS = 15
+SSE_DURACION_MAX = 300  # luego el navegador reconecta solo, con Last-Event-ID
 
-function renderFila(row, rol) {
-  const accionesHTML = (rol === 'admin')
-    ? `<div class="actions">
-         <button class="btn btn-edit" data-id="${row.id}">Editar</button>
-         <button class="btn-danger btn-del" data-id="${row.id}">Eliminar</button>
-       </div>`
-    : '';
-  const celdaAcciones = (rol === 'admin') ? `<td>${accionesHTML}</td>` : '';
-  return `
-    <tr data-rowid="${row.id}">
-      <td>${row.id ?? ''}</td>
-      <td>${row.estado ?? ''}</td>
-      <td>${row.fecha ?? ''}</td>
-      <td>${row.aseguradora ?? ''}</td>
-      <td>${(row.usuario_nombre ?? '') + ' ' + (row.usuario_apellido ?? '')}</td>
-      <td>${row.juzgado ?? ''}</td>
-      <td>${row.caso ?? ''}</td>
-      ${celdaAcciones}
-    </tr>
-  `;
-}
+def evento_sse(evento, datos, seq=None):
+    linea_id = f"id: {seq}\n" if seq is not None else ""
+    return f"{linea_id}event: {evento}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n"
 
-async function cargarExpedientes(rol) {
-  const tbody = document.querySelector('#tabla tbody');
-  const tableMsg = document.getElementById('tableMsg');
-  const colspan = (rol === 'admin') ? 8 : 7; // con columna Caso
-
-  tbody.innerHTML = `<tr><td colspan="${colspan}">Cargando...</td></tr>`;
-  tableMsg.textContent = '';
-  try {
-    const qs = buildQueryFromFilters();
-    const j = await fetchJSON('/expedientes?' + qs);
-    tbody.innerHTML = '';
-    j.data.forEach(row => {
-      tbody.insertAdjacentHTML('beforeend', renderFila(row, rol));
-    });
-    if (j.data.length === 0) {
-      tbody.innerHTML = `<tr><td colspan="${colspan}">Sin datos</td></tr>`;
-    }
-  } catch (e) {
-    if (e.status === 401) window.location.href = '/login-ui';
-    tableMsg.textContent = 'Error cargando expedientes: ' + (e.payload?.error ?? e.message ?? 'desconocido');
-  }
-}
+@app.route("/expedientes/events", methods=["GET"])
+@require_auth
+def eventos_expedientes():
+    """
+    Stream SSE de cambios: un evento `cambio` por alta/modificación/baja
+    (mismo formato que /expedientes/changes, con id = seq). Al reconectar, el
+    navegador manda Last-Event-ID y se reenvía lo que se perdió; si es
+    demasiado (o ya se compactó) se manda `resync` para recargar la tabla.
+    Los cambios llegan del difusor del proceso, no de una consulta por cliente.
+
+    Cada stream ocupa un hilo del worker hasta SSE_DURACION_MAX segundos; por
+    eso hay tope de clientes por proceso (SSE_MAX_CLIENTES, con hilos propios
+    en gunicorn.conf.py) y por encima del tope se responde 503.
+    """
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return json_error("Last-Event-ID inválido", 400)
+
+    pendientes, resync = [], False
+    with lectura_primario(buffered=True) as cur:
+        lista, compactado_hasta, ultimo = cambios.leer(cur, since or 0, eventos.SSE_LOTE if since is not None else 0)
+    if since is not None:
+        if since < compactado_hasta or (len(lista) == eventos.SSE_LOTE and lista[-1]["seq"] < ultimo):
+            resync = True
+        else:
+            pendientes = lista
+
+    suscripcion = difusor.suscribir(ultimo)
+    if suscripcion is None:
+        resp = jsonify({"error": "Demasiados clientes de eventos, intente de nuevo"})
+        resp.headers["Retry-After"] = "5"
+        return resp, 503
+    s, desde = suscripcion
+    try:
+        if desde > ultimo:
+            # El difusor ya repartió hasta `desde`: lo del medio se lee acá
+            with lectura_primario(buffered=True) as cur:
+                lista, _, _ = cambios.leer(cur, ultimo, eventos.SSE_LOTE)
+            pendientes += [c for c in lista if c["seq"] <= desde]
+            if len(lista) == eventos.SSE_LOTE and lista[-1]["seq"] < desde:
+                resync = True
+    except BaseException:
+        difusor.desuscribir(s)
+        raise
+
+    def generar():
+        enviado = max(ultimo, desde)
+        inicio = time.monotonic()
+        try:
+            # Todo bloque lleva id: el navegador siempre tiene un Last-Event-ID
+            # para reconectar, aunque en este stream no haya llegado un cambio
+            yield f"retry: 3000\nid: {since if since is not None and not resync else ultimo}\n\n"
+            if resync:
+                yield evento_sse("resync", {"latest_seq": ultimo}, ultimo)
+            for c in pendientes:
+                yield evento_sse("cambio", c, c["seq"])
+            while difusor.continuar() and time.monotonic() - inicio < SSE_DURACION_MAX:
+                if s.desbordada:
+                    break  # cliente lento: reconecta y se pone al día con Last-Event-ID
+                try:
+                    c = s.cola.get(timeout=SSE_HEARTBEAT_SEGUNDOS)
+                except queue.Empty:
+                    yield f"id: {enviado}\n: ping\n\n"
+                    continue
+                if c["seq"] > enviado:
+                    enviado = c["seq"]
+                    yield evento_sse("cambio", c, c["seq"])
+        finally:
+            difusor.desuscribir(s)
+
+    # Sin stream_with_context: la conexión del request vuelve al pool antes de empezar
+    return Response(generar(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# -------------------- EXPEDIENTES: carga masiva --------------------
+BULK_CHUNK = int(os.getenv("BULK_CHUNK", "500"))  # filas por INSERT/commit
+CAMPOS_EXPEDIENTE = ["aseguradora_id", "usuario_id", "juzgado_id", "caso_id", "estado", "fecha"]
+
+BULK_ELEMENTO_MAX = int(os.getenv("BULK_ELEMENTO_MAX", str(1024 * 1024)))  # caracteres por elemento / bytes por línea NDJSON
+
+def iter_json_array(stream, chunk_size=65536, elemento_max=BULK_ELEMENTO_MAX):
+    """
+    Recorre un arreglo JSON leyendo el stream por bloques y entrega cada
+    elemento apenas se completa (no carga el arreglo entero en memoria). Un
+    elemento de más de `elemento_max` caracteres es un error: sin el tope,
+    un cuerpo malformado se acumularía entero en el buffer.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    esperado = "["  # "[" -> "valor_o_fin" -> "sep" -> "valor" ...
+
+    def leer_mas():
+        nonlocal buf, pos, eof
+        if len(buf) - pos > elemento_max:
+            raise ValueError(f"Elemento del arreglo de más de {elemento_max} caracteres")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("JSON incompleto")
+            leer_mas()
+            continue
+
+        c = buf[pos]
+        if esperado == "[":
+            if c != "[":
+                raise ValueError("Se esperaba un arreglo JSON")
+            pos += 1; esperado = "valor_o_fin"
+        elif c == "]" and esperado in ("valor_o_fin", "sep"):
+            return
+        elif esperado == "sep":
+            if c != ",":
+                raise ValueError("Se esperaba ',' entre elementos")
+            pos += 1; esperado = "valor"
+        else:
+            try:
+                obj, fin = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError("JSON inválido")
+                leer_mas()
+                continue
+            if not eof and (fin == len(buf) or isinstance(obj, (int, float)) and buf[fin] in ".eE"):
+                # un número cortado por el bloque ("12" + "34", "1.5e" + "3")
+                # se decodifica igual: hay que ver lo que sigue antes de aceptarlo
+                leer_mas()
+                continue
+            pos = fin
+            esperado = "sep"
+            yield obj
+
+def iter_ndjson(stream, linea_max=BULK_ELEMENTO_MAX):
+    """
+    Entrega (objeto, error) por cada línea no vacía de un stream NDJSON. Una
+    línea de más de `linea_max` bytes es un error de esa fila y su resto se
+    descarta por tramos, sin acumularlo.
+    """
+    while True:
+        linea = stream.readline(linea_max + 1)
+        if not linea:
+            return
+        if len(linea) > linea_max and not linea.endswith(b"\n"):
+            while linea and not linea.endswith(b"\n"):
+                linea = stream.readline(linea_max + 1)
+            yield None, f"Línea de más de {linea_max} bytes"
+            continue
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea), None
+        except ValueError:
+            yield None, "JSON inválido"
 
-async function abrirEditar(id) {
-  const editPanel = document.getElementById('editPanel');
-  const editMsg = document.getElementById('editMsg');
-  editMsg.textContent = 'Cargando expediente ' + id + '...';
-  try {
-    const exp = await fetchJSON('/expedientes/' + id);
-    document.getElementById('edit_id').value = exp.id;
-    document.getElementById('edit_aseguradora_id').value = exp.aseguradora_id;
-    document.getElementById('edit_usuario_id').value = exp.usuario_id;
-    document.getElementById('edit_juzgado_id').value = exp.juzgado_id;
-    document.getElementById('edit_caso_id').value = exp.caso_id; // <-- NUEVO
-    document.getElementById('edit_estado').value = exp.estado;
-    document.getElementById('edit_fecha').value = exp.fecha ?? '';
-    editMsg.textContent = '';
-    editPanel.style.display = 'block';
-    editPanel.scrollIntoView({behavior:'smooth'});
-  } catch (e) {
-    editMsg.textContent = 'Error cargando: ' + (e.payload?.error ?? e.message ?? 'desconocido');
-  }
-}
+def iter_filas_bulk(req):
+    """
+    Entrega (fila, objeto, error) desde un arreglo JSON o un stream NDJSON
+    (application/x-ndjson), una fila a la vez.
+    """
+    if req.mimetype in ("application/x-ndjson", "application/jsonl"):
+        for fila, (obj, error) in enumerate(iter_ndjson(req.stream)):
+            yield fila, obj, error
+    else:
+        for fila, obj in enumerate(iter_json_array(req.stream)):
+            yield fila, obj, None
+
+def validar_fila_bulk(obj):
+    """
+    Aplica las mismas reglas que crear_expediente (salvo FKs, que se validan
+    por lote). Devuelve (valores, None) o (None, error).
+    """
+    if not isinstance(obj, dict):
+        return None, "Se esperaba un objeto"
+    if any(k not in obj for k in CAMPOS_EXPEDIENTE):
+        return None, f"Campos obligatorios: {', '.join(CAMPOS_EXPEDIENTE)}"
+    if not validate_estado(obj["estado"]):
+        return None, "Estado inválido. Use: Pendiente | En Curso | Cerrado"
+    fecha = parse_date(obj["fecha"])
+    if not fecha:
+        return None, "Formato de fecha inválido. Use YYYY-MM-DD"
+    refs, error = normalizar_fks(obj)
+    if error:
+        return None, error
+    return (*refs.values(), obj["estado"], fecha), None
 
-async function init() {
-  try {
-    const info = await me();
-    if (!info.autenticado) { window.location.href = '/login-ui'; return; }
-    const rol = info.usuario.rol;
-    const userText = `Sesión: ${info.usuario.nombre} ${info.usuario.apellido} (@${info.usuario.username}) [${rol}]`;
-    document.getElementById('user').textContent = userText;
-
-    const adminPanel = document.getElementById('adminPanel');
-    const thAcciones = document.getElementById('th-acciones');
-    if (rol === 'admin') {
-      adminPanel.style.display = 'block';
-      thAcciones.style.display = ''; // visible
-    } else {
-      adminPanel.style.display = 'none';
-      thAcciones.style.display = 'none'; // oculta columna Acciones para usuarios
-    }
-
-    // Cargar catálogos para filtros y paneles
-    await cargarCatalogos();
-
-    // Cargar expedientes con filtros iniciales (vacíos)
-    await cargarExpedientes(rol);
-
-    // Eventos: filtro, limpiar, editar/eliminar
-    document.getElementById('btnFiltrar').addEventListener('click', async () => {
-      await cargarExpedientes(rol);
-    });
-
-    document.getElementById('btnLimpiar').addEventListener('click', async () => {
-      document.getElementById('f_estado').value = '';
-      document.getElementById('f_aseguradora_id').value = '';
-      document.getElementById('f_usuario_id').value = '';
-      document.getElementById('f_juzgado_id').value = '';
-      document.getElementById('f_caso_id').value = '';
-      document.getElementById('f_fecha_desde').value = '';
-      document.getElementById('f_fecha_hasta').value = '';
-      await cargarExpedientes(rol);
-    });
-
-    // Acciones admin en tabla
-    document.addEventListener('click', async (ev) => {
-      if (ev.target.classList.contains('btn-edit')) {
-        const id = ev.target.getAttribute('data-id');
-        await abrirEditar(id);
-      }
-      if (ev.target.classList.contains('btn-del')) {
-        const id = ev.target.getAttribute('data-id');
-        if (!confirm('¿Eliminar expediente ' + id + '?')) return;
-        const tableMsg = document.getElementById('tableMsg');
-        tableMsg.textContent = 'Eliminando...';
-        try {
-          await fetchJSON('/expedientes/' + id, { method: 'DELETE' });
-          tableMsg.textContent = 'Eliminado';
-          await cargarExpedientes(rol);
-        } catch (e) {
-          tableMsg.textContent = 'Error: ' + (e.payload?.error ?? e.message ?? 'desconocido');
-        }
-      }
-    });
-  } catch (e) {
-    window.location.href = '/login-ui';
-  }
+def insertar_lote(lote):
+    """
+    Valida los FKs del lote en una consulta, inserta las filas válidas con un
+    INSERT multi-fila y confirma una sola vez. Devuelve los resultados por fila.
+    """
+    resultados = {fila: {"fila": fila, "error": error} for fila, _, error in lote if error}
+    validas = [(fila, valores) for fila, valores, error in lote if not error]
+    try:
+        with transaccion() as cur:
+            ids_por_campo = {campo: {v[i] for _, v in validas} for i, campo in enumerate(FK_TABLAS)}
+            existentes = fks_existentes(cur, ids_por_campo)
+            insertables = []
+            for fila, valores in validas:
+                invalidos = [c for i, c in enumerate(FK_TABLAS) if valores[i] not in existentes[c]]
+                if invalidos:
+                    resultados[fila] = {"fila": fila, "error": "; ".join(f"{c} no existe" for c in invalidos)}
+                else:
+                    insertables.append((fila, valores))
+
+            if insertables:
+                marcas = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(insertables))
+                cur.execute(
+                    f"INSERT INTO expediente ({', '.join(CAMPOS_EXPEDIENTE)}) VALUES {marcas}",
+                    tuple(v for _, valores in insertables for v in valores),
+                )
+                # InnoDB asigna ids consecutivos a un INSERT multi-fila simple
+                primer_id = cur.lastrowid
+                for n, (fila, _) in enumerate(insertables):
+                    resultados[fila] = {"fila": fila, "id": primer_id + n}
+                # valores = (aseguradora, usuario, juzgado, caso, estado, fecha)
+                resumen.ajustar(cur, Counter(
+                    (v[1], v[0], v[2], v[3], v[4]) for _, v in insertables
+                ))
+                cambios.registrar(cur, [
+                    ("I", primer_id + n, fila_cambio(primer_id + n, dict(zip(CAMPOS_EXPEDIENTE, v))))
+                    for n, (_, v) in enumerate(insertables)
+                ])
+        if insertables:
+            cache_expedientes.invalidar()
+    except mysql.connector.Error as e:
+        for fila, _ in validas:
+            resultados[fila] = {"fila": fila, "error": str(e)}
+    return [resultados[fila] for fila, _, _ in lote]
+
+@app.route("/expedientes/bulk", methods=["POST"])
+@require_admin
+def crear_expedientes_bulk():
+    """
+    Carga masiva: arreglo JSON o NDJSON. Se procesa en lotes de BULK_CHUNK
+    filas (un INSERT y un commit por lote, sobre la conexión del request) y la
+    respuesta se emite a medida que avanza, así la memoria no depende del
+    tamaño de la carga.
+    """
+    def generar():
+        insertados = errores = 0
+        primero = True
+        yield '{"resultados":['
+        filas = iter_filas_bulk(request)
+        error_formato = None
+        while True:
+            lote = []
+            try:
+                for fila, obj, error in filas:
+                    valores = None
+                    if not error:
+                        valores, error = validar_fila_bulk(obj)
+                    lote.append((fila, valores, error))
+                    if len(lote) >= BULK_CHUNK:
+                        break
+            except ValueError as e:
+                error_formato = str(e)
+            if lote:
+                for r in insertar_lote(lote):
+                    if "id" in r:
+                        insertados += 1
+                    else:
+                        errores += 1
+                    yield ("" if primero else ",") + json.dumps(r, ensure_ascii=False)
+                    primero = False
+            if error_formato or len(lote) < BULK_CHUNK:
+                break
+        cierre = {"insertados": insertados, "errores": errores}
+        if error_formato:
+            cierre["error"] = error_formato
+        yield "]," + json.dumps(cierre, ensure_ascii=False)[1:]
+
+    return Response(stream_with_context(generar()), mimetype="application/json")
+
+# -------------------- EXPEDIENTES: modificación y baja masivas --------------------
+BULK_IDS_MAX = 10000
+FILTROS_EXPEDIENTE = ("estado", "aseguradora_id", "usuario_id", "juzgado_id", "caso_id",
+                      "fecha_desde", "fecha_hasta", "q")
+CAMPOS_BULK_UPDATE = ("estado", "usuario_id", "juzgado_id")
+
+def seleccion_bulk(datos):
+    """
+    Expedientes a los que aplica una operación masiva: "ids" (lista) o
+    "filtros" (los mismos de listar_expedientes). Devuelve
+    (where, params, con_archivo, error); con_archivo indica si la selección
+    puede incluir expedientes archivados.
+    """
+    ids, filtros = datos.get("ids"), datos.get("filtros")
+    if (ids is None) == (filtros is None):
+        return None, None, False, "Indique ids o filtros (uno de los dos)"
+
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            return None, None, False, "ids debe ser una lista no vacía"
+        if len(ids) > BULK_IDS_MAX:
+            return None, None, False, f"Hasta {BULK_IDS_MAX} ids por operación; use filtros"
+        ids = [parse_id(i) for i in ids]
+        if None in ids:
+            return None, None, False, "ids deben ser enteros"
+        ids = sorted(set(ids))
+        con_archivo = archivo.corte() is not None
+        return [f"e.id IN ({', '.join(['%s'] * len(ids))})"], ids, con_archivo, None
+
+    if not isinstance(filtros, dict) or not filtros:
+        return None, None, False, "filtros debe ser un objeto con al menos un filtro"
+    desconocidos = [k for k in filtros if k not in FILTROS_EXPEDIENTE]
+    if desconocidos:
+        return None, None, False, f"Filtros desconocidos: {', '.join(desconocidos)}"
+    # filtros_expediente descarta en silencio los ids no numéricos: acá eso
+    # ampliaría la selección de una operación destructiva, así que se rechaza
+    args = MultiDict()
+    for k, v in filtros.items():
+        if k.endswith("_id"):
+            v = parse_id(v)
+            if v is None:
+                return None, None, False, f"{k} debe ser un entero"
+        elif not isinstance(v, str) or not v.strip():
+            return None, None, False, f"{k} debe ser un texto no vacío"
+        args[k] = str(v)
+    where, params, error = filtros_expediente(args)
+    if error:
+        return None, None, False, error
+    if not where:
+        # p. ej. q sin palabras: nunca "todos"
+        return None, None, False, "Ningún filtro válido"
+    return where, params, incluye_archivo(args), None
+
+def contar_seleccion(where, params, con_archivo):
+    with cursor(buffered=True) as cur:
+        return contar_expedientes(cur, where, params, con_archivo)
+
+def procesar_bulk(where, params, aplicar):
+    """
+    Recorre la selección por id descendente en lotes de BULK_CHUNK. Cada lote
+    bloquea sus filas (SELECT ... FOR UPDATE), llama a aplicar(cur, filas) y
+    confirma, así ningún lock dura más que un lote. Los lotes confirmados
+    quedan aunque uno posterior falle. Devuelve (afectados, lotes, error).
+    """
+    columnas = ["id"] + CAMPOS_EXPEDIENTE
+    afectados = lotes = 0
+    ultimo_id = None
+    while True:
+        seek, seek_params = list(where), list(params)
+        if ultimo_id is not None:
+            seek.append("e.id < %s"); seek_params.append(ultimo_id)
+        try:
+            with transaccion(buffered=True) as cur:
+                cur.execute(f"""
+                    SELECT {', '.join('e.' + c for c in columnas)}
+                    FROM expediente e
+                    WHERE {' AND '.join(seek)}
+                    ORDER BY e.id DESC
+                    LIMIT %s
+                    FOR UPDATE
+                """, tuple(seek_params + [BULK_CHUNK]))
+                filas = [dict(zip(columnas, f)) for f in cur.fetchall()]
+                if filas:
+                    aplicar(cur, filas)
+        except mysql.connector.Error as e:
+            return afectados, lotes, str(e)
+        if not filas:
+            break
+        cache_expedientes.invalidar()  # después de cada commit
+        afectados += len(filas)
+        lotes += 1
+        ultimo_id = filas[-1]["id"]
+        if len(filas) < BULK_CHUNK:
+            break
+    return afectados, lotes, None
+
+def respuesta_bulk(afectados, lotes, error):
+    cuerpo = {"afectados": afectados, "lotes": lotes}
+    if error:
+        return jsonify({"error": error, **cuerpo}), 400
+    return jsonify(cuerpo), 200
+
+@app.route("/expedientes/bulk", methods=["PATCH"])
+@require_admin
+def actualizar_expedientes_bulk():
+    """
+    Cambia estado y/o reasigna usuario_id/juzgado_id de muchos expedientes:
+    {"ids": [...] | "filtros": {...}, "valores": {...}, "dry_run": false}.
+    Sólo se tocan las filas cuyo valor cambia; dry_run devuelve cuántas son.
+    """
+    datos = request.json or {}
+    where, params, con_archivo, error = seleccion_bulk(datos)
+    if error:
+        return json_error(error)
+
+    valores = datos.get("valores")
+    if not isinstance(valores, dict) or not valores:
+        return json_error(f"valores debe indicar al menos uno de: {', '.join(CAMPOS_BULK_UPDATE)}")
+    desconocidos = [k for k in valores if k not in CAMPOS_BULK_UPDATE]
+    if desconocidos:
+        return json_error(f"No se pueden modificar en bloque: {', '.join(desconocidos)}")
+    if "estado" in valores and not validate_estado(valores["estado"]):
+        return json_error("Estado inválido. Use: Pendiente | En Curso | Cerrado")
+    refs, error = normalizar_fks(valores)
+    if error:
+        return json_error(error)
+    with cursor(buffered=True) as cur:
+        invalidos = fks_invalidas(cur, refs)
+    if invalidos:
+        return fk_error(invalidos)
+    valores = {**valores, **refs}
+
+    # Sólo las filas que cambian: el conteo del dry_run es exacto y el
+    # recorrido no bloquea filas que ya tienen esos valores
+    where = where + ["NOT (" + " AND ".join(f"e.{k} <=> %s" for k in valores) + ")"]
+    params = params + list(valores.values())
+    if datos.get("dry_run"):
+        return jsonify({"dry_run": True, "afectados": contar_seleccion(where, params, con_archivo)}), 200
+    if con_archivo:
+        # Los archivados seleccionados vuelven a expediente, que es lo que se recorre
+        archivo.restaurar_seleccion(where, params, BULK_CHUNK)
+
+    def aplicar(cur, filas):
+        ids = [f["id"] for f in filas]
+        cur.execute(
+            f"UPDATE expediente SET {', '.join(f'{k} = %s' for k in valores)} "
+            f"WHERE id IN ({', '.join(['%s'] * len(ids))})",
+            tuple(valores.values()) + tuple(ids),
+        )
+        deltas = Counter()
+        nuevas = []
+        for fila in filas:
+            nueva = {**fila, **valores}
+            deltas[resumen.clave(fila)] -= 1
+            deltas[resumen.clave(nueva)] += 1
+            nuevas.append(nueva)
+        resumen.ajustar(cur, deltas)
+        cambios.registrar(cur, [("U", n["id"], fila_cambio(n["id"], n)) for n in nuevas])
+
+    return respuesta_bulk(*procesar_bulk(where, params, aplicar))
+
+@app.route("/expedientes/bulk", methods=["DELETE"])
+@require_admin
+def eliminar_expedientes_bulk():
+    """
+    Elimina muchos expedientes: {"ids": [...] | "filtros": {...}, "dry_run": false}.
+    dry_run devuelve cuántos se eliminarían.
+    """
+    datos = request.json or {}
+    where, params, con_archivo, error = seleccion_bulk(datos)
+    if error:
+        return json_error(error)
+    if datos.get("dry_run"):
+        return jsonify({"dry_run": True, "afectados": contar_seleccion(where, params, con_archivo)}), 200
+    if con_archivo:
+        archivo.restaurar_seleccion(where, params, BULK_CHUNK)
+
+    def aplicar(cur, filas):
+        ids = [f["id"] for f in filas]
+        cur.execute(f"DELETE FROM expediente WHERE id IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+        deltas = Counter()
+        for fila in filas:
+            deltas[resumen.clave(fila)] -= 1
+        resumen.ajustar(cur, deltas)
+        cambios.registrar(cur, [("D", f["id"], None) for f in filas])
+
+    return respuesta_bulk(*procesar_bulk(where, params, aplicar))
+
+# -------------------- EXPEDIENTES: exportación --------------------
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "1000"))  # filas por fetchmany
+
+def _valor_export(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+@app.route("/expedientes/export", methods=["GET"])
+@require_auth
+def exportar_expedientes():
+    """
+    Exporta los expedientes filtrados (mismos filtros y fields= que
+    listar_expedientes) en CSV o NDJSON. Lee con un cursor sin buffer en lotes de EXPORT_BATCH y
+    emite la respuesta con un generador, así la memoria es constante. Si los
+    filtros alcanzan el archivo, los archivados salen al final.
+    """
+    formato = request.args.get("format", "csv")
+    if formato not in ("csv", "ndjson"):
+        return json_error("format inválido. Use: csv | ndjson", 400)
+    campos, error = campos_solicitados(request.args)
+    if error:
+        return json_error(error, 400)
+    where, params, error = filtros_expediente(request.args)
+    if error:
+        return json_error(error, 400)
+    where_clause = ("WHERE " + " AND ".join(where)) if where else ""
+    tablas = ["expediente", "expediente_archivo"] if incluye_archivo(request.args) else ["expediente"]
+
+    def generar():
+        conn = get_db_lectura()
+        cur = conn.cursor(buffered=False)
+        completo = False
+        try:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for tabla in tablas:
+                cur.execute(f"{select_expediente(campos, tabla)} {where_clause} ORDER BY e.id DESC", tuple(params))
+                columnas = cur.column_names
+                if formato == "csv" and tabla == tablas[0]:
+                    # la cabecera sale aunque no haya filas
+                    writer.writerow(columnas)
+                    yield buf.getvalue()
+                    buf.seek(0); buf.truncate()
+                while True:
+                    filas = cur.fetchmany(EXPORT_BATCH)
+                    if not filas:
+                        break
+                    for fila in filas:
+                        valores = [_valor_export(v) for v in fila]
+                        if formato == "csv":
+                            writer.writerow(valores)
+                        else:
+                            buf.write(json.dumps(dict(zip(columnas, valores)), ensure_ascii=False) + "\n")
+                    yield buf.getvalue()
+                    buf.seek(0); buf.truncate()
+            completo = True
+        finally:
+            if not completo:
+                # el cliente cortó la descarga: hay que leer lo pendiente
+                # antes de devolver la conexión al pool
+                try:
+                    conn.consume_results()
+                except Exception:
+                    pass
+            cur.close()
+
+    if formato == "csv":
+        mimetype, nombre = "text/csv", "expedientes.csv"
+    else:
+        mimetype, nombre = "application/x-ndjson", "expedientes.ndjson"
+    resp = Response(stream_with_context(generar()), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename={nombre}"
+    return resp
+
+# -------------------- Estadísticas --------------------
+# Dimensión -> (columna en expediente_resumen, catálogo, etiqueta)
+STATS_DIMENSIONES = {
+    "usuario": ("usuario_id", "usuario", lambda u: f"{u['nombre']} {u['apellido']}"),
+    "aseguradora": ("aseguradora_id", "aseguradora", lambda a: a["nombre_aseguradora"]),
+    "juzgado": ("juzgado_id", "juzgado", lambda j: j["nombre_juzgado"]),
+    "caso": ("caso_id", "caso", lambda c: c["nombre_caso"]),
 }
 
-// Crear expediente
-document.getElementById('formNuevo').addEventListener('submit', async (e) => {
-  e.preventDefault();
-  const adminMsg = document.getElementById('adminMsg');
-  adminMsg.textContent = 'Creando...';
-  const payload = {
-    aseguradora_id: parseInt(document.getElementById('aseguradora_id').value),
-    usuario_id: parseInt(document.getElementById('usuario_id').value),
-    juzgado_id: parseInt(document.getElementById('juzgado_id').value),
-    caso_id: parseInt(document.getElementById('caso_id').value),   // <-- NUEVO
-    estado: document.getElementById('estado').value,
-    fecha: document.getElementById('fecha').value
-  };
-  try {
-    const j = await fetchJSON('/expedientes', {
-      method: 'POST',
-      headers: {'Content-Type': 'application/json'},
-      body: JSON.stringify(payload)
-    });
-    adminMsg.textContent = 'Creado: ID ' + j.id;
-    const info = await me();
-    await cargarExpedientes(info.usuario.rol);
-  } catch (e) {
-    adminMsg.textContent = 'Error: ' + (e.payload?.error ?? e.message ?? 'desconocido');
-  }
-});
-
-// Guardar edición (PUT)
-document.getElementById('formEdit').addEventListener('submit', async (e) => {
-  e.preventDefault();
-  const editMsg = document.getElementById('editMsg');
-  editMsg.textContent = 'Guardando cambios...';
-  const id = document.getElementById('edit_id').value;
-  const payload = {
-    aseguradora_id: parseInt(document.getElementById('edit_aseguradora_id').value),
-    usuario_id: parseInt(document.getElementById('edit_usuario_id').value),
-    juzgado_id: parseInt(document.getElementById('edit_juzgado_id').value),
-    caso_id: parseInt(document.getElementById('edit_caso_id').value),   // <-- NUEVO
-    estado: document.getElementById('edit_estado').value,
-    fecha: document.getElementById('edit_fecha').value
-  };
-  try {
-    await fetchJSON('/expedientes/' + id, {
-      method: 'PUT',
-      headers: {'Content-Type': 'application/json'},
-      body: JSON.stringify(payload)
-    });
-    editMsg.textContent = 'Cambios guardados';
-    document.getElementById('editPanel').style.display = 'none';
-    const info = await me();
-    await cargarExpedientes(info.usuario.rol);
-  } catch (e) {
-    editMsg.textContent = 'Error: ' + (e.payload?.error ?? e.message ?? 'desconocido');
-  }
-});
-
-// Cancelar edición
-document.getElementById('cancelEdit').addEventListener('click', () => {
-  document.getElementById('editPanel').style.display = 'none';
-  document.getElementById('editMsg').textContent = '';
-});
-
-// Logout
-document.getElementById('logout').addEventListener('click', async () => {
-  try { await fetchJSON('/logout', {method:'POST'}); } catch {}
-  window.location.href = '/login-ui';
-});
-
-// Arranque
-init();
-</script>
-</body>
-</html>
-    """
-    return html
+@app.route("/stats", methods=["GET"])
+@require_auth
+def stats():
+    """
+    Cantidad de expedientes por estado agrupados por ?por=usuario|aseguradora|
+    juzgado|caso. Lee de expediente_resumen: el costo depende de la cantidad
+    de grupos, no del tamaño de expediente.
+    """
+    por = request.args.get("por", "usuario")
+    if por not in STATS_DIMENSIONES:
+        return json_error(f"por inválido. Use: {' | '.join(STATS_DIMENSIONES)}", 400)
+    columna, catalogo, etiqueta = STATS_DIMENSIONES[por]
+
+    with cursor(buffered=True, dictionary=True) as cur:
+        cur.execute(f"""
+            SELECT {columna} AS id, estado, SUM(total) AS total
+            FROM expediente_resumen
+            GROUP BY {columna}, estado
+            HAVING SUM(total) > 0
+            ORDER BY {columna}, estado
+        """)
+        filas = cur.fetchall()
+
+    nombres = {row["id"]: etiqueta(row) for row in catalogo_cache.get(catalogo)["data"]}
+    data = [{
+        columna: f["id"],
+        por: nombres.get(f["id"]),
+        "estado": f["estado"],
+        "total": int(f["total"]),
+    } for f in filas]
+    return jsonify({"por": por, "data": data}), 200
+
+# -------------------- UI: Login y Vista de Expedientes --------------------
+@app.route("/login-ui", methods=["GET"])
+def login_ui():
+    return assets_ui.pagina("login.html")
+
+@app.route("/ui", methods=["GET"])
+def ui():
+    return assets_ui.pagina("ui.html")
 
 # -------------------- Arranque --------------------
 
 if __name__ == "__main__":
+    # Servidor de desarrollo; en producción: gunicorn wsgi:app (ver gunicorn.conf.py)
     ensure_admin_user()  # crea admin si no existe
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,179 @@
+"""
+Archivo de expedientes cerrados (tablas expediente_archivo y
+expediente_archivo_corte, migración 005).
+
+Los expedientes Cerrado con fecha anterior al corte se mueven a
+expediente_archivo, así expediente (y sus índices) queda con lo que se
+consulta a diario. Las lecturas de app.py agregan el archivo sólo si los
+filtros pueden alcanzarlo (ver incluye_archivo); una escritura sobre un
+expediente archivado primero lo devuelve a expediente (restaurar).
+
+    python archivo.py archivar                # Cerrado con más de ARCHIVO_DIAS días
+    python archivo.py archivar --dias 365 --lote 500
+    python archivo.py estado
+
+Los movimientos no son cambios para los clientes: no pasan por
+expediente_cambio ni por expediente_resumen, que siguen contando ambos.
+"""
+import os
+import time
+import argparse
+import threading
+from datetime import date, timedelta
+from bd import transaccion, cursor
+from conexion import DB_REPLICA_RETRASO_SEGUNDOS
+
+ARCHIVO_DIAS = int(os.getenv("ARCHIVO_DIAS", "730"))
+ARCHIVO_CORTE_TTL = float(os.getenv("ARCHIVO_CORTE_TTL", "60"))  # segundos que cada worker recuerda el corte
+
+COLUMNAS = ("id", "aseguradora_id", "usuario_id", "juzgado_id", "caso_id", "estado", "fecha")
+
+_corte = {"valor": None, "leido": None}
+_corte_lock = threading.Lock()
+
+
+def corte():
+    """
+    Fecha de corte vigente (None si nunca se archivó): ningún expediente con
+    fecha >= corte está archivado. Se lee de la base cada ARCHIVO_CORTE_TTL
+    segundos; archivar() espera ese tiempo tras subirlo antes de mover filas.
+    """
+    with _corte_lock:
+        if _corte["leido"] is not None and time.monotonic() - _corte["leido"] < ARCHIVO_CORTE_TTL:
+            return _corte["valor"]
+    with cursor(buffered=True) as cur:
+        cur.execute("SELECT corte FROM expediente_archivo_corte WHERE id = 1")
+        fila = cur.fetchone()
+    with _corte_lock:
+        _corte.update(valor=fila[0] if fila else None, leido=time.monotonic())
+        return _corte["valor"]
+
+
+def incluye_archivo(estado=None, fecha_desde=None):
+    """
+    Si una consulta con estos filtros puede incluir expedientes archivados
+    (todos Cerrado y con fecha < corte). fecha_desde es un date o None.
+    """
+    if estado and estado != "Cerrado":
+        return False
+    limite = corte()
+    return limite is not None and (fecha_desde is None or fecha_desde < limite)
+
+
+def _mover(cur, ids, origen, destino):
+    marcas = ", ".join(["%s"] * len(ids))
+    columnas = ", ".join(COLUMNAS)
+    cur.execute(
+        f"INSERT INTO {destino} ({columnas}) SELECT {columnas} FROM {origen} WHERE id IN ({marcas})",
+        tuple(ids),
+    )
+    cur.execute(f"DELETE FROM {origen} WHERE id IN ({marcas})", tuple(ids))
+
+
+def restaurar(cur, ids):
+    """
+    Devuelve a expediente los ids que estén archivados, en la transacción del
+    llamador (que luego los lee y bloquea como cualquier otro). Devuelve los
+    ids restaurados.
+    """
+    if not ids:
+        return []
+    cur.execute(
+        f"SELECT id FROM expediente_archivo WHERE id IN ({', '.join(['%s'] * len(ids))}) FOR UPDATE",
+        tuple(ids),
+    )
+    archivados = [f[0] for f in cur.fetchall()]
+    if archivados:
+        _mover(cur, archivados, "expediente_archivo", "expediente")
+    return archivados
+
+
+def restaurar_seleccion(where, params, lote=1000):
+    """
+    Devuelve a expediente los archivados que cumplen `where` (sobre el alias
+    e), por tramos de `lote` con un commit por tramo. Para operaciones
+    masivas, que luego recorren sólo expediente. Devuelve cuántos movió.
+    """
+    movidos = 0
+    while True:
+        with transaccion(buffered=True) as cur:
+            cur.execute(
+                f"SELECT e.id FROM expediente_archivo e WHERE {' AND '.join(where)} LIMIT %s FOR UPDATE",
+                tuple(params) + (lote,),
+            )
+            ids = [f[0] for f in cur.fetchall()]
+            if ids:
+                _mover(cur, ids, "expediente_archivo", "expediente")
+        movidos += len(ids)
+        if len(ids) < lote:
+            return movidos
+
+
+def archivar(dias=ARCHIVO_DIAS, lote=1000, pausa=0.05):
+    """
+    Sube el corte a hoy - `dias` (nunca lo baja) y mueve los Cerrado con
+    fecha anterior, de a `lote` por transacción y con `pausa` segundos entre
+    tramos para no acaparar locks ni I/O. El expediente de id más alto nunca
+    se archiva: así el AUTO_INCREMENT no puede volver a un id archivado.
+    """
+    nuevo = date.today() - timedelta(days=dias)
+    with transaccion(buffered=True) as cur:
+        cur.execute("SELECT corte FROM expediente_archivo_corte WHERE id = 1 FOR UPDATE")
+        actual = cur.fetchone()[0]
+        subir = actual is None or nuevo > actual
+        if subir:
+            cur.execute("UPDATE expediente_archivo_corte SET corte = %s WHERE id = 1", (nuevo,))
+    limite = nuevo if subir else actual
+    if subir:
+        # Los workers recuerdan el corte viejo hasta ARCHIVO_CORTE_TTL (más el
+        # retraso de la réplica): mover antes les haría omitir filas
+        espera = ARCHIVO_CORTE_TTL + DB_REPLICA_RETRASO_SEGUNDOS + 1
+        print(f"Corte: {actual} -> {limite}; esperando {espera:g}s a que lo vean los workers")
+        time.sleep(espera)
+
+    movidos = 0
+    inicio = time.monotonic()
+    while True:
+        with transaccion(buffered=True) as cur:
+            cur.execute("SELECT MAX(id) FROM expediente")
+            maximo = cur.fetchone()[0] or 0
+            # (estado, fecha) indexado: el orden sale del índice, sin filesort
+            cur.execute("""
+                SELECT id FROM expediente
+                WHERE estado = 'Cerrado' AND fecha < %s AND id < %s
+                ORDER BY fecha, id
+                LIMIT %s
+                FOR UPDATE
+            """, (limite, maximo, lote))
+            ids = [f[0] for f in cur.fetchall()]
+            if ids:
+                _mover(cur, ids, "expediente", "expediente_archivo")
+        movidos += len(ids)
+        if ids:
+            print(f"\r{movidos:,} archivados ({movidos / (time.monotonic() - inicio):,.0f}/s)", end="", flush=True)
+        if len(ids) < lote:
+            break
+        time.sleep(pausa)
+    print(f"\nArchivados: {movidos} (corte {limite})")
+
+
+def estado():
+    with cursor(buffered=True) as cur:
+        cur.execute("SELECT corte FROM expediente_archivo_corte WHERE id = 1")
+        print(f"Corte: {cur.fetchone()[0] or '(sin archivar)'}")
+        for tabla in ("expediente", "expediente_archivo"):
+            cur.execute(f"SELECT COUNT(*) FROM {tabla}")
+            print(f"{tabla}: {cur.fetchone()[0]:,} filas")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archivo de expedientes cerrados")
+    parser.add_argument("accion", choices=["archivar", "estado"])
+    parser.add_argument("--dias", type=int, default=ARCHIVO_DIAS, help="antigüedad mínima (por fecha) para archivar")
+    parser.add_argument("--lote", type=int, default=1000, help="filas por transacción")
+    parser.add_argument("--pausa", type=float, default=0.05, help="segundos entre tramos")
+    args = parser.parse_args()
+    if args.accion == "archivar":
+        archivar(args.dias, args.lote, args.pausa)
+    else:
+        estado()
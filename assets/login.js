@@ -0,0 +1,26 @@
+const f = document.getElementById('f');
+const msg = document.getElementById('msg');
+f.addEventListener('submit', async (e) => {
+  e.preventDefault();
+  const payload = {
+    username: f.username.value.trim(),
+    pass: f.pass.value
+  };
+  msg.textContent = 'Validando...';
+  try {
+    const r = await fetch('/login', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify(payload)
+    });
+    const j = await r.json();
+    if (r.ok) {
+      msg.textContent = 'Login correcto. Redirigiendo...';
+      setTimeout(() => { window.location.href = '/ui'; }, 500);
+    } else {
+      msg.textContent = 'Error: ' + (j.error ?? 'Error desconocido');
+    }
+  } catch (err) {
+    msg.textContent = 'Error de red';
+  }
+});
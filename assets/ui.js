@@ -0,0 +1,589 @@
+async function fetchJSON(url, opts = {}) {
+  const r = await fetch(url, opts);
+  const j = await r.json().catch(() => ({}));
+  if (!r.ok) {
+    const err = new Error(j.error ?? ('HTTP ' + r.status));
+    err.status = r.status;
+    err.payload = j;
+    throw err;
+  }
+  return j;
+}
+
+async function me() { return fetchJSON('/me'); }
+
+// id -> nombre de cada catálogo, para armar filas a partir de eventos
+const nombres = { aseguradora: new Map(), usuario: new Map(), juzgado: new Map(), caso: new Map() };
+
+// Carga catálogos para filtros y para paneles admin
+async function cargarCatalogos() {
+  const [ases, usrs, juzgs, casos] = await Promise.all([
+    fetchJSON('/aseguradoras'),
+    fetchJSON('/usuarios'),
+    fetchJSON('/juzgados'),
+    fetchJSON('/casos')
+  ]);
+  nombres.aseguradora = new Map(ases.map(a => [a.id, a.nombre_aseguradora]));
+  nombres.usuario = new Map(usrs.map(u => [u.id, u]));
+  nombres.juzgado = new Map(juzgs.map(j => [j.id, j.nombre_juzgado]));
+  nombres.caso = new Map(casos.map(c => [c.id, c.nombre_caso]));
+
+  // Filtros (con opción "Todos/Todas")
+  const fA = document.getElementById('f_aseguradora_id');
+  const fU = document.getElementById('f_usuario_id');
+  const fJ = document.getElementById('f_juzgado_id');
+  const fC = document.getElementById('f_caso_id');
+
+  fA.innerHTML = '<option value="">Todas</option>' +
+    ases.map(a => `<option value="${a.id}">${a.nombre_aseguradora}</option>`).join('');
+  fU.innerHTML = '<option value="">Todos</option>' +
+    usrs.map(u => `<option value="${u.id}">${u.nombre} ${u.apellido}</option>`).join('');
+  fJ.innerHTML = '<option value="">Todos</option>' +
+    juzgs.map(j => `<option value="${j.id}">${j.nombre_juzgado}</option>`).join('');
+  fC.innerHTML = '<option value="">Todos</option>' +
+    casos.map(c => `<option value="${c.id}">${c.nombre_caso}</option>`).join('');
+
+  // Panel crear/editar (copiamos las opciones)
+  document.getElementById('aseguradora_id').innerHTML =
+    ases.map(a => `<option value="${a.id}">${a.nombre_aseguradora}</option>`).join('');
+  document.getElementById('usuario_id').innerHTML =
+    usrs.map(u => `<option value="${u.id}">${u.nombre} ${u.apellido}</option>`).join('');
+  document.getElementById('juzgado_id').innerHTML =
+    juzgs.map(j => `<option value="${j.id}">${j.nombre_juzgado}</option>`).join('');
+  document.getElementById('caso_id').innerHTML =
+    casos.map(c => `<option value="${c.id}">${c.nombre_caso}</option>`).join('');
+
+  document.getElementById('edit_aseguradora_id').innerHTML = document.getElementById('aseguradora_id').innerHTML;
+  document.getElementById('edit_usuario_id').innerHTML = document.getElementById('usuario_id').innerHTML;
+  document.getElementById('edit_juzgado_id').innerHTML = document.getElementById('juzgado_id').innerHTML;
+  document.getElementById('edit_caso_id').innerHTML = document.getElementById('caso_id').innerHTML;
+}
+
+// Sólo los filtros; paginación y formato los agrega cargarMas()
+function buildQueryFromFilters() {
+  const params = new URLSearchParams();
+
+  const estado = document.getElementById('f_estado').value;
+  const aseguradora_id = document.getElementById('f_aseguradora_id').value;
+  const usuario_id = document.getElementById('f_usuario_id').value;
+  const juzgado_id = document.getElementById('f_juzgado_id').value;
+  const caso_id = document.getElementById('f_caso_id').value;
+  const fecha_desde = document.getElementById('f_fecha_desde').value;
+  const fecha_hasta = document.getElementById('f_fecha_hasta').value;
+  const q = document.getElementById('f_q').value.trim();
+
+  if (estado) params.set('estado', estado);
+  if (aseguradora_id) params.set('aseguradora_id', aseguradora_id);
+  if (usuario_id) params.set('usuario_id', usuario_id);
+  if (juzgado_id) params.set('juzgado_id', juzgado_id);
+  if (caso_id) params.set('caso_id', caso_id);
+  if (fecha_desde) params.set('fecha_desde', fecha_desde);
+  if (fecha_hasta) params.set('fecha_hasta', fecha_hasta);
+  if (q) params.set('q', q);
+
+  return params.toString();
+}
+
+// Índice columna -> posición para respuestas con format=rows
+function indiceColumnas(columns) {
+  const c = {};
+  columns.forEach((nombre, i) => { c[nombre] = i; });
+  return c;
+}
+
+// Fecha como YYYY-MM-DD: los listados la traen en formato HTTP y los eventos en ISO
+function fechaISO(f) {
+  if (!f) return '';
+  if (/^\d{4}-\d{2}-\d{2}/.test(f)) return f.slice(0, 10);
+  const d = new Date(f);
+  return isNaN(d) ? f : d.toISOString().slice(0, 10);
+}
+
+function renderFila(v, c, rol) {
+  const id = v[c.id];
+  const accionesHTML = (rol === 'admin')
+    ? `<div class="actions">
+         <button class="btn btn-edit" data-id="${id}">Editar</button>
+         <button class="btn-danger btn-del" data-id="${id}">Eliminar</button>
+       </div>`
+    : '';
+  const celdaAcciones = (rol === 'admin') ? `<td>${accionesHTML}</td>` : '';
+  return `
+    <tr data-rowid="${id}">
+      <td>${id ?? ''}</td>
+      <td>${v[c.estado] ?? ''}</td>
+      <td>${fechaISO(v[c.fecha])}</td>
+      <td>${v[c.aseguradora] ?? ''}</td>
+      <td>${(v[c.usuario_nombre] ?? '') + ' ' + (v[c.usuario_apellido] ?? '')}</td>
+      <td>${v[c.juzgado] ?? ''}</td>
+      <td>${v[c.caso] ?? ''}</td>
+      ${celdaAcciones}
+    </tr>
+  `;
+}
+
+// -------- Tabla virtualizada con scroll infinito --------
+const PAGINA = 200;        // filas por pedido
+const MARGEN_FILAS = 20;   // filas renderizadas de más arriba y abajo de lo visible
+const CAMPOS_TABLA = 'id,estado,fecha,aseguradora,usuario_nombre,usuario_apellido,juzgado,caso';
+
+const tabla = {
+  rol: null,
+  columnas: null,     // nombres de columnas (format=rows)
+  c: null,            // columna -> posición
+  filas: [],          // filas ya descargadas, en orden (id DESC)
+  total: 0,
+  cursor: null,       // next_cursor de la última página
+  completo: false,    // no hay más páginas
+  cargando: null,     // promesa del pedido en curso
+  consulta: '',       // filtros vigentes
+  version: 0,         // invalida respuestas de filtros anteriores
+  altoFila: 37,       // se mide con la primera fila renderizada
+  rango: null,        // [inicio, fin) renderizado
+  raf: null,
+};
+
+function paramsTabla() {
+  const params = new URLSearchParams(tabla.consulta);
+  params.set('format', 'rows');  // columnas una sola vez + filas como arreglos
+  params.set('fields', CAMPOS_TABLA);
+  return params;
+}
+
+async function cargarExpedientes(rol) {
+  tabla.rol = rol;
+  tabla.consulta = buildQueryFromFilters();
+  tabla.version++;
+  tabla.filas = [];
+  tabla.total = 0;
+  tabla.cursor = null;
+  tabla.completo = false;
+  tabla.cargando = null;
+  document.getElementById('scroller').scrollTop = 0;
+  document.getElementById('tableMsg').textContent = '';
+  renderTabla(true);
+  await cargarMas();
+}
+
+// Pide la página siguiente (por cursor); un solo pedido a la vez
+function cargarMas() {
+  if (tabla.completo) return Promise.resolve();
+  if (tabla.cargando) return tabla.cargando;
+  const version = tabla.version;
+  const params = paramsTabla();
+  params.set('page_size', PAGINA);
+  params.set('cursor', tabla.cursor ?? '');
+  tabla.cargando = (async () => {
+    try {
+      const j = await fetchJSON('/expedientes?' + params.toString());
+      if (version !== tabla.version) return;  // cambiaron los filtros mientras tanto
+      tabla.columnas = j.columns;
+      tabla.c = indiceColumnas(j.columns);
+      tabla.filas.push(...j.data);
+      tabla.total = j.total;
+      tabla.cursor = j.next_cursor;
+      tabla.completo = !j.next_cursor;
+    } catch (e) {
+      if (version !== tabla.version) return;
+      if (e.status === 401) window.location.href = '/login-ui';
+      tabla.completo = true;  // no reintentar en cada scroll; se reintenta al filtrar
+      document.getElementById('tableMsg').textContent =
+        'Error cargando expedientes: ' + (e.payload?.error ?? e.message ?? 'desconocido');
+    } finally {
+      if (version === tabla.version) tabla.cargando = null;
+    }
+    renderTabla(true);
+    pedirSiHaceFalta();
+  })();
+  return tabla.cargando;
+}
+
+// Si lo visible se acerca al final de lo descargado, pide la página siguiente
+function pedirSiHaceFalta() {
+  const scroller = document.getElementById('scroller');
+  const restante = tabla.filas.length * tabla.altoFila - (scroller.scrollTop + scroller.clientHeight);
+  if (restante < scroller.clientHeight * 2) cargarMas();
+}
+
+function espaciador(alto, colspan) {
+  return alto ? `<tr class="espaciador" style="height:${alto}px"><td colspan="${colspan}"></td></tr>` : '';
+}
+
+// Renderiza sólo [inicio, fin): lo visible más MARGEN_FILAS; el resto del
+// alto lo ocupan dos filas espaciadoras
+function renderTabla(forzar = false) {
+  const scroller = document.getElementById('scroller');
+  const tbody = document.querySelector('#tabla tbody');
+  const colspan = (tabla.rol === 'admin') ? 8 : 7; // con columna Caso
+  const n = tabla.filas.length;
+
+  document.getElementById('tableInfo').textContent =
+    n ? `Mostrando ${n} de ${tabla.total}` + (tabla.completo ? '' : ' (desplace para ver más)') : '';
+  if (n === 0) {
+    tabla.rango = null;
+    const texto = tabla.completo ? 'Sin datos' : 'Cargando...';
+    tbody.innerHTML = `<tr><td colspan="${colspan}">${texto}</td></tr>`;
+    return;
+  }
+
+  const visibles = Math.ceil(scroller.clientHeight / tabla.altoFila);
+  const inicio = Math.max(0, Math.floor(scroller.scrollTop / tabla.altoFila) - MARGEN_FILAS);
+  const fin = Math.min(n, inicio + visibles + 2 * MARGEN_FILAS);
+  if (!forzar && tabla.rango && tabla.rango[0] === inicio && tabla.rango[1] === fin) return;
+  tabla.rango = [inicio, fin];
+
+  let html = espaciador(inicio * tabla.altoFila, colspan);
+  for (let i = inicio; i < fin; i++) html += renderFila(tabla.filas[i], tabla.c, tabla.rol);
+  html += espaciador((n - fin) * tabla.altoFila, colspan);
+  tbody.innerHTML = html;
+
+  // Alto real de fila (cambia con la columna de acciones): se ajusta y se re-renderiza
+  const fila = tbody.querySelector('tr[data-rowid]');
+  if (fila && fila.offsetHeight && Math.abs(fila.offsetHeight - tabla.altoFila) > 0.5) {
+    tabla.altoFila = fila.offsetHeight;
+    renderTabla(true);
+  }
+}
+
+function alScroll() {
+  if (tabla.raf) return;
+  tabla.raf = requestAnimationFrame(() => {
+    tabla.raf = null;
+    renderTabla();
+    pedirSiHaceFalta();
+  });
+}
+
+// -------- Actualización local de filas (sin recargar la tabla) --------
+function indiceFila(id) {
+  return tabla.filas.findIndex(v => v[tabla.c.id] == id);
+}
+
+// La fila `id` tal como la lista con los filtros vigentes, o null si no los cumple
+async function filaFiltrada(id) {
+  const params = paramsTabla();
+  params.set('after_id', Number(id) + 1);
+  params.set('page_size', '1');
+  params.set('count', 'none');
+  const j = await fetchJSON('/expedientes?' + params.toString());
+  const v = j.data[0];
+  return (v && v[j.columns.indexOf('id')] == id) ? v : null;
+}
+
+function quitarFila(id) {
+  const i = indiceFila(id);
+  if (i >= 0) {
+    tabla.filas.splice(i, 1);
+    tabla.total--;
+  }
+  renderTabla(true);
+}
+
+// Tras POST/PUT: reemplaza, quita o inserta (en orden id DESC) sólo esa fila
+async function parchearFila(id) {
+  if (!tabla.c) return cargarExpedientes(tabla.rol);
+  aplicarFila(id, await filaFiltrada(id));
+}
+
+// v = fila nueva que cumple los filtros, o null si no está o no los cumple
+function aplicarFila(id, v) {
+  const i = indiceFila(id);
+  if (i >= 0 && v) {
+    tabla.filas[i] = v;
+  } else if (i >= 0) {
+    tabla.filas.splice(i, 1);  // ya no cumple los filtros
+    tabla.total--;
+  } else if (v) {
+    tabla.total++;
+    const pos = tabla.filas.findIndex(f => f[tabla.c.id] < id);
+    if (pos >= 0) tabla.filas.splice(pos, 0, v);
+    else if (tabla.completo) tabla.filas.push(v);
+    // si no, cae después de lo descargado y llega con una página posterior
+  }
+  renderTabla(true);
+}
+
+// -------- Cambios en vivo (SSE) --------
+// true/false si la fila cumple los filtros vigentes; null si no se puede
+// decidir en el cliente (búsqueda q=) y hay que preguntarle al servidor
+function cumpleFiltros(d) {
+  const f = new URLSearchParams(tabla.consulta);
+  if (f.get('q')) return null;
+  if (f.get('estado') && d.estado !== f.get('estado')) return false;
+  for (const campo of ['aseguradora_id', 'usuario_id', 'juzgado_id', 'caso_id']) {
+    if (f.get(campo) && String(d[campo]) !== f.get(campo)) return false;
+  }
+  if (f.get('fecha_desde') && d.fecha < f.get('fecha_desde')) return false;
+  if (f.get('fecha_hasta') && d.fecha > f.get('fecha_hasta')) return false;
+  return true;
+}
+
+// Fila (en el orden de tabla.columnas) a partir de los datos de un cambio;
+// null si falta algún nombre de catálogo (p. ej. un usuario recién creado)
+function filaDesdeCambio(d) {
+  const u = nombres.usuario.get(d.usuario_id);
+  const valores = {
+    id: d.id,
+    estado: d.estado,
+    fecha: d.fecha,
+    aseguradora: nombres.aseguradora.get(d.aseguradora_id),
+    usuario_nombre: u?.nombre,
+    usuario_apellido: u?.apellido,
+    juzgado: nombres.juzgado.get(d.juzgado_id),
+    caso: nombres.caso.get(d.caso_id),
+  };
+  if (Object.values(valores).some(x => x === undefined)) return null;
+  return tabla.columnas.map(n => valores[n]);
+}
+
+function aplicarCambio(cambio) {
+  if (!tabla.c) return;
+  if (cambio.op === 'delete') return quitarFila(cambio.id);
+  const cumple = cumpleFiltros(cambio.data);
+  if (cumple === false) return aplicarFila(cambio.id, null);
+  const v = cumple ? filaDesdeCambio(cambio.data) : null;
+  if (v) return aplicarFila(cambio.id, v);
+  programarRefresco(cambio.id);
+}
+
+// Cambios que el cliente no puede decidir (q= o catálogo sin nombre): sólo
+// importan las filas ya cargadas, y una ráfaga se resuelve con un pedido
+const REFRESCO_ESPERA_MS = 500;
+const refresco = { ids: new Set(), timer: null };
+
+function programarRefresco(id) {
+  if (indiceFila(id) < 0) return;  // no está cargada: la trae la próxima carga
+  refresco.ids.add(Number(id));
+  if (!refresco.timer) refresco.timer = setTimeout(refrescarFilas, REFRESCO_ESPERA_MS);
+}
+
+// Pide de una vez el tramo de la tabla entre el mayor y el menor id pendiente
+// (sin conteo); si el tramo es muy largo, recarga la tabla
+async function refrescarFilas() {
+  refresco.timer = null;
+  const ids = [...refresco.ids].filter(id => indiceFila(id) >= 0);
+  refresco.ids.clear();
+  if (!ids.length) return;
+  const mayor = Math.max(...ids), menor = Math.min(...ids);
+  const tramo = indiceFila(menor) - indiceFila(mayor) + 1;
+  if (tramo > PAGINA) return cargarExpedientes(tabla.rol);
+
+  const version = tabla.version;
+  const params = paramsTabla();
+  params.set('after_id', mayor + 1);
+  params.set('page_size', tramo + ids.length);
+  params.set('count', 'none');
+  let j;
+  try {
+    j = await fetchJSON('/expedientes?' + params.toString());
+  } catch (e) {
+    return;  // el próximo cambio o recarga la corrige
+  }
+  if (version !== tabla.version) return;
+  const iid = j.columns.indexOf('id');
+  const ultimo = j.data.length ? j.data[j.data.length - 1][iid] : null;
+  // El tramo cubre a `menor` si la respuesta no se cortó antes de llegar a él
+  if (j.next_cursor && ultimo > menor) return cargarExpedientes(tabla.rol);
+  const porId = new Map(j.data.map(v => [v[iid], v]));
+  for (const id of ids) aplicarFila(id, porId.get(id) ?? null);
+}
+
+// latest_seq del registro de cambios: desde ahí sigue la suscripción
+async function ultimoSeq() {
+  try {
+    return (await fetchJSON('/expedientes/changes?since=0&limit=1')).latest_seq;
+  } catch (e) {
+    return e.payload?.latest_seq ?? null;  // 410 (since compactado) también lo informa
+  }
+}
+
+const SSE_ESPERA_MIN_MS = 1000;
+const SSE_ESPERA_MAX_MS = 60000;
+
+function suscribirCambios(ultimoId = null, espera = SSE_ESPERA_MIN_MS) {
+  if (!window.EventSource) return;
+  // Tras un corte de red el navegador reconecta solo con Last-Event-ID; si
+  // el servidor responde con error (p. ej. 503 por el tope de clientes) la
+  // fuente queda CLOSED y se reabre acá, con espera creciente y ?since=
+  const url = '/expedientes/events' + (ultimoId != null ? '?since=' + encodeURIComponent(ultimoId) : '');
+  const fuente = new EventSource(url);
+  fuente.addEventListener('open', () => { espera = SSE_ESPERA_MIN_MS; });
+  fuente.addEventListener('cambio', (ev) => {
+    ultimoId = ev.lastEventId || ultimoId;
+    aplicarCambio(JSON.parse(ev.data));
+  });
+  fuente.addEventListener('resync', (ev) => { ultimoId = ev.lastEventId || ultimoId; cargarExpedientes(tabla.rol); });
+  fuente.onerror = () => {
+    if (fuente.readyState !== EventSource.CLOSED) return;
+    const proxima = Math.min(espera * 2, SSE_ESPERA_MAX_MS);
+    setTimeout(() => suscribirCambios(ultimoId, proxima), espera * (0.5 + Math.random() / 2));
+  };
+}
+
+async function abrirEditar(id) {
+  const editPanel = document.getElementById('editPanel');
+  const editMsg = document.getElementById('editMsg');
+  editMsg.textContent = 'Cargando expediente ' + id + '...';
+  try {
+    const exp = await fetchJSON('/expedientes/' + id);
+    document.getElementById('edit_id').value = exp.id;
+    document.getElementById('edit_aseguradora_id').value = exp.aseguradora_id;
+    document.getElementById('edit_usuario_id').value = exp.usuario_id;
+    document.getElementById('edit_juzgado_id').value = exp.juzgado_id;
+    document.getElementById('edit_caso_id').value = exp.caso_id; // <-- NUEVO
+    document.getElementById('edit_estado').value = exp.estado;
+    document.getElementById('edit_fecha').value = fechaISO(exp.fecha);
+    editMsg.textContent = '';
+    editPanel.style.display = 'block';
+    editPanel.scrollIntoView({behavior:'smooth'});
+  } catch (e) {
+    editMsg.textContent = 'Error cargando: ' + (e.payload?.error ?? e.message ?? 'desconocido');
+  }
+}
+
+async function init() {
+  try {
+    const info = await me();
+    if (!info.autenticado) { window.location.href = '/login-ui'; return; }
+    const rol = info.usuario.rol;
+    const userText = `Sesión: ${info.usuario.nombre} ${info.usuario.apellido} (@${info.usuario.username}) [${rol}]`;
+    document.getElementById('user').textContent = userText;
+
+    const adminPanel = document.getElementById('adminPanel');
+    const thAcciones = document.getElementById('th-acciones');
+    if (rol === 'admin') {
+      adminPanel.style.display = 'block';
+      thAcciones.style.display = ''; // visible
+    } else {
+      adminPanel.style.display = 'none';
+      thAcciones.style.display = 'none'; // oculta columna Acciones para usuarios
+    }
+
+    // Cargar catálogos para filtros y paneles
+    await cargarCatalogos();
+
+    // Cargar expedientes con filtros iniciales (vacíos)
+    document.getElementById('scroller').addEventListener('scroll', alScroll);
+    window.addEventListener('resize', alScroll);
+    // latest_seq y suscripción antes de la carga: lo que cambie mientras
+    // tanto llega por SSE y no se pierde
+    suscribirCambios(await ultimoSeq());
+    await cargarExpedientes(rol);
+
+    // Eventos: filtro, limpiar, editar/eliminar
+    document.getElementById('btnFiltrar').addEventListener('click', async () => {
+      await cargarExpedientes(rol);
+    });
+
+    // Enter en el buscador aplica los filtros
+    document.getElementById('f_q').addEventListener('keydown', async (ev) => {
+      if (ev.key !== 'Enter') return;
+      ev.preventDefault();
+      await cargarExpedientes(rol);
+    });
+
+    document.getElementById('btnLimpiar').addEventListener('click', async () => {
+      document.getElementById('f_q').value = '';
+      document.getElementById('f_estado').value = '';
+      document.getElementById('f_aseguradora_id').value = '';
+      document.getElementById('f_usuario_id').value = '';
+      document.getElementById('f_juzgado_id').value = '';
+      document.getElementById('f_caso_id').value = '';
+      document.getElementById('f_fecha_desde').value = '';
+      document.getElementById('f_fecha_hasta').value = '';
+      await cargarExpedientes(rol);
+    });
+
+    // Acciones admin en tabla
+    document.addEventListener('click', async (ev) => {
+      if (ev.target.classList.contains('btn-edit')) {
+        const id = ev.target.getAttribute('data-id');
+        await abrirEditar(id);
+      }
+      if (ev.target.classList.contains('btn-del')) {
+        const id = ev.target.getAttribute('data-id');
+        if (!confirm('¿Eliminar expediente ' + id + '?')) return;
+        const tableMsg = document.getElementById('tableMsg');
+        tableMsg.textContent = 'Eliminando...';
+        try {
+          await fetchJSON('/expedientes/' + id, { method: 'DELETE' });
+          tableMsg.textContent = 'Eliminado';
+          quitarFila(id);
+        } catch (e) {
+          tableMsg.textContent = 'Error: ' + (e.payload?.error ?? e.message ?? 'desconocido');
+        }
+      }
+    });
+  } catch (e) {
+    window.location.href = '/login-ui';
+  }
+}
+
+// Crear expediente
+document.getElementById('formNuevo').addEventListener('submit', async (e) => {
+  e.preventDefault();
+  const adminMsg = document.getElementById('adminMsg');
+  adminMsg.textContent = 'Creando...';
+  const payload = {
+    aseguradora_id: parseInt(document.getElementById('aseguradora_id').value),
+    usuario_id: parseInt(document.getElementById('usuario_id').value),
+    juzgado_id: parseInt(document.getElementById('juzgado_id').value),
+    caso_id: parseInt(document.getElementById('caso_id').value),   // <-- NUEVO
+    estado: document.getElementById('estado').value,
+    fecha: document.getElementById('fecha').value
+  };
+  try {
+    const j = await fetchJSON('/expedientes', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify(payload)
+    });
+    adminMsg.textContent = 'Creado: ID ' + j.id;
+    await parchearFila(j.id);
+  } catch (e) {
+    adminMsg.textContent = 'Error: ' + (e.payload?.error ?? e.message ?? 'desconocido');
+  }
+});
+
+// Guardar edición (PUT)
+document.getElementById('formEdit').addEventListener('submit', async (e) => {
+  e.preventDefault();
+  const editMsg = document.getElementById('editMsg');
+  editMsg.textContent = 'Guardando cambios...';
+  const id = document.getElementById('edit_id').value;
+  const payload = {
+    aseguradora_id: parseInt(document.getElementById('edit_aseguradora_id').value),
+    usuario_id: parseInt(document.getElementById('edit_usuario_id').value),
+    juzgado_id: parseInt(document.getElementById('edit_juzgado_id').value),
+    caso_id: parseInt(document.getElementById('edit_caso_id').value),   // <-- NUEVO
+    estado: document.getElementById('edit_estado').value,
+    fecha: document.getElementById('edit_fecha').value
+  };
+  try {
+    await fetchJSON('/expedientes/' + id, {
+      method: 'PUT',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify(payload)
+    });
+    editMsg.textContent = 'Cambios guardados';
+    document.getElementById('editPanel').style.display = 'none';
+    await parchearFila(id);
+  } catch (e) {
+    editMsg.textContent = 'Error: ' + (e.payload?.error ?? e.message ?? 'desconocido');
+  }
+});
+
+// Cancelar edición
+document.getElementById('cancelEdit').addEventListener('click', () => {
+  document.getElementById('editPanel').style.display = 'none';
+  document.getElementById('editMsg').textContent = '';
+});
+
+// Logout
+document.getElementById('logout').addEventListener('click', async () => {
+  try { await fetchJSON('/logout', {method:'POST'}); } catch {}
+  window.location.href = '/login-ui';
+});
+
+// Arranque
+init();
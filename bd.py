@@ -0,0 +1,141 @@
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context, has_request_context, request, session
+import conexion
+from conexion import getConexion, getConexionReplica
+
+
+def get_db():
+    """
+    Conexión del request actual: se toma del pool la primera vez que se
+    pide y se devuelve en el teardown, así un request usa como máximo una.
+    """
+    if "db" not in g:
+        g.db = getConexion()
+    return g.db
+
+
+def lee_de_replica():
+    """
+    True si las lecturas de este request van a la réplica: hay réplica, es
+    un GET/HEAD y la sesión no escribió en los últimos
+    DB_REPLICA_RETRASO_SEGUNDOS (así lee lo que acaba de escribir).
+    """
+    return (
+        conexion.pool_lectura is not None
+        and has_request_context()
+        and request.method in ("GET", "HEAD")
+        and session.get("primario_hasta", 0) < time.time()
+    )
+
+
+def get_db_lectura():
+    """
+    Conexión para sólo lectura: la de la réplica si corresponde (ver
+    lee_de_replica) y está disponible, si no la misma de get_db(). Se decide
+    una sola vez por request y se devuelve en el teardown.
+    """
+    if "en_replica" not in g:
+        g.en_replica = False
+        if lee_de_replica():
+            conn = getConexionReplica()
+            if conn is not None:
+                g.db_lectura, g.en_replica = conn, True
+    return g.db_lectura if g.en_replica else get_db()
+
+
+def en_replica():
+    """True si este request ya leyó de la réplica (sus datos pueden venir atrasados)."""
+    return has_app_context() and g.get("en_replica", False)
+
+
+def cerrar_db(exc=None):
+    """Teardown: devuelve las conexiones del request al pool (si se tomaron)."""
+    for nombre in ("db", "db_lectura"):
+        conn = g.pop(nombre, None)
+        if conn is not None:
+            conn.close()
+
+
+METODOS_ESCRITURA = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def marcar_escritura(resp):
+    """
+    Tras un request de escritura la sesión lee del primario hasta que la
+    réplica la alcance. Se decide por el método y no por los commits: en las
+    respuestas en streaming (POST /expedientes/bulk) los commits ocurren
+    después de este hook, cuando la cookie ya se envió.
+    """
+    if request.method in METODOS_ESCRITURA and conexion.pool_lectura is not None:
+        session["primario_hasta"] = time.time() + conexion.DB_REPLICA_RETRASO_SEGUNDOS
+    if "en_replica" in g and conexion.pool_lectura is not None:
+        resp.headers["X-DB-Lectura"] = "replica" if g.get("en_replica") else "primario"
+    return resp
+
+
+def init_app(app):
+    app.after_request(marcar_escritura)
+    app.teardown_appcontext(cerrar_db)
+
+
+@contextmanager
+def _conexion(lectura=False):
+    # Dentro de un request se reutiliza la conexión de g; fuera (scripts,
+    # arranque) se toma una del primario sólo para este bloque.
+    if has_app_context():
+        yield get_db_lectura() if lectura else get_db()
+        return
+    conn = getConexion()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def cursor(**kwargs):
+    """
+    Cursor de lectura sobre la conexión del request (la réplica en los GET,
+    ver get_db_lectura); se cierra al salir del bloque.
+    """
+    with _conexion(lectura=True) as conn:
+        cur = conn.cursor(**kwargs)
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+
+@contextmanager
+def lectura_primario(**kwargs):
+    """
+    Cursor de lectura sobre el primario (para leer lo recién confirmado, sin
+    el retraso de la réplica). Al salir termina la transacción, así la
+    próxima lectura no reutiliza la misma instantánea.
+    """
+    with _conexion() as conn:
+        cur = conn.cursor(**kwargs)
+        try:
+            yield cur
+        finally:
+            cur.close()
+            conn.rollback()
+
+
+@contextmanager
+def transaccion(**kwargs):
+    """
+    Igual que cursor(), pero siempre sobre el primario; confirma al salir del
+    bloque y hace rollback si se produce una excepción (que se vuelve a lanzar).
+    """
+    with _conexion() as conn:
+        cur = conn.cursor(**kwargs)
+        try:
+            yield cur
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
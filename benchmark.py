@@ -0,0 +1,271 @@
+"""
+Benchmark de latencia por endpoint.
+
+Ejecuta cada escenario a varios niveles de concurrencia, en proceso con el
+test client de Flask o contra un servidor ya levantado (--url), y guarda
+p50/p95/p99 y throughput en JSON junto con el commit actual.
+
+    python benchmark.py --concurrencia 1,4,16 --duracion 10 --salida bench.json
+    python benchmark.py --url http://127.0.0.1:5000 --escenarios listar,obtener
+    python benchmark.py --salida nuevo.json --comparar bench.json
+"""
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from http.cookiejar import CookieJar
+from collections import defaultdict
+from datetime import datetime, timezone
+
+
+# -------------------- Clientes --------------------
+class ClienteFlask:
+    """Test client de Flask (en proceso, sin red)."""
+
+    def __init__(self):
+        from app import app
+        self.client = app.test_client()
+
+    def request(self, metodo, ruta, payload=None):
+        r = self.client.open(ruta, method=metodo, json=payload)
+        return r.status_code, r.get_data()
+
+
+class ClienteHTTP:
+    """HTTP contra un servidor levantado; mantiene la cookie de sesión."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, metodo, ruta, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.url + ruta, data=data, method=metodo,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with self.opener.open(req) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def nuevo_cliente(args):
+    cliente = ClienteHTTP(args.url) if args.url else ClienteFlask()
+    status, body = cliente.request("POST", "/login", {"username": args.usuario, "pass": args.password})
+    if status != 200:
+        sys.exit(f"Login falló ({status}): {body[:200]!r}")
+    return cliente
+
+
+# -------------------- Escenarios --------------------
+# Cada escenario hace una iteración y devuelve [(operación, segundos, status)].
+def medir(cliente, nombre, metodo, ruta, payload=None):
+    inicio = time.perf_counter()
+    status, body = cliente.request(metodo, ruta, payload)
+    return nombre, time.perf_counter() - inicio, status, body
+
+
+def esc_listar(cliente, ctx):
+    return [medir(cliente, "listar", "GET", "/expedientes?page=1&page_size=100")[:3]]
+
+
+def esc_listar_filtrado(cliente, ctx):
+    estado = ctx["rnd"].choice(["Pendiente", "En Curso", "Cerrado"])
+    aseg = ctx["rnd"].choice(ctx["aseguradoras"])
+    ruta = f"/expedientes?page=1&page_size=100&estado={estado.replace(' ', '+')}&aseguradora_id={aseg}"
+    return [medir(cliente, "listar_filtrado", "GET", ruta)[:3]]
+
+
+def esc_listar_profundo(cliente, ctx):
+    pagina = ctx["rnd"].randint(1, max(1, ctx["max_id"] // 100))
+    return [medir(cliente, "listar_profundo", "GET", f"/expedientes?page={pagina}&page_size=100")[:3]]
+
+
+def esc_listar_cursor(cliente, ctx):
+    after = ctx["rnd"].randint(1, ctx["max_id"] + 1)
+    return [medir(cliente, "listar_cursor", "GET", f"/expedientes?after_id={after}&page_size=100")[:3]]
+
+
+def esc_obtener(cliente, ctx):
+    e_id = ctx["rnd"].randint(1, ctx["max_id"])
+    return [medir(cliente, "obtener", "GET", f"/expedientes/{e_id}")[:3]]
+
+
+def esc_catalogos(cliente, ctx):
+    return [medir(cliente, "catalogo_" + r.strip("/"), "GET", r)[:3]
+            for r in ("/aseguradoras", "/usuarios", "/juzgados", "/casos")]
+
+
+def esc_crud(cliente, ctx):
+    rnd = ctx["rnd"]
+    payload = {
+        "aseguradora_id": rnd.choice(ctx["aseguradoras"]),
+        "usuario_id": rnd.choice(ctx["usuarios"]),
+        "juzgado_id": rnd.choice(ctx["juzgados"]),
+        "caso_id": rnd.choice(ctx["casos"]),
+        "estado": "Pendiente",
+        "fecha": "2020-01-01",
+    }
+    nombre, t, status, body = medir(cliente, "crear", "POST", "/expedientes", payload)
+    resultados = [(nombre, t, status)]
+    if status == 201:
+        e_id = json.loads(body)["id"]
+        resultados.append(medir(cliente, "actualizar", "PUT", f"/expedientes/{e_id}", {"estado": "Cerrado"})[:3])
+        resultados.append(medir(cliente, "eliminar", "DELETE", f"/expedientes/{e_id}")[:3])
+    return resultados
+
+
+ESCENARIOS = {
+    "listar": esc_listar,
+    "listar_filtrado": esc_listar_filtrado,
+    "listar_profundo": esc_listar_profundo,
+    "listar_cursor": esc_listar_cursor,
+    "obtener": esc_obtener,
+    "catalogos": esc_catalogos,
+    "crud": esc_crud,  # escribe: crea, modifica y borra sus propios expedientes
+}
+
+
+def contexto(cliente):
+    """Ids de catálogos y id máximo, para armar peticiones realistas."""
+    ctx = {}
+    for clave, ruta in (("aseguradoras", "/aseguradoras"), ("usuarios", "/usuarios"),
+                        ("juzgados", "/juzgados"), ("casos", "/casos")):
+        ctx[clave] = [r["id"] for r in json.loads(cliente.request("GET", ruta)[1])]
+    data = json.loads(cliente.request("GET", "/expedientes?page=1&page_size=1")[1])["data"]
+    ctx["max_id"] = data[0]["id"] if data else 1
+    return ctx
+
+
+# -------------------- Ejecución y reporte --------------------
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    # nearest-rank
+    k = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[k]
+
+
+def ejecutar(args, escenario, concurrencia, ctx_base):
+    latencias = defaultdict(list)
+    errores = defaultdict(int)
+    lock = threading.Lock()
+    clientes = [nuevo_cliente(args) for _ in range(concurrencia)]
+    barrera = threading.Barrier(concurrencia + 1)
+    fin = [0.0]
+
+    def trabajador(i):
+        ctx = dict(ctx_base, rnd=random.Random(args.semilla + i))
+        local_lat, local_err = defaultdict(list), defaultdict(int)
+        barrera.wait()
+        while time.perf_counter() < fin[0]:
+            for op, t, status in ESCENARIOS[escenario](clientes[i], ctx):
+                local_lat[op].append(t)
+                if status >= 500 or (status >= 400 and status != 404):
+                    local_err[op] += 1
+        with lock:
+            for op, ts in local_lat.items():
+                latencias[op].extend(ts)
+            for op, n in local_err.items():
+                errores[op] += n
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrencia)]
+    for h in hilos:
+        h.start()
+    inicio = time.perf_counter()
+    fin[0] = inicio + args.duracion
+    barrera.wait()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+
+    resultados = []
+    for op, ts in sorted(latencias.items()):
+        ts.sort()
+        resultados.append({
+            "escenario": escenario,
+            "operacion": op,
+            "concurrencia": concurrencia,
+            "n": len(ts),
+            "errores": errores[op],
+            "p50_ms": round(percentil(ts, 50) * 1000, 3),
+            "p95_ms": round(percentil(ts, 95) * 1000, 3),
+            "p99_ms": round(percentil(ts, 99) * 1000, 3),
+            "media_ms": round(sum(ts) / len(ts) * 1000, 3),
+            "rps": round(len(ts) / duracion, 2),
+        })
+    return resultados
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def comparar(actual, base):
+    """Imprime la variación de p95 y rps respecto de un resultado anterior."""
+    clave = lambda r: (r["escenario"], r["operacion"], r["concurrencia"])
+    previos = {clave(r): r for r in base["resultados"]}
+    print(f"\nComparación contra {base.get('commit')}:")
+    for r in actual["resultados"]:
+        p = previos.get(clave(r))
+        if not p:
+            continue
+        dp95 = (r["p95_ms"] - p["p95_ms"]) / p["p95_ms"] * 100 if p["p95_ms"] else 0
+        drps = (r["rps"] - p["rps"]) / p["rps"] * 100 if p["rps"] else 0
+        print(f"  {r['operacion']:18} c={r['concurrencia']:<3} p95 {dp95:+6.1f}%  rps {drps:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de endpoints de expedientes")
+    parser.add_argument("--url", help="servidor a medir (por defecto: test client en proceso)")
+    parser.add_argument("--escenarios", default="listar,listar_filtrado,listar_profundo,listar_cursor,obtener,catalogos",
+                        help=f"separados por coma: {','.join(ESCENARIOS)}")
+    parser.add_argument("--concurrencia", default="1,4,16", help="niveles separados por coma")
+    parser.add_argument("--duracion", type=float, default=10, help="segundos por escenario y nivel")
+    parser.add_argument("--usuario", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    desconocidos = [e for e in escenarios if e not in ESCENARIOS]
+    if desconocidos:
+        sys.exit(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+    niveles = [int(c) for c in args.concurrencia.split(",")]
+
+    ctx = contexto(nuevo_cliente(args))
+    salida = {
+        "commit": commit_actual(),
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "modo": args.url or "test_client",
+        "duracion_s": args.duracion,
+        "resultados": [],
+    }
+    for escenario in escenarios:
+        for c in niveles:
+            for r in ejecutar(args, escenario, c, ctx):
+                salida["resultados"].append(r)
+                print(f"{r['operacion']:18} c={c:<3} n={r['n']:<7} p50={r['p50_ms']:8.2f}ms "
+                      f"p95={r['p95_ms']:8.2f}ms p99={r['p99_ms']:8.2f}ms rps={r['rps']:9.1f} err={r['errores']}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(salida, f, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(salida, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+import bd
+from conexion import DB_REPLICA_RETRASO_SEGUNDOS
+
+EXPEDIENTES_CACHE_SIZE = int(os.getenv("EXPEDIENTES_CACHE_SIZE", "256"))  # 0 = desactivada
+CONTEOS_CACHE_SIZE = int(os.getenv("CONTEOS_CACHE_SIZE", "1024"))
+CONTEOS_TTL = float(os.getenv("CONTEOS_TTL", "300"))  # segundos que un total viejo sirve de estimación
+
+
+class Generacion:
+    """
+    Contador de generación para invalidar cachés. Es local al proceso hasta
+    que se llama a compartir() (en el master, antes del fork): desde ahí
+    vive en memoria compartida y una escritura en cualquier worker invalida
+    las cachés de todos. También recuerda cuándo cambió por última vez.
+    """
+
+    def __init__(self):
+        self._local = 0
+        self._local_en = 0.0
+        self._compartida = None
+        self._compartida_en = None
+
+    def compartir(self):
+        if self._compartida is None:
+            self._compartida = multiprocessing.Value("Q", self._local)
+            self._compartida_en = multiprocessing.Value("d", self._local_en, lock=False)  # se escribe con el lock de _compartida
+
+    @property
+    def valor(self):
+        if self._compartida is None:
+            return self._local
+        return self._compartida.value
+
+    def incrementar(self):
+        if self._compartida is None:
+            self._local += 1
+            self._local_en = time.time()
+            return
+        with self._compartida.get_lock():
+            self._compartida.value += 1
+            self._compartida_en.value = time.time()
+
+    def cambio_reciente(self, segundos):
+        """True si hubo un incremento en los últimos `segundos` (en cualquier worker)."""
+        en = self._local_en if self._compartida_en is None else self._compartida_en.value
+        return time.time() - en < segundos
+
+
+class CacheResultados:
+    """
+    Caché LRU (por proceso) de respuestas ya serializadas, invalidada por
+    generación: cada escritura incrementa `generacion` y las entradas de
+    generaciones anteriores dejan de servirse (el LRU las descarta).
+
+    La generación se lee ANTES de consultar y se incrementa DESPUÉS del
+    commit, así un resultado calculado con datos viejos nunca queda guardado
+    bajo la generación vigente.
+
+    Cada entrada es {"body": bytes, "gzip": bytes | None}; la versión gzip
+    la completa quien responde, la primera vez que un cliente la acepta.
+
+    Lo leído de la réplica poco después de una escritura puede no incluirla:
+    eso no se guarda (se respondería atrasado hasta la próxima escritura).
+    """
+
+    def __init__(self, size=EXPEDIENTES_CACHE_SIZE):
+        self.size = size
+        self._generacion = Generacion()
+        self._vista = 0  # última generación con la que se llenó _entradas
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generacion(self):
+        return self._generacion.valor
+
+    def compartir(self):
+        self._generacion.compartir()
+
+    def _descartar_viejas(self, generacion):
+        # Otro worker escribió: lo guardado con generaciones anteriores ya no sirve
+        if generacion != self._vista:
+            self._entradas.clear()
+            self._vista = generacion
+
+    def get(self, clave):
+        if not self.size:
+            return None
+        generacion = self.generacion
+        with self._lock:
+            self._descartar_viejas(generacion)
+            entrada = self._entradas.get((generacion, clave))
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end((generacion, clave))
+            self.hits += 1
+            return entrada
+
+    def guardar(self, clave, generacion, body):
+        """Guarda `body` y devuelve la entrada (aunque no se haya guardado)."""
+        entrada = {"body": body, "gzip": None}
+        if not self.size:
+            return entrada
+        with self._lock:
+            if generacion != self.generacion:
+                return entrada  # hubo una escritura mientras se consultaba
+            if bd.en_replica() and self._generacion.cambio_reciente(DB_REPLICA_RETRASO_SEGUNDOS):
+                return entrada  # la réplica puede no tener todavía la última escritura
+            self._descartar_viejas(generacion)
+            self._entradas[(generacion, clave)] = entrada
+            self._entradas.move_to_end((generacion, clave))
+            while len(self._entradas) > self.size:
+                self._entradas.popitem(last=False)
+        return entrada
+
+    def invalidar(self):
+        with self._lock:
+            self._generacion.incrementar()
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": self.size,
+                "entradas": len(self._entradas),
+                "generacion": self.generacion,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+class CacheConteos:
+    """
+    Totales de listar_expedientes por filtros (LRU, por proceso), con la
+    generación de `resultados` en que se contaron. A diferencia de
+    CacheResultados conserva los de generaciones anteriores: con la
+    generación vigente el total es exacto y sirve para cualquier página; si
+    no, hasta CONTEOS_TTL segundos sirve como estimación (count=estimated).
+    """
+
+    def __init__(self, resultados, size=CONTEOS_CACHE_SIZE, ttl=CONTEOS_TTL):
+        self.resultados = resultados
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> (total, generacion, contado_en)
+
+    def get(self, clave, exacto=True):
+        """(total, es_estimacion) o None. exacto=True sólo acepta la generación vigente."""
+        generacion = self.resultados.generacion
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            total, contado_gen, contado_en = entrada
+            vigente = contado_gen == generacion
+            if not vigente and (exacto or time.monotonic() - contado_en >= self.ttl):
+                return None
+            self._entradas.move_to_end(clave)
+            return total, not vigente
+
+    def guardar(self, clave, generacion, total):
+        if not self.size:
+            return
+        if bd.en_replica() and self.resultados._generacion.cambio_reciente(DB_REPLICA_RETRASO_SEGUNDOS):
+            return  # mismo criterio que CacheResultados.guardar
+        with self._lock:
+            self._entradas[clave] = (total, generacion, time.monotonic())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.size:
+                self._entradas.popitem(last=False)
+
+
+cache_expedientes = CacheResultados()
+cache_conteos = CacheConteos(cache_expedientes)
@@ -0,0 +1,135 @@
+"""
+Registro de cambios de expediente (tablas expediente_cambio y
+expediente_secuencia, migración 004) para GET /expedientes/changes.
+
+Las rutas de escritura llaman a registrar() con el cursor de su transacción,
+como último paso antes del commit. Este script compacta el registro:
+
+    python cambios.py compactar              # quita cambios reemplazados por otros más nuevos
+    python cambios.py compactar --dias 30    # además borra los de más de 30 días
+"""
+import json
+import argparse
+from datetime import date, datetime
+from bd import transaccion, cursor
+
+OPERACIONES = {"I": "insert", "U": "update", "D": "delete"}
+
+
+def _json(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} no serializable")
+
+
+def registrar(cur, cambios):
+    """
+    Agrega [(op, expediente_id, datos | None)] al registro. Reserva los seq
+    con la fila de expediente_secuencia, cuyo lock se mantiene hasta el
+    commit: llamarlo al final de la transacción para retenerlo lo mínimo.
+    Devuelve el último seq asignado.
+    """
+    if not cambios:
+        return None
+    cur.execute("UPDATE expediente_secuencia SET seq = LAST_INSERT_ID(seq + %s) WHERE id = 1", (len(cambios),))
+    cur.execute("SELECT LAST_INSERT_ID()")
+    ultimo = cur.fetchall()[0][0]
+    primero = ultimo - len(cambios) + 1
+    marcas = ", ".join(["(%s, %s, %s, %s)"] * len(cambios))
+    cur.execute(
+        f"INSERT INTO expediente_cambio (seq, op, expediente_id, datos) VALUES {marcas}",
+        tuple(
+            v
+            for n, (op, e_id, datos) in enumerate(cambios)
+            for v in (primero + n, op, e_id, None if datos is None else json.dumps(datos, default=_json))
+        ),
+    )
+    return ultimo
+
+
+def omitir(cur):
+    """
+    Para cargas que no pasan por registrar() (generar_datos.py): avanza seq
+    y lo marca como compactado, así un cliente con un since anterior recibe
+    410/resync y recarga desde /expedientes en vez de no ver esas filas.
+    """
+    # Las asignaciones de un UPDATE se aplican en orden: compactado_hasta toma el seq nuevo
+    cur.execute("UPDATE expediente_secuencia SET seq = seq + 1, compactado_hasta = seq WHERE id = 1")
+
+
+def leer(cur, since, limit):
+    """
+    Cambios con seq > since, en orden, como dicts. Devuelve
+    (cambios, compactado_hasta, ultimo_seq).
+    """
+    cur.execute("SELECT seq, compactado_hasta FROM expediente_secuencia WHERE id = 1")
+    ultimo_seq, compactado_hasta = cur.fetchone()
+    cur.execute(
+        "SELECT seq, op, expediente_id, datos FROM expediente_cambio WHERE seq > %s ORDER BY seq LIMIT %s",
+        (since, limit),
+    )
+    cambios = [
+        {
+            "seq": seq,
+            "op": OPERACIONES[op],
+            "id": e_id,
+            "data": json.loads(datos) if datos is not None else None,
+        }
+        for seq, op, e_id, datos in cur.fetchall()
+    ]
+    return cambios, compactado_hasta, ultimo_seq
+
+
+def compactar(dias=None, lote=10000):
+    """
+    1) Borra los cambios que tienen otro más nuevo del mismo expediente: un
+       cliente que lee desde cualquier seq igual recibe el estado final.
+    2) Con `dias`, borra los cambios más viejos que eso y avanza
+       compactado_hasta; los clientes con since anterior deben resincronizar.
+    Trabaja por tramos de `lote` seq, un commit por tramo.
+    """
+    with cursor(buffered=True) as cur:
+        cur.execute("SELECT MIN(seq), MAX(seq) FROM expediente_cambio")
+        minimo, maximo = cur.fetchone()
+    reemplazados = 0
+    if minimo is not None:
+        for desde in range(minimo, maximo + 1, lote):
+            with transaccion() as cur:
+                cur.execute("""
+                    DELETE c FROM expediente_cambio c
+                    JOIN expediente_cambio n ON n.expediente_id = c.expediente_id AND n.seq > c.seq
+                    WHERE c.seq BETWEEN %s AND %s
+                """, (desde, desde + lote - 1))
+                reemplazados += cur.rowcount
+    print(f"Cambios reemplazados borrados: {reemplazados}")
+
+    if dias is None:
+        return
+    vencidos = 0
+    while True:
+        with transaccion(buffered=True) as cur:
+            cur.execute(
+                "SELECT MAX(seq) FROM (SELECT seq FROM expediente_cambio "
+                "WHERE creado < NOW(3) - INTERVAL %s DAY ORDER BY seq LIMIT %s) t",
+                (dias, lote),
+            )
+            hasta = cur.fetchone()[0]
+            if hasta is None:
+                break
+            # seq se confirma en orden: lo anterior a `hasta` también está vencido
+            cur.execute("DELETE FROM expediente_cambio WHERE seq <= %s", (hasta,))
+            vencidos += cur.rowcount
+            cur.execute(
+                "UPDATE expediente_secuencia SET compactado_hasta = GREATEST(compactado_hasta, %s) WHERE id = 1",
+                (hasta,),
+            )
+    print(f"Cambios de más de {dias} días borrados: {vencidos}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de expediente_cambio")
+    parser.add_argument("accion", choices=["compactar"])
+    parser.add_argument("--dias", type=int, help="retención: borra cambios más viejos que esto")
+    parser.add_argument("--lote", type=int, default=10000, help="seq por transacción")
+    args = parser.parse_args()
+    compactar(args.dias, args.lote)
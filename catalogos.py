@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from bisect import bisect_left
+import bd
+from bd import cursor
+from conexion import DB_REPLICA_RETRASO_SEGUNDOS
+from formatos import FORMATOS_LISTA, formatear_filas
+from cache_resultados import Generacion
+from compresion import comprimir
+
+# Consultas de cada catálogo (mismas columnas que devolvían los endpoints)
+CATALOGOS = {
+    "aseguradora": "SELECT id, nombre_aseguradora FROM aseguradora ORDER BY id ASC",
+    "juzgado": "SELECT id, nombre_juzgado FROM juzgado ORDER BY id ASC",
+    "caso": "SELECT id, nombre_caso FROM caso ORDER BY id ASC",
+    # sin 'pass'
+    "usuario": "SELECT id, nombre, apellido, username FROM usuario ORDER BY id ASC",
+}
+
+# Columnas de texto que entran al índice de búsqueda (?q=) de cada catálogo
+TEXTO_CATALOGOS = {
+    "aseguradora": ("nombre_aseguradora",),
+    "juzgado": ("nombre_juzgado",),
+    "caso": ("nombre_caso",),
+    "usuario": ("nombre", "apellido", "username"),
+}
+
+CATALOGO_TTL = int(os.getenv("CATALOGO_TTL", "300"))  # segundos
+
+
+def tokens(texto):
+    """Palabras en minúscula y sin acentos: 'Pérez-Gómez' -> ['perez', 'gomez']."""
+    sin_acentos = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode()
+    return re.findall(r"[a-z0-9]+", sin_acentos.lower())
+
+
+class CatalogoCache:
+    """
+    Caché en memoria (por proceso) de las tablas de catálogo.
+    Cada entrada guarda las filas, el JSON ya serializado en cada formato
+    (objects/rows/columns) con su versión gzip y su ETag fuerte, y el
+    conjunto de ids para validar FKs sin ir a la base. También un índice
+    de prefijos (lista ordenada de (palabra, id)) para la búsqueda ?q=.
+
+    Con varios workers, invalidar() en uno incrementa la generación
+    compartida y los demás recargan sus entradas en la próxima lectura.
+    """
+
+    def __init__(self, ttl=CATALOGO_TTL):
+        self.ttl = ttl
+        self._generacion = Generacion()
+        self._entradas = {}
+        self._locks = {nombre: threading.Lock() for nombre in CATALOGOS}
+
+    def compartir(self):
+        self._generacion.compartir()
+
+    def _cargar(self, nombre):
+        generacion = self._generacion.valor
+        with cursor(buffered=True) as cur:
+            cur.execute(CATALOGOS[nombre])
+            columnas, filas = cur.column_names, cur.fetchall()
+        data = [dict(zip(columnas, f)) for f in filas]
+        bodies, gzips, etags = {}, {}, {}
+        for formato in FORMATOS_LISTA:
+            # objects conserva la forma original: un arreglo de objetos
+            contenido = data if formato == "objects" else formatear_filas(columnas, filas, formato)
+            bodies[formato] = json.dumps(contenido, separators=(",", ":")).encode()
+            gzips[formato] = comprimir(bodies[formato])
+            etags[formato] = hashlib.sha256(bodies[formato]).hexdigest()
+        cargado = time.monotonic()
+        if bd.en_replica() and self._generacion.cambio_reciente(DB_REPLICA_RETRASO_SEGUNDOS):
+            # Leído de la réplica justo después de un cambio: puede estar
+            # atrasado, así que vence apenas pasa el retraso tolerado
+            cargado -= max(0.0, self.ttl - DB_REPLICA_RETRASO_SEGUNDOS)
+        return {
+            "data": data,
+            "bodies": bodies,
+            "gzips": gzips,
+            "etags": etags,
+            "ids": frozenset(row["id"] for row in data),
+            "palabras": sorted({
+                (palabra, row["id"])
+                for row in data
+                for columna in TEXTO_CATALOGOS[nombre]
+                for palabra in tokens(row[columna])
+            }),
+            "cargado": cargado,
+            "generacion": generacion,
+        }
+
+    def _vigente(self, entrada):
+        return (
+            entrada is not None
+            and time.monotonic() - entrada["cargado"] < self.ttl
+            and entrada["generacion"] == self._generacion.valor
+        )
+
+    def get(self, nombre):
+        entrada = self._entradas.get(nombre)
+        if self._vigente(entrada):
+            return entrada
+        # Un solo hilo recarga; el resto espera y reutiliza el resultado
+        with self._locks[nombre]:
+            entrada = self._entradas.get(nombre)
+            if not self._vigente(entrada):
+                entrada = self._cargar(nombre)
+                self._entradas[nombre] = entrada
+            return entrada
+
+    def ids_cacheados(self, nombre):
+        """
+        Ids del catálogo si la entrada está vigente; no recarga ni toma
+        conexión (None si no hay entrada vigente).
+        """
+        entrada = self._entradas.get(nombre)
+        return entrada["ids"] if self._vigente(entrada) else None
+
+    def buscar(self, nombre, prefijo):
+        """Ids del catálogo con alguna palabra que empieza por `prefijo` (ya normalizado)."""
+        palabras = self.get(nombre)["palabras"]
+        ids = set()
+        i = bisect_left(palabras, (prefijo,))
+        while i < len(palabras) and palabras[i][0].startswith(prefijo):
+            ids.add(palabras[i][1])
+            i += 1
+        return ids
+
+    def invalidar(self, nombre=None):
+        self._generacion.incrementar()
+        if nombre is None:
+            self._entradas.clear()
+        else:
+            self._entradas.pop(nombre, None)
+
+
+catalogo_cache = CatalogoCache()
@@ -0,0 +1,66 @@
+"""
+Compresión gzip de respuestas, negociada con Accept-Encoding.
+
+init_app() registra un after_request que comprime las respuestas de texto
+(JSON, HTML, CSS, JS) de al menos GZIP_MIN_BYTES. Las respuestas en streaming
+no se tocan. Las que ya traen Content-Encoding tampoco, porque se
+comprimieron de antemano (assets, listados cacheados).
+"""
+import os
+import gzip
+from flask import request
+
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))  # debajo de esto no compensa
+GZIP_NIVEL = int(os.getenv("GZIP_NIVEL", "6"))
+
+TIPOS_COMPRIMIBLES = {
+    "application/json",
+    "text/html",
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+}
+
+
+def comprimir(body):
+    # mtime=0: mismo contenido -> mismos bytes
+    return gzip.compress(body, compresslevel=GZIP_NIVEL, mtime=0)
+
+
+def acepta_gzip():
+    return request.accept_encodings.quality("gzip") > 0
+
+
+def conviene(body):
+    """True si vale la pena mandar `body` comprimido en este request."""
+    return len(body) >= GZIP_MIN_BYTES and acepta_gzip()
+
+
+def con_gzip(resp, cuerpo_gzip):
+    """Reemplaza el cuerpo por su versión gzip ya calculada."""
+    resp.set_data(cuerpo_gzip)
+    resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    # El ETag fuerte identifica los bytes sin comprimir: pasa a débil
+    # (If-None-Match compara en forma débil, así que el 304 sigue funcionando)
+    etag, debil = resp.get_etag()
+    if etag and not debil:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+
+def comprimir_respuesta(resp):
+    if resp.mimetype not in TIPOS_COMPRIMIBLES:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+            or "Content-Encoding" in resp.headers):
+        return resp
+    body = resp.get_data()
+    if not conviene(body):
+        return resp
+    return con_gzip(resp, comprimir(body))
+
+
+def init_app(app):
+    app.after_request(comprimir_respuesta)
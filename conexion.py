@@ -1,7 +1,11 @@
 import os
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
 from dotenv import load_dotenv
 import mysql.connector
-from mysql.connector import pooling
+from mysql.connector.errors import PoolError
 
 load_dotenv()
 
@@ -11,9 +15,312 @@ DB_USER = os.getenv("DB_USER", "root")
 DB_PASS = os.getenv("DB_PASS", "pass")
 DB_NAME = os.getenv("DB_NAME", "sis_exp")
 
-pool = pooling.MySQLConnectionPool(
-    pool_name="sisexp_pool",
-    pool_size=5,
+# Pool: tamaño fijo + conexiones extra (overflow) que se cierran al devolverse
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_OVERFLOW = int(os.getenv("DB_POOL_OVERFLOW", "0"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # segundos de espera máxima
+DB_POOL_PING_SEGUNDOS = float(os.getenv("DB_POOL_PING_SEGUNDOS", "30"))  # ociosa más de esto -> ping
+
+# Réplica de lectura (opcional). Con DB_REPLICA_HOST definido los GET leen de
+# ella (ver bd.get_db_lectura); usuario, clave y base son los del primario
+# salvo que se indiquen. Para probar en local alcanza con dos instancias:
+#   docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=pass mysql:8
+#   docker run -d -p 3307:3306 -e MYSQL_ROOT_PASSWORD=pass mysql:8
+# (la segunda como réplica de la primera, o con una copia de la base) y
+# DB_REPLICA_HOST=127.0.0.1 DB_REPLICA_PORT=3307. El header X-DB-Lectura
+# de cada GET dice de dónde se leyó; detener la segunda instancia debe dejar
+# todo funcionando contra el primario.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST", "")
+DB_REPLICA_PORT = int(os.getenv("DB_REPLICA_PORT", str(DB_PORT)))
+DB_REPLICA_USER = os.getenv("DB_REPLICA_USER", DB_USER)
+DB_REPLICA_PASS = os.getenv("DB_REPLICA_PASS", DB_PASS)
+DB_REPLICA_NAME = os.getenv("DB_REPLICA_NAME", DB_NAME)
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_REPLICA_TIMEOUT = float(os.getenv("DB_REPLICA_TIMEOUT", "1"))  # espera por conexión antes de ir al primario
+# Retraso de replicación tolerado: tras escribir, una sesión lee del primario
+# durante este tiempo (leer lo propio) y las cachés no guardan lecturas de la
+# réplica hechas dentro de esta ventana desde la última escritura
+DB_REPLICA_RETRASO_SEGUNDOS = float(os.getenv("DB_REPLICA_RETRASO_SEGUNDOS", "5"))
+DB_REPLICA_REINTENTO_SEGUNDOS = float(os.getenv("DB_REPLICA_REINTENTO_SEGUNDOS", "10"))  # réplica caída: no se reintenta antes
+
+# Límites (segundos) del histograma de espera por conexión
+BUCKETS_ESPERA = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Ganchos de instrumentación (ver metricas.py, consultas_lentas.py), llamados en
+# el hilo que consulta:
+#   al_consultar: f(sql, params, segundos, pool) por cada execute; sql=None para
+#                 fetch* (sólo tiempo); en executemany params es la lista de
+#                 filas; pool es el PoolConexiones de la conexión (primario o réplica)
+#   al_obtener:   f(segundos) por cada conexión obtenida del pool (espera incluida)
+al_consultar = []
+al_obtener = []
+
+
+def _avisar(ganchos, *args):
+    for f in ganchos:
+        f(*args)
+
+
+class PoolAgotado(Exception):
+    """No se obtuvo conexión antes de DB_POOL_TIMEOUT."""
+
+
+class CursorMedido:
+    """Cursor que informa a los ganchos al_consultar el tiempo de cada llamada a la base."""
+
+    def __init__(self, cur, pool):
+        self._cur = cur
+        self._pool = pool
+
+    def __getattr__(self, nombre):
+        return getattr(self._cur, nombre)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def _medir(self, sql, params, metodo, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args, **kwargs)
+        finally:
+            _avisar(al_consultar, sql, params, time.perf_counter() - inicio, self._pool)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._medir(operation, params, self._cur.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        return self._medir(operation, seq_params, self._cur.executemany, operation, seq_params, *args, **kwargs)
+
+    def fetchone(self):
+        return self._medir(None, None, self._cur.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._medir(None, None, self._cur.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._medir(None, None, self._cur.fetchall)
+
+
+class ConexionPool:
+    """
+    Conexión prestada por el pool. Delega todo a la conexión real;
+    close() no la cierra sino que la devuelve al pool.
+    """
+
+    def __init__(self, pool, cnx):
+        self._pool = pool
+        self._cnx = cnx
+
+    def __getattr__(self, nombre):
+        if self._cnx is None:
+            raise PoolError("La conexión ya fue devuelta al pool")
+        return getattr(self._cnx, nombre)
+
+    def cursor(self, *args, **kwargs):
+        if self._cnx is None:
+            raise PoolError("La conexión ya fue devuelta al pool")
+        cur = self._cnx.cursor(*args, **kwargs)
+        return CursorMedido(cur, self._pool) if al_consultar else cur
+
+    def close(self):
+        cnx, self._cnx = self._cnx, None
+        if cnx is not None:
+            self._pool._devolver(cnx)
+
+
+class _Espera:
+    __slots__ = ("evento", "cnx")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.cnx = None
+
+
+class PoolConexiones:
+    """
+    Pool con cola de espera FIFO acotada por tiempo: si no hay conexión libre
+    el llamador espera su turno hasta `timeout` en vez de fallar de inmediato.
+    Las conexiones se abren bajo demanda y se verifican con ping si estuvieron
+    ociosas más de `ping_segundos`.
+
+    El pool es por proceso: tras un fork el hijo descarta (sin cerrar) las
+    conexiones heredadas, que siguen siendo del padre, y abre las suyas.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, overflow=DB_POOL_OVERFLOW, timeout=DB_POOL_TIMEOUT,
+                 ping_segundos=DB_POOL_PING_SEGUNDOS, **config):
+        self.size = size
+        self.overflow = overflow
+        self.timeout = timeout
+        self.ping_segundos = ping_segundos
+        self.config = config
+        self._inicializar()
+
+    def _inicializar(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._libres = deque()  # (cnx, devuelta_en)
+        self._espera = deque()
+        self._abiertas = 0
+        self._en_uso = 0
+        # estadísticas
+        self._checkouts = 0
+        self._timeouts = 0
+        self._espera_total = 0.0
+        self._espera_buckets = [0] * (len(BUCKETS_ESPERA) + 1)
+
+    def _tras_fork(self):
+        # Los sockets heredados los comparte el padre: cerrarlos desde acá
+        # le cortaría sus sesiones, así que sólo se olvidan.
+        self._inicializar()
+
+    def redimensionar(self, size, overflow=None):
+        """Cambia el tamaño (p. ej. por worker, según los hilos del servidor)."""
+        with self._lock:
+            self.size = size
+            if overflow is not None:
+                self.overflow = overflow
+
+    def _crear(self):
+        try:
+            return mysql.connector.connect(**self.config)
+        except Exception:
+            with self._lock:
+                self._abiertas -= 1
+                self._en_uso -= 1
+            raise
+
+    def _verificar(self, cnx, devuelta_en):
+        """Ping a conexiones ociosas; si no responde se reemplaza."""
+        if time.monotonic() - devuelta_en < self.ping_segundos:
+            return cnx
+        try:
+            cnx.ping(reconnect=True, attempts=1)
+            return cnx
+        except Exception:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+            return self._crear()
+
+    def _registrar_espera(self, segundos):
+        self._checkouts += 1
+        self._espera_total += segundos
+        self._espera_buckets[bisect_left(BUCKETS_ESPERA, segundos)] += 1
+
+    def get_connection(self, timeout=None):
+        inicio = time.perf_counter()
+        cnx = self._obtener(timeout)
+        _avisar(al_obtener, time.perf_counter() - inicio)
+        return cnx
+
+    def _obtener(self, timeout):
+        inicio = time.monotonic()
+        espera = None
+        with self._lock:
+            # Sólo se toma una conexión directamente si nadie espera antes (FIFO)
+            if not self._espera and self._libres:
+                cnx, devuelta_en = self._libres.popleft()
+                self._en_uso += 1
+                self._registrar_espera(0.0)
+            elif not self._espera and self._abiertas < self.size + self.overflow:
+                cnx, devuelta_en = None, None
+                self._abiertas += 1
+                self._en_uso += 1
+                self._registrar_espera(0.0)
+            else:
+                espera = _Espera()
+                self._espera.append(espera)
+
+        if espera is None:
+            if cnx is None:
+                return ConexionPool(self, self._crear())
+            return ConexionPool(self, self._verificar(cnx, devuelta_en))
+
+        limite = self.timeout if timeout is None else timeout
+        espera.evento.wait(limite)
+        with self._lock:
+            if espera.cnx is None:
+                # No llegó turno: se retira de la cola
+                self._espera.remove(espera)
+                self._timeouts += 1
+                raise PoolAgotado(f"Sin conexiones libres tras {limite:g}s de espera")
+            self._registrar_espera(time.monotonic() - inicio)
+        cnx, devuelta_en = espera.cnx
+        if cnx is None:
+            return ConexionPool(self, self._crear())
+        return ConexionPool(self, self._verificar(cnx, devuelta_en))
+
+    def _devolver(self, cnx):
+        if os.getpid() != self._pid:
+            return  # conexión prestada antes del fork: pertenece al padre
+        try:
+            # Igual que el pool de mysql-connector: descarta transacción y
+            # estado de sesión antes de reutilizar la conexión
+            cnx.reset_session()
+            sana = True
+        except Exception:
+            sana = False
+
+        with self._lock:
+            if sana and self._espera:
+                # Entrega directa al primero en la cola
+                espera = self._espera.popleft()
+                espera.cnx = (cnx, time.monotonic())
+                espera.evento.set()
+                return
+            self._en_uso -= 1
+            if sana and self._abiertas <= self.size:
+                self._libres.append((cnx, time.monotonic()))
+                return
+            self._abiertas -= 1
+            if self._espera:
+                # Se libera un cupo: el primero en la cola abre una conexión nueva
+                self._abiertas += 1
+                self._en_uso += 1
+                espera = self._espera.popleft()
+                espera.cnx = (None, None)
+                espera.evento.set()
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+    def estadisticas(self):
+        with self._lock:
+            acumulado, histograma = 0, {}
+            for limite, n in zip(list(BUCKETS_ESPERA) + ["+Inf"], self._espera_buckets):
+                acumulado += n
+                histograma[str(limite)] = acumulado
+            return {
+                "pid": self._pid,
+                "size": self.size,
+                "overflow": self.overflow,
+                "abiertas": self._abiertas,
+                "en_uso": self._en_uso,
+                "libres": len(self._libres),
+                "esperando": len(self._espera),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "espera_total_s": round(self._espera_total, 6),
+                "espera_histograma": histograma,  # acumulado (<= límite)
+            }
+
+    def cerrar(self):
+        """Cierra las conexiones ociosas (las prestadas se cierran al devolverse)."""
+        with self._lock:
+            libres, self._libres = self._libres, deque()
+            self._abiertas -= len(libres)
+        for cnx, _ in libres:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+
+
+pool = PoolConexiones(
     host=DB_HOST,
     port=DB_PORT,
     user=DB_USER,
@@ -23,5 +330,48 @@ pool = pooling.MySQLConnectionPool(
     autocommit=False,
 )
 
+pool_lectura = PoolConexiones(
+    size=DB_REPLICA_POOL_SIZE,
+    timeout=DB_REPLICA_TIMEOUT,
+    host=DB_REPLICA_HOST,
+    port=DB_REPLICA_PORT,
+    user=DB_REPLICA_USER,
+    password=DB_REPLICA_PASS,
+    database=DB_REPLICA_NAME,
+    charset="utf8mb4",
+    autocommit=False,
+    connection_timeout=2,  # una réplica caída no debe demorar el request
+) if DB_REPLICA_HOST else None
+
+if hasattr(os, "register_at_fork"):  # no existe en Windows
+    os.register_at_fork(after_in_child=pool._tras_fork)
+    if pool_lectura is not None:
+        os.register_at_fork(after_in_child=pool_lectura._tras_fork)
+
+_replica_caida_hasta = 0.0  # monotonic; por proceso
+
 def getConexion():
     return pool.get_connection()
+
+def getConexionReplica():
+    """
+    Conexión de la réplica, o None si no hay, está caída o saturada (el
+    llamador lee del primario). Si la réplica no acepta conexiones no se la
+    vuelve a intentar por DB_REPLICA_REINTENTO_SEGUNDOS.
+    """
+    global _replica_caida_hasta
+    if pool_lectura is None or time.monotonic() < _replica_caida_hasta:
+        return None
+    try:
+        return pool_lectura.get_connection()
+    except PoolAgotado:
+        return None
+    except mysql.connector.Error:
+        _replica_caida_hasta = time.monotonic() + DB_REPLICA_REINTENTO_SEGUNDOS
+        return None
+
+def replica_disponible():
+    """None sin réplica configurada; si no, si se la está usando."""
+    if pool_lectura is None:
+        return None
+    return time.monotonic() >= _replica_caida_hasta
@@ -0,0 +1,224 @@
+"""
+Registro de consultas lentas con captura de EXPLAIN.
+
+Cada execute que tarda más de SLOW_QUERY_MS se agrupa por forma: el SQL
+normalizado (literales y %s -> ?, listas IN y filas de VALUES colapsadas),
+así los WHERE armados dinámicamente en app.py se juntan aunque cambien los
+valores o la cantidad de ids. Por forma se guardan cantidad, tiempos, rutas
+que la emitieron, tipos de los parámetros y el plan (EXPLAIN) de una muestra.
+
+Debajo del umbral el costo es una comparación por consulta. El EXPLAIN corre
+en un hilo aparte, nunca en el request que fue lento, con una conexión
+prestada por el mismo pool que usó la consulta (primario o réplica): no suma
+conexiones fuera del presupuesto, y si el pool está saturado se omite y se
+reintenta más tarde. Entre un EXPLAIN y el siguiente hay al menos
+LENTAS_EXPLAIN_INTERVALO segundos.
+
+Con cursores sin buffer el tiempo medido es el del execute; la lectura de
+filas (fetch*) no se atribuye a la consulta.
+"""
+import os
+import re
+import time
+import queue
+import threading
+from collections import Counter, OrderedDict, deque
+from flask import request, has_request_context
+import conexion
+from metricas import metricas
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+LENTAS_MAX_FORMAS = int(os.getenv("LENTAS_MAX_FORMAS", "500"))
+LENTAS_RECIENTES = int(os.getenv("LENTAS_RECIENTES", "200"))
+LENTAS_EXPLAIN_SEGUNDOS = float(os.getenv("LENTAS_EXPLAIN_SEGUNDOS", "600"))  # vida del plan de una forma
+LENTAS_EXPLAIN_INTERVALO = float(os.getenv("LENTAS_EXPLAIN_INTERVALO", "1"))  # segundos mínimos entre EXPLAIN
+LENTAS_EXPLAIN_ESPERA = 0.5  # segundos de espera por una conexión del pool antes de omitirlo
+LENTAS_SQL_MAX = 4000  # caracteres de SQL guardados por forma
+
+# Sólo estas sentencias admiten EXPLAIN (y EXPLAIN no las ejecuta)
+EXPLICABLE = re.compile(r"^\s*(SELECT|UPDATE|DELETE|INSERT|REPLACE|WITH)\b", re.IGNORECASE)
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^'\\]|\\.)*'")
+_LITERAL_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_FILAS_REPETIDAS = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar(sql):
+    """Forma de la consulta: sin valores ni largo variable de listas."""
+    forma = _ESPACIOS.sub(" ", sql).strip()
+    forma = _LITERAL_TEXTO.sub("?", forma)
+    forma = forma.replace("%s", "?")
+    forma = _LITERAL_NUMERO.sub("?", forma)
+    forma = _LISTA.sub("(?+)", forma)
+    return _FILAS_REPETIDAS.sub(r"\1, ...", forma)
+
+
+def tipos_parametros(params):
+    """Tipos de los parámetros con repeticiones consecutivas agrupadas: 'int×3, str'."""
+    if params is None:
+        return ""
+    if isinstance(params, dict):
+        params = params.values()
+    grupos = []
+    for valor in params:
+        tipo = type(valor).__name__
+        if grupos and grupos[-1][0] == tipo:
+            grupos[-1][1] += 1
+        else:
+            grupos.append([tipo, 1])
+    return ", ".join(t if n == 1 else f"{t}×{n}" for t, n in grupos)
+
+
+class ConsultasLentas:
+    def __init__(self, umbral_ms=SLOW_QUERY_MS):
+        self.umbral = umbral_ms / 1000
+        self._lock = threading.Lock()
+        self._formas = OrderedDict()  # forma -> acumulados (LRU por última vez vista)
+        self._recientes = deque(maxlen=LENTAS_RECIENTES)
+        self._pendientes = queue.Queue(maxsize=50)  # (forma, sql, params, pool) a explicar
+        self._explicador_pid = None
+
+    def consulta(self, sql, params, segundos, pool=None):
+        if segundos < self.umbral or sql is None:
+            return
+        if isinstance(sql, bytes):
+            sql = sql.decode("utf-8", "replace")
+        lista = isinstance(params, list) and params and isinstance(params[0], (tuple, list, dict))
+        ejemplo = params[0] if lista else params  # executemany: la primera fila
+        forma = normalizar(sql)
+        tipos = tipos_parametros(ejemplo)
+        ruta = (request.url_rule.rule if request.url_rule else "(sin ruta)") if has_request_context() else "(fuera de request)"
+        ahora = time.time()
+        with self._lock:
+            f = self._formas.get(forma)
+            if f is None:
+                f = self._formas[forma] = {
+                    "n": 0, "total": 0.0, "max": 0.0, "rutas": Counter(), "tipos": Counter(),
+                    "primera": ahora, "plan": None, "plan_en": None, "plan_pedido": 0.0,
+                }
+                while len(self._formas) > LENTAS_MAX_FORMAS:
+                    self._formas.popitem(last=False)
+            self._formas.move_to_end(forma)
+            f["n"] += 1
+            f["total"] += segundos
+            f["max"] = max(f["max"], segundos)
+            f["ultima"] = ahora
+            f["rutas"][ruta] += 1
+            f["tipos"][tipos] += 1
+            self._recientes.append({"forma": forma[:LENTAS_SQL_MAX], "ms": round(segundos * 1000, 2),
+                                    "ruta": ruta, "tipos": tipos, "en": ahora})
+            # Muestra para EXPLAIN: la primera vez y cuando el plan guardado venció
+            explicar = (pool is not None and EXPLICABLE.match(sql)
+                        and ahora - f["plan_pedido"] >= LENTAS_EXPLAIN_SEGUNDOS)
+            if explicar:
+                f["plan_pedido"] = ahora
+        if explicar:
+            self._encolar_explain(forma, sql, ejemplo, pool)
+
+    # ---- EXPLAIN en segundo plano ----
+    def _encolar_explain(self, forma, sql, params, pool):
+        if self._explicador_pid != os.getpid():
+            self._explicador_pid = os.getpid()
+            threading.Thread(target=self._explicar, name="consultas-lentas", daemon=True).start()
+        try:
+            self._pendientes.put_nowait((forma, sql, params, pool))
+        except queue.Full:
+            self._reintentar(forma)
+
+    def _reintentar(self, forma):
+        with self._lock:
+            if forma in self._formas:
+                self._formas[forma]["plan_pedido"] = 0.0  # se reintenta en la próxima
+
+    def _explicar(self):
+        while True:
+            forma, sql, params, pool = self._pendientes.get()
+            try:
+                cnx = pool.get_connection(timeout=LENTAS_EXPLAIN_ESPERA)
+            except conexion.PoolAgotado:
+                self._reintentar(forma)
+                time.sleep(LENTAS_EXPLAIN_INTERVALO)
+                continue
+            except Exception as e:  # el hilo no debe morir por una forma que no se puede explicar
+                plan = [{"error": str(e)}]
+            else:
+                try:
+                    cur = cnx.cursor(dictionary=True)
+                    try:
+                        cur.execute("EXPLAIN " + sql, params)
+                        plan = cur.fetchall()
+                    finally:
+                        cur.close()
+                except Exception as e:
+                    plan = [{"error": str(e)}]
+                finally:
+                    cnx.close()  # vuelve al pool
+            with self._lock:
+                if forma in self._formas:
+                    self._formas[forma].update(plan=plan, plan_en=time.time())
+            time.sleep(LENTAS_EXPLAIN_INTERVALO)
+
+    # ---- consulta del registro ----
+    def instantanea(self):
+        """Estado de este proceso, serializable a JSON (ver metricas.extras)."""
+        with self._lock:
+            formas = [
+                {"sql": forma[:LENTAS_SQL_MAX], **{k: v for k, v in f.items() if k not in ("rutas", "tipos")},
+                 "rutas": dict(f["rutas"]), "tipos": dict(f["tipos"])}
+                for forma, f in self._formas.items()
+            ]
+            return {"formas": formas, "recientes": list(self._recientes)}
+
+
+def agregar(instantaneas, orden="total_ms", limite=50):
+    """Suma por forma las instantáneas de todos los workers."""
+    formas, recientes = {}, []
+    for inst in instantaneas:
+        recientes += inst["recientes"]
+        for f in inst["formas"]:
+            a = formas.get(f["sql"])
+            if a is None:
+                formas[f["sql"]] = dict(f, rutas=Counter(f["rutas"]), tipos=Counter(f["tipos"]))
+                continue
+            a["n"] += f["n"]
+            a["total"] += f["total"]
+            a["max"] = max(a["max"], f["max"])
+            a["primera"] = min(a["primera"], f["primera"])
+            a["ultima"] = max(a["ultima"], f["ultima"])
+            a["rutas"].update(f["rutas"])
+            a["tipos"].update(f["tipos"])
+            if f["plan_en"] and (not a["plan_en"] or f["plan_en"] > a["plan_en"]):
+                a["plan"], a["plan_en"] = f["plan"], f["plan_en"]
+    resultado = []
+    for a in formas.values():
+        resultado.append({
+            "sql": a["sql"],
+            "n": a["n"],
+            "total_ms": round(a["total"] * 1000, 2),
+            "media_ms": round(a["total"] / a["n"] * 1000, 2),
+            "max_ms": round(a["max"] * 1000, 2),
+            "rutas": dict(a["rutas"].most_common()),
+            "tipos_parametros": dict(a["tipos"].most_common()),
+            "primera": _iso(a["primera"]),
+            "ultima": _iso(a["ultima"]),
+            "plan": a["plan"],
+            "plan_capturado": _iso(a["plan_en"]),
+        })
+    resultado.sort(key=lambda f: f[orden], reverse=True)
+    recientes.sort(key=lambda r: r["en"], reverse=True)
+    recientes = [dict(r, en=_iso(r["en"])) for r in recientes[:limite]]
+    return resultado[:limite], recientes
+
+
+def _iso(ts):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)) if ts else None
+
+
+consultas_lentas = ConsultasLentas()
+
+
+def init_app(app):
+    conexion.al_consultar.append(consultas_lentas.consulta)
+    metricas.extras["consultas_lentas"] = consultas_lentas.instantanea
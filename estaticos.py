@@ -0,0 +1,91 @@
+"""
+Assets de la UI (assets/) y páginas (templates/) servidos desde memoria.
+
+Cada asset se publica con el hash de su contenido en la URL
+(/assets/ui.3f2a9c1b04de.js). Así puede cachearse un año como immutable, y un
+cambio en el archivo genera otra URL. Las páginas se renderizan una vez con
+esas URLs y se sirven con ETag y Cache-Control: no-cache. El navegador
+revalida el HTML (304 si no cambió) y nunca queda apuntando a assets viejos.
+En modo debug se releen en cada request para ver los cambios sin reiniciar.
+"""
+import os
+import hashlib
+import mimetypes
+import threading
+from flask import current_app, request, render_template, abort
+from compresion import comprimir, conviene, con_gzip
+
+DIR_ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+CACHE_ASSET = "public, max-age=31536000, immutable"
+CACHE_PAGINA = "no-cache"
+
+
+class Estaticos:
+    def __init__(self, directorio=DIR_ASSETS):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._assets = {}    # nombre con hash -> entrada
+        self._urls = {}      # nombre original -> nombre con hash
+        self._paginas = {}   # template -> entrada
+
+    @staticmethod
+    def _entrada(body, mimetype):
+        return {
+            "body": body,
+            "gzip": comprimir(body),
+            "etag": hashlib.sha256(body).hexdigest(),
+            "mimetype": mimetype,
+        }
+
+    def cargar(self):
+        assets, urls = {}, {}
+        for nombre in sorted(os.listdir(self.directorio)):
+            with open(os.path.join(self.directorio, nombre), "rb") as f:
+                body = f.read()
+            mimetype = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+            entrada = self._entrada(body, mimetype)
+            base, ext = os.path.splitext(nombre)
+            con_hash = f"{base}.{entrada['etag'][:12]}{ext}"
+            assets[con_hash] = entrada
+            urls[nombre] = con_hash
+        with self._lock:
+            self._assets, self._urls, self._paginas = assets, urls, {}
+
+    def url(self, nombre):
+        """URL con hash de un archivo de assets/ (se usa como asset() en los templates)."""
+        return f"/assets/{self._urls[nombre]}"
+
+    def _responder(self, entrada, cache_control):
+        resp = current_app.response_class(entrada["body"], mimetype=entrada["mimetype"])
+        resp.set_etag(entrada["etag"])
+        resp.headers["Cache-Control"] = cache_control
+        resp = resp.make_conditional(request)
+        if resp.status_code == 200 and conviene(entrada["body"]):
+            con_gzip(resp, entrada["gzip"])
+        return resp
+
+    def asset(self, nombre):
+        entrada = self._assets.get(nombre)
+        if entrada is None:
+            abort(404)
+        return self._responder(entrada, CACHE_ASSET)
+
+    def pagina(self, template):
+        """Respuesta con el template renderizado (una vez por proceso)."""
+        if current_app.debug:
+            self.cargar()
+        entrada = self._paginas.get(template)
+        if entrada is None:
+            body = render_template(template).encode()
+            entrada = self._paginas.setdefault(template, self._entrada(body, "text/html"))
+        return self._responder(entrada, CACHE_PAGINA)
+
+
+assets_ui = Estaticos()
+
+
+def init_app(app):
+    assets_ui.cargar()
+    app.add_url_rule("/assets/<nombre>", "asset", assets_ui.asset)
+    app.context_processor(lambda: {"asset": assets_ui.url})
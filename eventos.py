@@ -0,0 +1,125 @@
+"""
+Difusión de cambios de expediente a los clientes conectados por SSE
+(GET /expedientes/events).
+
+Un solo hilo por proceso lee el registro de cambios (cambios.py) y reparte
+cada cambio a las colas de los suscriptores: la base se consulta una vez
+por intervalo sin importar cuántas pestañas estén abiertas. Como lee el
+registro, también ve lo escrito por otros workers. init_app() registra un
+after_request que despierta al hilo tras cada escritura exitosa de este
+proceso, así los cambios locales no esperan al próximo intervalo.
+"""
+import os
+import queue
+import logging
+import threading
+from flask import request
+from bd import cursor
+import cambios
+
+SSE_POLL_SEGUNDOS = float(os.getenv("SSE_POLL_SEGUNDOS", "1"))
+SSE_MAX_CLIENTES = int(os.getenv("SSE_MAX_CLIENTES", "50"))  # por proceso
+SSE_COLA = 1000  # cambios pendientes por cliente antes de pedirle resincronizar
+SSE_LOTE = 500   # cambios leídos por consulta
+
+log = logging.getLogger(__name__)
+
+
+class Suscripcion:
+    def __init__(self):
+        self.cola = queue.Queue(maxsize=SSE_COLA)
+        self.desbordada = False  # se perdieron cambios: el cliente debe recargar
+
+
+class Difusor:
+    def __init__(self, max_clientes=SSE_MAX_CLIENTES, intervalo=SSE_POLL_SEGUNDOS):
+        self.max_clientes = max_clientes
+        self.intervalo = intervalo
+        self.ultimo_seq = None  # último seq repartido (None: sin suscriptores)
+        self.continuar = lambda: True  # gunicorn lo liga a worker.alive (apagado ordenado)
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    def suscribir(self, seq_cliente):
+        """
+        Registra un cliente que ya tiene todo hasta `seq_cliente`. Devuelve
+        (suscripcion, desde): la cola recibirá los cambios con seq > desde;
+        si desde > seq_cliente, los del medio los debe leer quien llama.
+        None si se alcanzó max_clientes.
+        """
+        with self._lock:
+            if len(self._suscripciones) >= self.max_clientes:
+                return None
+            if self.ultimo_seq is None:
+                self.ultimo_seq = seq_cliente
+            s = Suscripcion()
+            self._suscripciones.add(s)
+            desde = self.ultimo_seq
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="difusor-sse", daemon=True)
+                self._hilo.start()
+        self._despertar.set()
+        return s, desde
+
+    def desuscribir(self, s):
+        with self._lock:
+            self._suscripciones.discard(s)
+
+    def avisar(self):
+        """Hubo una escritura en este proceso: leer el registro ya."""
+        self._despertar.set()
+
+    def clientes(self):
+        with self._lock:
+            return len(self._suscripciones)
+
+    def _repartir(self, lista):
+        with self._lock:
+            for s in self._suscripciones:
+                if s.desbordada:
+                    continue
+                for cambio in lista:
+                    try:
+                        s.cola.put_nowait(cambio)
+                    except queue.Full:
+                        s.desbordada = True
+                        break
+            self.ultimo_seq = lista[-1]["seq"]
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            with self._lock:
+                if not self._suscripciones:
+                    # Sin clientes no se consulta; el próximo fija el punto de partida
+                    self.ultimo_seq = None
+                    continue
+                desde = self.ultimo_seq
+            try:
+                while True:
+                    with cursor(buffered=True) as cur:
+                        lista, _, _ = cambios.leer(cur, desde, SSE_LOTE)
+                    if not lista:
+                        break
+                    self._repartir(lista)
+                    desde = lista[-1]["seq"]
+                    if len(lista) < SSE_LOTE:
+                        break
+            except Exception:
+                log.exception("No se pudo leer el registro de cambios")
+
+
+difusor = Difusor()
+
+
+def avisar_escritura(resp):
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and resp.status_code < 400:
+        difusor.avisar()
+    return resp
+
+
+def init_app(app):
+    app.after_request(avisar_escritura)
@@ -0,0 +1,18 @@
+# Formatos de respuesta para listados (?format=)
+#   objects (por defecto): [{"id": 1, "estado": ...}, ...]
+#   rows:    {"columns": ["id", "estado", ...], "data": [[1, ...], ...]}
+#   columns: {"columns": [...], "data": {"id": [1, 2, ...], "estado": [...], ...}}
+FORMATOS_LISTA = ("objects", "rows", "columns")
+
+
+def formatear_filas(columnas, filas, formato):
+    """
+    Arma el cuerpo de un listado a partir de tuplas del cursor. Para rows y
+    columns las claves aparecen una sola vez en vez de repetirse por fila.
+    """
+    columnas = list(columnas)
+    if formato == "rows":
+        return {"columns": columnas, "data": [list(f) for f in filas]}
+    if formato == "columns":
+        return {"columns": columnas, "data": {c: [f[i] for f in filas] for i, c in enumerate(columnas)}}
+    return {"data": [dict(zip(columnas, f)) for f in filas]}
@@ -0,0 +1,148 @@
+"""
+Generador de datos sintéticos para pruebas de volumen.
+
+Carga catálogos y expedientes en la base configurada en .env con INSERT
+multi-fila (un commit por lote). Las distribuciones imitan producción:
+pocas aseguradoras/juzgados concentran la mayoría de los expedientes, hay
+más expedientes recientes que antiguos y los antiguos están casi todos
+cerrados. expediente_resumen se actualiza en la misma transacción de cada
+lote.
+
+El registro de cambios no recibe una fila por expediente sintético (10M
+filas más duplicarían la escritura y falsearían la medición): cada lote
+solo avanza el seq como compactado (cambios.omitir) y los clientes
+resincronizan. Con --con-cambios se registran como altas normales.
+
+    python generar_datos.py --expedientes 10000000 --usuarios 200 --aseguradoras 30
+"""
+import time
+import random
+import argparse
+from datetime import date, timedelta
+from collections import Counter
+from conexion import getConexion
+import resumen
+import cambios
+
+CATALOGOS = {
+    # tabla: (columnas, generador de fila para el número n)
+    "usuario": (("nombre", "apellido", "username", "pass"),
+                lambda n: (f"Usuario{n}", f"Sintetico{n}", f"user{n:05d}", "1234")),
+    "aseguradora": (("nombre_aseguradora",), lambda n: (f"ASEGURADORA {n:03d}",)),
+    "juzgado": (("nombre_juzgado",), lambda n: (f"Juzgado {n:03d}",)),
+    "caso": (("nombre_caso",), lambda n: (f"CASO {n:03d}",)),
+}
+
+
+# Orden de los valores de generar_fila()
+COLUMNAS = ("aseguradora_id", "usuario_id", "juzgado_id", "caso_id", "estado", "fecha")
+
+
+def completar_catalogo(cur, tabla, cantidad):
+    """Agrega filas sintéticas hasta tener `cantidad` y devuelve los ids."""
+    columnas, fila = CATALOGOS[tabla]
+    cur.execute(f"SELECT id FROM {tabla} ORDER BY id")
+    ids = [r[0] for r in cur.fetchall()]
+    faltan = max(0, cantidad - len(ids))
+    if faltan:
+        marcas = ", ".join(["(" + ", ".join(["%s"] * len(columnas)) + ")"] * faltan)
+        valores = [v for n in range(len(ids) + 1, cantidad + 1) for v in fila(n)]
+        cur.execute(f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES {marcas}", tuple(valores))
+        cur.execute(f"SELECT id FROM {tabla} ORDER BY id")
+        ids = [r[0] for r in cur.fetchall()]
+    return ids
+
+
+def pesos_zipf(n, s):
+    """Pesos 1/rank^s: unos pocos ids concentran la mayoría."""
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def generar_fila(rnd, ids, pesos, desde, dias):
+    # Más expedientes recientes: sqrt sesga el uniforme hacia el final del rango
+    edad = 1 - rnd.random() ** 0.5
+    fecha = desde + timedelta(days=int((1 - edad) * dias))
+    # Cuanto más antiguo, más probable que esté cerrado
+    p_cerrado = min(0.95, 0.1 + edad * 1.2)
+    r = rnd.random()
+    if r < p_cerrado:
+        estado = "Cerrado"
+    elif r < p_cerrado + (1 - p_cerrado) * 0.4:
+        estado = "En Curso"
+    else:
+        estado = "Pendiente"
+    return (
+        rnd.choices(ids["aseguradora"], pesos["aseguradora"])[0],
+        rnd.choices(ids["usuario"], pesos["usuario"])[0],
+        rnd.choices(ids["juzgado"], pesos["juzgado"])[0],
+        rnd.choices(ids["caso"], pesos["caso"])[0],
+        estado,
+        fecha,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga datos sintéticos en sis_exp")
+    parser.add_argument("--expedientes", type=int, default=100_000)
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--aseguradoras", type=int, default=20)
+    parser.add_argument("--juzgados", type=int, default=40)
+    parser.add_argument("--casos", type=int, default=10)
+    parser.add_argument("--lote", type=int, default=5000, help="filas por INSERT/commit")
+    parser.add_argument("--desde", default="2010-01-01", help="fecha mínima YYYY-MM-DD")
+    parser.add_argument("--zipf", type=float, default=1.1, help="sesgo de los FKs (0 = uniforme)")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--con-cambios", action="store_true",
+                        help="registrar cada expediente en expediente_cambio")
+    args = parser.parse_args()
+
+    rnd = random.Random(args.semilla)
+    desde = date.fromisoformat(args.desde)
+    dias = (date.today() - desde).days
+
+    conn = getConexion()
+    cur = conn.cursor(buffered=True)
+    try:
+        cantidades = {"usuario": args.usuarios, "aseguradora": args.aseguradoras,
+                      "juzgado": args.juzgados, "caso": args.casos}
+        ids = {t: completar_catalogo(cur, t, n) for t, n in cantidades.items()}
+        conn.commit()
+        pesos = {t: pesos_zipf(len(v), args.zipf) for t, v in ids.items()}
+        for t in ids:
+            rnd.shuffle(ids[t])  # el id "popular" no siempre es el 1
+
+        # Los FKs salen de los catálogos recién leídos: se omite su verificación
+        cur.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+        inicio = time.monotonic()
+        cargados = 0
+        while cargados < args.expedientes:
+            n = min(args.lote, args.expedientes - cargados)
+            filas = [generar_fila(rnd, ids, pesos, desde, dias) for _ in range(n)]
+            marcas = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * n)
+            cur.execute(
+                f"INSERT INTO expediente ({', '.join(COLUMNAS)}) VALUES {marcas}",
+                tuple(v for f in filas for v in f),
+            )
+            primer_id = cur.lastrowid  # ids consecutivos del INSERT multi-fila
+            resumen.ajustar(cur, Counter((f[1], f[0], f[2], f[3], f[4]) for f in filas))
+            if args.con_cambios:
+                cambios.registrar(cur, [
+                    ("I", primer_id + i, {"id": primer_id + i, **dict(zip(COLUMNAS, f))})
+                    for i, f in enumerate(filas)
+                ])
+            else:
+                cambios.omitir(cur)
+            conn.commit()
+            cargados += n
+            transcurrido = time.monotonic() - inicio
+            print(f"\r{cargados:,}/{args.expedientes:,} expedientes "
+                  f"({cargados / transcurrido:,.0f} filas/s)", end="", flush=True)
+        print()
+        cur.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
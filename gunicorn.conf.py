@@ -0,0 +1,115 @@
+"""
+Configuración de gunicorn (se carga sola desde el directorio actual):
+
+    gunicorn wsgi:app
+
+Variables de entorno:
+    WEB_BIND              dirección de escucha (0.0.0.0:5000)
+    WEB_WORKERS           procesos (2 x CPUs + 1)
+    WEB_THREADS           hilos por proceso para requests comunes (4)
+    SSE_MAX_CLIENTES      clientes de /expedientes/events por proceso (8); se
+                          suman como hilos aparte de WEB_THREADS
+    WEB_GRACEFUL_TIMEOUT  segundos para terminar requests en curso al apagar (30)
+    DB_MAX_CONEXIONES     tope de conexiones a MySQL entre todos los workers
+                          (sin tope: workers x WEB_THREADS)
+    DB_POOL_OVERFLOW      conexiones extra por worker sobre una por hilo
+                          (conexion.py), recortadas para no pasar
+                          DB_MAX_CONEXIONES
+
+Cada request usa como máximo una conexión por servidor (bd.get_db y, con
+réplica, bd.get_db_lectura), así que cada pool de un worker necesita tantas
+conexiones como hilos de requests. Si workers x WEB_THREADS supera
+DB_MAX_CONEXIONES el pool se achica y los hilos sobrantes esperan turno en
+la cola del pool (DB_POOL_TIMEOUT, luego 503).
+
+Cada cliente de /expedientes/events (SSE) ocupa un hilo entero mientras está
+conectado (sin conexión a la base), hasta SSE_DURACION_MAX (300 s) por
+stream antes de que el navegador reconecte. Por eso cada worker tiene
+WEB_THREADS + SSE_MAX_CLIENTES hilos: los streams nunca dejan sin hilos a
+los requests, y una pestaña abierta es un cliente. Con los valores por
+defecto entran 8 pestañas por worker (workers x 8 en total); por encima del
+tope la respuesta es 503 y la UI reintenta con espera creciente
+(assets/ui.js, suscribirCambios). Los hilos de SSE no suman conexiones al
+pool: un stream sólo usa una un instante, al conectar.
+"""
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+hilos_requests = int(os.getenv("WEB_THREADS", "4"))
+sse_clientes = int(os.getenv("SSE_MAX_CLIENTES", "8"))
+threads = hilos_requests + sse_clientes
+worker_class = "gthread"
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+# La app se importa en el master: las generaciones de caché compartidas se
+# crean antes del fork y el admin se verifica una sola vez.
+preload_app = True
+
+_max_conexiones = int(os.getenv("DB_MAX_CONEXIONES", "0"))
+
+
+def tamano_pool():
+    """Conexiones por worker: una por hilo de requests, recortado por DB_MAX_CONEXIONES."""
+    if _max_conexiones:
+        return max(1, min(hilos_requests, _max_conexiones // workers))
+    return hilos_requests
+
+
+def desborde_pool():
+    """DB_POOL_OVERFLOW por worker, sin que el total pase DB_MAX_CONEXIONES."""
+    from conexion import DB_POOL_OVERFLOW
+    if _max_conexiones:
+        return max(0, min(DB_POOL_OVERFLOW, _max_conexiones // workers - tamano_pool()))
+    return DB_POOL_OVERFLOW
+
+
+def on_starting(server):
+    from app import ensure_admin_user
+    from conexion import pool, pool_lectura
+    from cache_resultados import cache_expedientes
+    from catalogos import catalogo_cache
+
+    from metricas import metricas
+
+    cache_expedientes.compartir()
+    catalogo_cache.compartir()
+    # Cada worker vuelca sus contadores acá y /metrics suma los de todos
+    metricas.directorio = tempfile.mkdtemp(prefix="sis_exp-metricas-")
+    ensure_admin_user()
+    # El master no atiende requests: no debe quedarse con conexiones abiertas
+    pool.cerrar()
+    if pool_lectura is not None:
+        pool_lectura.cerrar()
+    server.log.info("Pool por worker: %d conexiones + %d de desborde (%d workers x %d hilos, %d para SSE)",
+                    tamano_pool(), desborde_pool(), workers, threads, sse_clientes)
+
+
+def post_fork(server, worker):
+    from conexion import pool, pool_lectura
+    from eventos import difusor
+    pool.redimensionar(tamano_pool(), overflow=desborde_pool())
+    if pool_lectura is not None:
+        pool_lectura.redimensionar(tamano_pool(), overflow=desborde_pool())
+    difusor.max_clientes = sse_clientes
+    # Al apagar, los streams SSE terminan en el próximo heartbeat en vez de
+    # retener el worker hasta graceful_timeout
+    difusor.continuar = lambda: worker.alive
+
+
+def worker_exit(server, worker):
+    # gunicorn ya esperó a los requests en curso (graceful_timeout)
+    from conexion import pool, pool_lectura
+    from metricas import metricas
+    pool.cerrar()
+    if pool_lectura is not None:
+        pool_lectura.cerrar()
+    metricas.descartar_volcado()
+
+
+def on_exit(server):
+    from metricas import metricas
+    if metricas.directorio:
+        shutil.rmtree(metricas.directorio, ignore_errors=True)
@@ -0,0 +1,234 @@
+"""
+Instrumentación de requests: latencia por ruta (histograma), consultas y
+tiempo de base por request, espera por conexión del pool y bytes enviados.
+
+Cada respuesta lleva un header Server-Timing (pool, db, app, total) y
+/metrics expone los acumulados en formato de texto de Prometheus. El costo
+por request es un par de perf_counter y un lock al final.
+
+Con varios workers cada proceso tiene sus propios contadores: si
+`directorio` está definido (gunicorn.conf.py), cada worker vuelca los suyos
+a <directorio>/<pid>.json cada METRICAS_INTERVALO segundos y /metrics suma
+los de todos.
+
+/metrics expone rutas, consultas y estado del pool: responde sólo a la
+sesión de admin o, para el scraper de Prometheus, con
+"Authorization: Bearer <METRICAS_TOKEN>" (sin METRICAS_TOKEN, sólo admin).
+"""
+import os
+import hmac
+import json
+import time
+import threading
+from bisect import bisect_left
+from flask import Response, g, request, session, jsonify, has_app_context
+import conexion
+from conexion import pool
+from cache_resultados import cache_expedientes
+from eventos import difusor
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICAS_INTERVALO = float(os.getenv("METRICAS_INTERVALO", "5"))
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")  # bearer del scraper; vacío: sólo la sesión de admin
+
+# Contadores por (ruta, método, status) además del histograma de latencia
+CONTADORES = {
+    "bytes": ("http_response_bytes_total", "Bytes enviados en el cuerpo (tras compresión)"),
+    "consultas": ("db_queries_total", "Consultas ejecutadas"),
+    "db": ("db_query_seconds_total", "Tiempo en la base (execute y fetch)"),
+    "pool": ("db_pool_acquire_seconds_total", "Tiempo obteniendo conexión del pool"),
+}
+
+
+class Metricas:
+    def __init__(self):
+        self.directorio = None
+        self.extras = {}  # nombre -> f() con datos JSON de otros módulos a volcar junto a los contadores
+        self._lock = threading.Lock()
+        self._rutas = {}  # (ruta, método, status) -> acumulados
+        self._volcador_pid = None
+
+    # ---- por request ----
+    def iniciar(self):
+        g.metricas = {"inicio": time.perf_counter(), "consultas": 0, "db": 0.0, "pool": 0.0}
+        if self.directorio and self._volcador_pid != os.getpid():
+            self._volcador_pid = os.getpid()
+            threading.Thread(target=self._volcar_periodicamente, name="metricas", daemon=True).start()
+
+    @staticmethod
+    def consulta(sql, params, segundos, pool=None):
+        m = g.get("metricas") if has_app_context() else None
+        if m is not None:
+            m["db"] += segundos
+            if sql is not None:
+                m["consultas"] += 1
+
+    @staticmethod
+    def conexion_obtenida(segundos):
+        m = g.get("metricas") if has_app_context() else None
+        if m is not None:
+            m["pool"] += segundos
+
+    def finalizar(self, resp):
+        m = g.pop("metricas", None)
+        if m is None:
+            return resp
+        total = time.perf_counter() - m["inicio"]
+        app_s = max(0.0, total - m["db"] - m["pool"])
+        resp.headers["Server-Timing"] = ", ".join([
+            f"pool;dur={m['pool'] * 1000:.2f}",
+            f'db;dur={m["db"] * 1000:.2f};desc="{m["consultas"]} consultas"',
+            f"app;dur={app_s * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+        # En streaming sólo se cuenta hasta que empieza la respuesta
+        bytes_ = 0 if resp.is_streamed else (resp.content_length or 0)
+        ruta = request.url_rule.rule if request.url_rule else "(sin ruta)"
+        clave = (ruta, request.method, str(resp.status_code))
+        with self._lock:
+            r = self._rutas.get(clave)
+            if r is None:
+                r = self._rutas[clave] = {
+                    "buckets": [0] * (len(BUCKETS_LATENCIA) + 1),
+                    "suma": 0.0, "n": 0, "bytes": 0, "consultas": 0, "db": 0.0, "pool": 0.0,
+                }
+            r["buckets"][bisect_left(BUCKETS_LATENCIA, total)] += 1
+            r["suma"] += total
+            r["n"] += 1
+            r["bytes"] += bytes_
+            r["consultas"] += m["consultas"]
+            r["db"] += m["db"]
+            r["pool"] += m["pool"]
+        return resp
+
+    # ---- agregación ----
+    def instantanea(self):
+        """Estado de este proceso, serializable a JSON."""
+        with self._lock:
+            rutas = [[*clave, dict(r, buckets=list(r["buckets"]))] for clave, r in self._rutas.items()]
+        p = pool.estadisticas()
+        c = cache_expedientes.estadisticas()
+        return {
+            "rutas": rutas,
+            "pool": {k: p[k] for k in ("abiertas", "en_uso", "libres", "esperando", "checkouts", "timeouts")},
+            "cache": {"hits": c["hits"], "misses": c["misses"], "entradas": c["entradas"]},
+            "sse_clientes": difusor.clientes(),
+            "extras": {nombre: f() for nombre, f in self.extras.items()},
+        }
+
+    def _volcar_periodicamente(self):
+        ruta = os.path.join(self.directorio, f"{os.getpid()}.json")
+        while True:
+            try:
+                temporal = ruta + ".tmp"
+                with open(temporal, "w", encoding="utf-8") as f:
+                    json.dump(self.instantanea(), f, default=str)
+                os.replace(temporal, ruta)  # el lector nunca ve un archivo a medias
+            except OSError:
+                pass
+            time.sleep(METRICAS_INTERVALO)
+
+    def descartar_volcado(self):
+        """Al salir el worker: sus contadores dejan de sumarse."""
+        if self.directorio:
+            try:
+                os.remove(os.path.join(self.directorio, f"{os.getpid()}.json"))
+            except OSError:
+                pass
+
+    def _instantaneas(self):
+        propias = self.instantanea()
+        todas = [propias]
+        if self.directorio:
+            for nombre in os.listdir(self.directorio):
+                if nombre.endswith(".json") and nombre != f"{os.getpid()}.json":
+                    try:
+                        with open(os.path.join(self.directorio, nombre), encoding="utf-8") as f:
+                            todas.append(json.load(f))
+                    except (OSError, ValueError):
+                        pass
+        return todas
+
+    def recolectar(self, nombre):
+        """extras[nombre] de cada proceso (el propio primero)."""
+        return [inst["extras"][nombre] for inst in self._instantaneas() if nombre in inst.get("extras", {})]
+
+    def exposicion(self):
+        """Texto para /metrics (formato de exposición de Prometheus)."""
+        rutas, pool_, cache, sse = {}, {}, {}, 0
+        for inst in self._instantaneas():
+            for ruta, metodo, status, r in inst["rutas"]:
+                a = rutas.setdefault((ruta, metodo, status), {
+                    "buckets": [0] * len(r["buckets"]), "suma": 0.0, "n": 0,
+                    **{k: 0 for k in CONTADORES},
+                })
+                a["buckets"] = [x + y for x, y in zip(a["buckets"], r["buckets"])]
+                for k in ("suma", "n", *CONTADORES):
+                    a[k] += r[k]
+            for k, v in inst["pool"].items():
+                pool_[k] = pool_.get(k, 0) + v
+            for k, v in inst["cache"].items():
+                cache[k] = cache.get(k, 0) + v
+            sse += inst["sse_clientes"]
+
+        lineas = [
+            "# HELP http_request_duration_seconds Latencia de requests hasta el inicio de la respuesta",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (ruta, metodo, status), a in sorted(rutas.items()):
+            etiquetas = f'route="{_escapar(ruta)}",method="{metodo}",status="{status}"'
+            acumulado = 0
+            for limite, n in zip(list(BUCKETS_LATENCIA) + ["+Inf"], a["buckets"]):
+                acumulado += n
+                lineas.append(f'http_request_duration_seconds_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            lineas.append(f"http_request_duration_seconds_sum{{{etiquetas}}} {a['suma']:.6f}")
+            lineas.append(f"http_request_duration_seconds_count{{{etiquetas}}} {a['n']}")
+        for k, (nombre, ayuda) in CONTADORES.items():
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+            for (ruta, metodo, status), a in sorted(rutas.items()):
+                etiquetas = f'route="{_escapar(ruta)}",method="{metodo}",status="{status}"'
+                lineas.append(f"{nombre}{{{etiquetas}}} {a[k]:g}")
+
+        lineas += ["# HELP db_pool_connections Conexiones del pool por estado", "# TYPE db_pool_connections gauge"]
+        for estado in ("abiertas", "en_uso", "libres", "esperando"):
+            lineas.append(f'db_pool_connections{{estado="{estado}"}} {pool_.get(estado, 0)}')
+        lineas += [
+            "# TYPE db_pool_checkouts_total counter", f"db_pool_checkouts_total {pool_.get('checkouts', 0)}",
+            "# TYPE db_pool_timeouts_total counter", f"db_pool_timeouts_total {pool_.get('timeouts', 0)}",
+            "# TYPE expedientes_cache_hits_total counter", f"expedientes_cache_hits_total {cache.get('hits', 0)}",
+            "# TYPE expedientes_cache_misses_total counter", f"expedientes_cache_misses_total {cache.get('misses', 0)}",
+            "# TYPE expedientes_cache_entries gauge", f"expedientes_cache_entries {cache.get('entradas', 0)}",
+            "# TYPE sse_clients gauge", f"sse_clients {sse}",
+        ]
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor):
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metricas = Metricas()
+
+
+def autorizado():
+    """Sesión de admin o el bearer METRICAS_TOKEN (comparado en tiempo constante)."""
+    if session.get("user_id") and session.get("username") == "admin":
+        return True
+    esquema, _, token = request.headers.get("Authorization", "").partition(" ")
+    return bool(METRICAS_TOKEN) and esquema.lower() == "bearer" and hmac.compare_digest(token, METRICAS_TOKEN)
+
+
+def exponer():
+    if not autorizado():
+        return jsonify({"error": "No autorizado"}), (403 if session.get("user_id") else 401)
+    return Response(metricas.exposicion(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    # Registrar antes que compresion/estaticos: los after_request corren en
+    # orden inverso, así la medición incluye la compresión y ve el tamaño final
+    app.before_request(metricas.iniciar)
+    app.after_request(metricas.finalizar)
+    conexion.al_consultar.append(Metricas.consulta)
+    conexion.al_obtener.append(Metricas.conexion_obtenida)
+    app.add_url_rule("/metrics", "metrics", exponer)
@@ -0,0 +1,13 @@
+-- Índices compuestos para los filtros de listar_expedientes.
+-- InnoDB agrega la PK (id) al final de cada índice secundario, así que
+-- (col, ...) también resuelve el ORDER BY e.id DESC y el seek por cursor.
+
+-- estado = ?  ORDER BY id DESC
+CREATE INDEX idx_exp_estado ON expediente (estado);
+
+-- <fk> = ? [AND estado = ?]  ORDER BY id DESC
+-- (también sirven para la restricción FK, que sólo necesita la primera columna)
+CREATE INDEX idx_exp_aseguradora_estado ON expediente (aseguradora_id, estado);
+CREATE INDEX idx_exp_usuario_estado ON expediente (usuario_id, estado);
+CREATE INDEX idx_exp_juzgado_estado ON expediente (juzgado_id, estado);
+CREATE INDEX idx_exp_caso_estado ON expediente (caso_id, estado);
@@ -0,0 +1,7 @@
+-- Rangos de fecha (fecha_desde / fecha_hasta), solos o con estado.
+
+-- fecha BETWEEN ? AND ?
+CREATE INDEX idx_exp_fecha ON expediente (fecha);
+
+-- estado = ? AND fecha BETWEEN ? AND ?
+CREATE INDEX idx_exp_estado_fecha ON expediente (estado, fecha);
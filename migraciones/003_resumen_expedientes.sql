@@ -0,0 +1,22 @@
+-- Conteos mantenidos en línea por usuario/aseguradora/juzgado/caso x estado.
+-- Lo actualizan las rutas de escritura en la misma transacción (ver resumen.py);
+-- /stats lee de aquí en vez de agrupar toda la tabla expediente.
+CREATE TABLE expediente_resumen (
+  usuario_id INT NOT NULL,
+  aseguradora_id INT NOT NULL,
+  juzgado_id INT NOT NULL,
+  caso_id INT NOT NULL,
+  estado ENUM('Pendiente', 'En Curso', 'Cerrado') NOT NULL,
+  total INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (usuario_id, aseguradora_id, juzgado_id, caso_id, estado),
+  KEY idx_resumen_aseguradora (aseguradora_id, estado),
+  KEY idx_resumen_juzgado (juzgado_id, estado),
+  KEY idx_resumen_caso (caso_id, estado)
+);
+
+-- Carga inicial
+INSERT INTO expediente_resumen (usuario_id, aseguradora_id, juzgado_id, caso_id, estado, total)
+SELECT usuario_id, aseguradora_id, juzgado_id, caso_id, estado, COUNT(*)
+FROM expediente
+WHERE estado IS NOT NULL
+GROUP BY usuario_id, aseguradora_id, juzgado_id, caso_id, estado;
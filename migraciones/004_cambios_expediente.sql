@@ -0,0 +1,25 @@
+-- Registro de cambios de expediente para sincronización incremental
+-- (GET /expedientes/changes). Lo escriben las rutas de escritura en la misma
+-- transacción (ver cambios.py).
+
+-- Secuencia global: una sola fila. Quien escribe la incrementa al final de su
+-- transacción y conserva el lock hasta el commit, así los seq se confirman en
+-- orden y un lector nunca ve el seq N+1 antes que el N.
+-- compactado_hasta: los cambios con seq <= este valor ya no están completos.
+CREATE TABLE expediente_secuencia (
+  id TINYINT NOT NULL PRIMARY KEY,
+  seq BIGINT UNSIGNED NOT NULL,
+  compactado_hasta BIGINT UNSIGNED NOT NULL DEFAULT 0
+);
+
+INSERT INTO expediente_secuencia (id, seq, compactado_hasta) VALUES (1, 0, 0);
+
+CREATE TABLE expediente_cambio (
+  seq BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+  op ENUM('I', 'U', 'D') NOT NULL,
+  expediente_id INT NOT NULL,
+  datos JSON NULL,  -- valores nuevos de la fila (NULL en bajas)
+  creado TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+  KEY idx_cambio_expediente (expediente_id, seq),
+  KEY idx_cambio_creado (creado)
+);
@@ -0,0 +1,34 @@
+-- Archivo de expedientes cerrados antiguos (ver archivo.py). Se usa una tabla
+-- aparte y no particiones por fecha: InnoDB no admite particionar tablas con
+-- claves foráneas, y expediente las tiene.
+-- Invariantes que usan las consultas para saltear el archivo:
+--   * sólo contiene expedientes en estado Cerrado (una escritura sobre un
+--     archivado primero lo devuelve a expediente);
+--   * toda fila archivada tiene fecha < expediente_archivo_corte.corte.
+CREATE TABLE expediente_archivo (
+  id INT NOT NULL PRIMARY KEY,  -- el mismo id que tenía en expediente
+  aseguradora_id INT NOT NULL,
+  usuario_id INT NOT NULL,
+  juzgado_id INT NOT NULL,
+  caso_id INT NOT NULL,
+  estado ENUM('Pendiente', 'En Curso', 'Cerrado'),
+  fecha DATE,
+  archivado TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  KEY idx_arch_fecha (fecha),
+  KEY idx_arch_aseguradora (aseguradora_id),
+  KEY idx_arch_usuario (usuario_id),
+  KEY idx_arch_juzgado (juzgado_id),
+  KEY idx_arch_caso (caso_id),
+  FOREIGN KEY (aseguradora_id) REFERENCES aseguradora(id),
+  FOREIGN KEY (usuario_id) REFERENCES usuario(id),
+  FOREIGN KEY (juzgado_id) REFERENCES juzgado(id),
+  FOREIGN KEY (caso_id) REFERENCES caso(id)
+);
+
+-- Una sola fila. corte NULL: nunca se archivó (las consultas ni miran el archivo).
+CREATE TABLE expediente_archivo_corte (
+  id TINYINT NOT NULL PRIMARY KEY,
+  corte DATE NULL
+);
+
+INSERT INTO expediente_archivo_corte (id, corte) VALUES (1, NULL);
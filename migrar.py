@@ -0,0 +1,166 @@
+"""
+Migraciones versionadas del esquema.
+
+Cada archivo de migraciones/ se llama NNN_descripcion.sql; NNN es la versión.
+Las versiones aplicadas quedan registradas en la tabla schema_version.
+
+Uso:
+    python migrar.py              # aplica las migraciones pendientes
+    python migrar.py estado       # muestra versión actual y pendientes
+    python migrar.py verificar    # EXPLAIN de cada filtro de listar_expedientes
+"""
+import os
+import re
+import sys
+import argparse
+from conexion import getConexion
+
+MIGRACIONES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migraciones")
+
+
+def listar_migraciones():
+    """Devuelve [(version, nombre, ruta)] ordenado por versión."""
+    migraciones = []
+    for nombre in os.listdir(MIGRACIONES_DIR):
+        m = re.match(r"^(\d+)_.+\.sql$", nombre)
+        if m:
+            migraciones.append((int(m.group(1)), nombre, os.path.join(MIGRACIONES_DIR, nombre)))
+    migraciones.sort()
+    versiones = [v for v, _, _ in migraciones]
+    if len(versiones) != len(set(versiones)):
+        raise RuntimeError("Hay migraciones con la misma versión")
+    return migraciones
+
+
+def sentencias(ruta):
+    """Separa un archivo .sql en sentencias (sin comentarios de línea)."""
+    with open(ruta, encoding="utf-8") as f:
+        lineas = [l for l in f if not l.lstrip().startswith(("--", "#"))]
+    return [s.strip() for s in "".join(lineas).split(";") if s.strip()]
+
+
+def asegurar_tabla_version(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+          version INT PRIMARY KEY,
+          nombre VARCHAR(255) NOT NULL,
+          aplicada_en DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def versiones_aplicadas(cur):
+    cur.execute("SELECT version FROM schema_version")
+    return {row[0] for row in cur.fetchall()}
+
+
+def aplicar():
+    conn = getConexion()
+    cur = conn.cursor(buffered=True)
+    try:
+        asegurar_tabla_version(cur)
+        aplicadas = versiones_aplicadas(cur)
+        pendientes = [m for m in listar_migraciones() if m[0] not in aplicadas]
+        if not pendientes:
+            print("Sin migraciones pendientes")
+        for version, nombre, ruta in pendientes:
+            print(f"Aplicando {nombre}...")
+            # En MySQL el DDL confirma implícitamente: se registra la versión
+            # apenas termina cada archivo para poder reanudar si algo falla.
+            for sql in sentencias(ruta):
+                cur.execute(sql)
+            cur.execute("INSERT INTO schema_version (version, nombre) VALUES (%s, %s)", (version, nombre))
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def estado():
+    conn = getConexion()
+    cur = conn.cursor(buffered=True)
+    try:
+        asegurar_tabla_version(cur)
+        aplicadas = versiones_aplicadas(cur)
+    finally:
+        cur.close()
+        conn.close()
+    print("Versión actual:", max(aplicadas) if aplicadas else 0)
+    for version, nombre, _ in listar_migraciones():
+        print(("  [x] " if version in aplicadas else "  [ ] ") + nombre)
+
+
+# Formas de filtro que emite listar_expedientes (con valores de ejemplo)
+FORMAS_FILTRO = [
+    {},
+    {"estado": "Pendiente"},
+    {"aseguradora_id": "1"},
+    {"usuario_id": "1"},
+    {"juzgado_id": "1"},
+    {"caso_id": "1"},
+    {"aseguradora_id": "1", "estado": "Pendiente"},
+    {"usuario_id": "1", "estado": "Pendiente"},
+    {"juzgado_id": "1", "estado": "Pendiente"},
+    {"caso_id": "1", "estado": "Pendiente"},
+    {"fecha_desde": "2019-01-01", "fecha_hasta": "2019-01-31"},
+    {"estado": "Pendiente", "fecha_desde": "2019-01-01", "fecha_hasta": "2019-01-31"},
+    {"aseguradora_id": "1", "fecha_desde": "2019-01-01", "fecha_hasta": "2019-01-31"},
+    # ?q= se resuelve a IN (...) sobre las FKs (nombres de generar_datos.py)
+    {"q": "usuario1"},
+    {"q": "usuario1", "estado": "Pendiente"},
+]
+
+
+def verificar():
+    """
+    Ejecuta EXPLAIN del conteo y de la página (completa y con fields ligeros)
+    de listar_expedientes para cada
+    forma de filtro y falla si alguna hace full scan (type = ALL) sobre
+    expediente (o expediente_archivo, en las formas que pueden alcanzarlo). Con pocas filas el optimizador puede preferir el scan: conviene
+    correrlo con volumen realista (ver generar_datos.py).
+    """
+    from werkzeug.datastructures import MultiDict
+    from app import SELECT_EXPEDIENTE_DETALLE, filtros_expediente, select_expediente
+
+    conn = getConexion()
+    cur = conn.cursor(buffered=True, dictionary=True)
+    fallas = 0
+    try:
+        for forma in FORMAS_FILTRO:
+            where, params, error = filtros_expediente(MultiDict(forma))
+            if error:
+                raise RuntimeError(f"Forma de filtro inválida {forma}: {error}")
+            where_clause = ("WHERE " + " AND ".join(where)) if where else ""
+            consultas = {
+                "conteo": f"SELECT COUNT(*) FROM expediente e {where_clause}",
+                "pagina": f"{SELECT_EXPEDIENTE_DETALLE} {where_clause} ORDER BY e.id DESC LIMIT 50",
+                # ?fields=id,estado,fecha: sin JOINs
+                "ligera": f"{select_expediente(['id', 'estado', 'fecha'])} {where_clause} ORDER BY e.id DESC LIMIT 50",
+            }
+            if "estado" not in forma:
+                # Sólo Cerrado se archiva: con otro estado el archivo no se consulta
+                consultas["archivo"] = (f"{select_expediente(None, 'expediente_archivo')} {where_clause} "
+                                        "ORDER BY e.id DESC LIMIT 50")
+            for tipo, sql in consultas.items():
+                cur.execute("EXPLAIN " + sql, tuple(params))
+                plan = [r for r in cur.fetchall() if r["table"] == "e"]
+                ok = all(r["type"] != "ALL" for r in plan)
+                fallas += not ok
+                detalle = ", ".join(f"type={r['type']} key={r['key']}" for r in plan)
+                print(f"{'OK   ' if ok else 'SCAN '} {tipo:6} {sorted(forma) or ['(sin filtros)']}: {detalle}")
+    finally:
+        cur.close()
+        conn.close()
+    return fallas == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migraciones del esquema sis_exp")
+    parser.add_argument("accion", nargs="?", default="aplicar", choices=["aplicar", "estado", "verificar"])
+    args = parser.parse_args()
+    if args.accion == "aplicar":
+        aplicar()
+    elif args.accion == "estado":
+        estado()
+    else:
+        sys.exit(0 if verificar() else 1)
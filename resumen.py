@@ -0,0 +1,114 @@
+"""
+Conteos de expedientes por usuario/aseguradora/juzgado/caso x estado
+(tabla expediente_resumen, migración 003).
+
+Las rutas de escritura llaman a ajustar() con el cursor de su transacción;
+este script reconstruye o verifica la tabla desde cero:
+
+    python resumen.py verificar      # compara contra expediente, sale 1 si difiere
+    python resumen.py reconstruir    # recalcula toda la tabla
+"""
+import sys
+import argparse
+from collections import Counter
+from bd import transaccion, cursor
+
+# Orden de las columnas de la clave (sin estado)
+DIMENSIONES = ("usuario_id", "aseguradora_id", "juzgado_id", "caso_id")
+
+# Cuenta también los archivados (migración 005): archivar no cambia los conteos
+SQL_RECALCULO = """
+    SELECT usuario_id, aseguradora_id, juzgado_id, caso_id, estado, COUNT(*)
+    FROM (
+        SELECT usuario_id, aseguradora_id, juzgado_id, caso_id, estado FROM expediente
+        UNION ALL
+        SELECT usuario_id, aseguradora_id, juzgado_id, caso_id, estado FROM expediente_archivo
+    ) e
+    WHERE estado IS NOT NULL
+    GROUP BY usuario_id, aseguradora_id, juzgado_id, caso_id, estado
+"""
+
+
+def clave(fila):
+    """(usuario_id, aseguradora_id, juzgado_id, caso_id, estado) de un dict de expediente."""
+    return tuple(int(fila[d]) for d in DIMENSIONES) + (fila["estado"],)
+
+
+def ajustar(cur, deltas):
+    """
+    Aplica {clave: delta} sobre expediente_resumen en una sola sentencia.
+    Las claves con delta 0 o estado nulo se ignoran. Las filas van ordenadas
+    por clave: así dos transacciones que mueven conteos entre los mismos
+    grupos (A->B y B->A) las bloquean en el mismo orden y no se trancan.
+    """
+    if not isinstance(deltas, Counter):
+        deltas = Counter(deltas)
+    filas = sorted(k + (d,) for k, d in deltas.items() if d and k[-1] is not None)
+    if not filas:
+        return
+    marcas = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(filas))
+    cur.execute(
+        f"INSERT INTO expediente_resumen ({', '.join(DIMENSIONES)}, estado, total) "
+        f"VALUES {marcas} ON DUPLICATE KEY UPDATE total = total + VALUES(total)",
+        tuple(v for fila in filas for v in fila),
+    )
+
+
+def mover(cur, anterior, nueva):
+    """Resta la clave anterior y suma la nueva (alta: anterior=None; baja: nueva=None)."""
+    deltas = Counter()
+    if anterior is not None:
+        deltas[clave(anterior)] -= 1
+    if nueva is not None:
+        deltas[clave(nueva)] += 1
+    ajustar(cur, deltas)
+
+
+def total(cur, filtros):
+    """
+    Cantidad de expedientes con {columna: valor} (DIMENSIONES y/o estado),
+    sumando grupos de expediente_resumen en vez de contar filas. No incluye
+    expedientes con estado nulo, que la API no permite crear.
+    """
+    where = " AND ".join(f"{c} = %s" for c in filtros) or "1 = 1"
+    cur.execute(f"SELECT COALESCE(SUM(total), 0) FROM expediente_resumen WHERE {where}", tuple(filtros.values()))
+    return int(cur.fetchone()[0])
+
+
+def reconstruir():
+    # INSERT ... SELECT toma locks compartidos sobre expediente, así que las
+    # escrituras concurrentes esperan a que termine la reconstrucción.
+    with transaccion() as cur:
+        cur.execute("DELETE FROM expediente_resumen")
+        cur.execute(
+            f"INSERT INTO expediente_resumen ({', '.join(DIMENSIONES)}, estado, total) " + SQL_RECALCULO
+        )
+        print(f"expediente_resumen reconstruida: {cur.rowcount} grupos")
+
+
+def verificar():
+    """Devuelve {clave: (esperado, guardado)} para los grupos que no coinciden."""
+    with cursor(buffered=True) as cur:
+        cur.execute(SQL_RECALCULO)
+        esperado = {tuple(f[:5]): f[5] for f in cur.fetchall()}
+        cur.execute(f"SELECT {', '.join(DIMENSIONES)}, estado, total FROM expediente_resumen WHERE total <> 0")
+        guardado = {tuple(f[:5]): f[5] for f in cur.fetchall()}
+    return {
+        k: (esperado.get(k, 0), guardado.get(k, 0))
+        for k in esperado.keys() | guardado.keys()
+        if esperado.get(k, 0) != guardado.get(k, 0)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de expediente_resumen")
+    parser.add_argument("accion", choices=["verificar", "reconstruir"])
+    args = parser.parse_args()
+    if args.accion == "reconstruir":
+        reconstruir()
+    else:
+        diferencias = verificar()
+        for k, (esperado, guardado) in sorted(diferencias.items(), key=str):
+            print(f"{dict(zip(DIMENSIONES + ('estado',), k))}: esperado={esperado} guardado={guardado}")
+        print("OK" if not diferencias else f"{len(diferencias)} grupos con diferencias")
+        sys.exit(1 if diferencias else 0)
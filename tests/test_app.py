@@ -0,0 +1,203 @@
+import io
+import json
+import pytest
+from app import iter_json_array, iter_ndjson, encode_cursor, decode_cursor
+
+FILAS = [{"id": 1, "estado": "En Curso", "nota": "añ,]"}, 1234, -5.5e3, "x", None, True, [1, [2]], {}]
+
+
+def leer(texto, **kwargs):
+    return list(iter_json_array(io.BytesIO(texto.encode()), **kwargs))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 65536])
+def test_iter_json_array_cortes_de_bloque(chunk_size):
+    texto = " [ " + " ,\n".join(json.dumps(f, ensure_ascii=False) for f in FILAS) + " ] "
+    assert leer(texto, chunk_size=chunk_size) == FILAS
+
+
+def test_iter_json_array_vacio():
+    assert leer("[]") == []
+    assert leer(" [ \n ] ", chunk_size=1) == []
+
+
+@pytest.mark.parametrize("texto", ["[1,]", "[1,2,]", "[,]", "[1 2]", "[1,", "[{\"a\": 1}", ""])
+def test_iter_json_array_malformado(texto):
+    with pytest.raises(ValueError):
+        leer(texto, chunk_size=2)
+
+
+@pytest.mark.parametrize("texto", ['{"a": 1}', "1", '"[1]"', "null"])
+def test_iter_json_array_no_arreglo(texto):
+    with pytest.raises(ValueError, match="arreglo"):
+        leer(texto)
+
+
+def test_iter_json_array_elemento_demasiado_grande():
+    grande = json.dumps({"nota": "x" * 5000})
+    assert leer(f"[{grande}]", chunk_size=100, elemento_max=10000) == [{"nota": "x" * 5000}]
+    with pytest.raises(ValueError, match="caracteres"):
+        leer(f"[{grande}]", chunk_size=100, elemento_max=1000)
+
+
+def test_iter_json_array_malformado_no_acumula_el_cuerpo():
+    leidos = []
+
+    class Stream:
+        def read(self, n):
+            leidos.append(n)
+            return b"[" if len(leidos) == 1 else b"x" * n
+
+    with pytest.raises(ValueError, match="caracteres"):
+        list(iter_json_array(Stream(), chunk_size=100, elemento_max=1000))
+    assert sum(leidos) <= 1000 + 2 * 100
+
+
+
+@pytest.fixture
+def admin():
+    from app import app
+    cliente = app.test_client()
+    with cliente.session_transaction() as s:
+        s["user_id"], s["username"] = 1, "admin"
+    return cliente
+
+
+@pytest.mark.parametrize("metodo", ["patch", "delete"])
+@pytest.mark.parametrize("ids", [[True], [2.7], ["1a"], [None], [[1]], [1, False]])
+def test_bulk_rechaza_ids_no_enteros(admin, metodo, ids):
+    r = getattr(admin, metodo)("/expedientes/bulk", json={"ids": ids, "valores": {"estado": "Cerrado"}})
+    assert r.status_code == 400
+    assert r.get_json()["error"] == "ids deben ser enteros"
+
+
+@pytest.mark.parametrize("filtros", [{"usuario_id": True}, {"usuario_id": 1.5}, {"caso_id": "x"},
+                                     {"estado": ""}, {"q": 3}, {"fecha_desde": None}])
+def test_bulk_rechaza_filtros_invalidos(admin, filtros):
+    r = admin.delete("/expedientes/bulk", json={"filtros": filtros})
+    assert r.status_code == 400
+
+
+@pytest.fixture
+def usuario():
+    from app import app
+    cliente = app.test_client()
+    with cliente.session_transaction() as s:
+        s["user_id"], s["username"] = 2, "usuario"
+    return cliente
+
+
+def test_iter_ndjson():
+    texto = b'{"a": 1}\n\n  \n[2]\r\nno es json\n"fin"'
+    assert list(iter_ndjson(io.BytesIO(texto))) == [({"a": 1}, None), ([2], None), (None, "JSON inválido"), ("fin", None)]
+
+
+def test_iter_ndjson_linea_demasiado_grande():
+    grande = json.dumps({"nota": "x" * 5000}).encode()
+    texto = b'{"a": 1}\n' + grande + b'\n{"b": 2}\n'
+    assert [o for o, _ in iter_ndjson(io.BytesIO(texto), linea_max=10000)] == [{"a": 1}, {"nota": "x" * 5000}, {"b": 2}]
+    filas = list(iter_ndjson(io.BytesIO(texto), linea_max=1000))
+    assert filas[0] == ({"a": 1}, None) and filas[2] == ({"b": 2}, None)
+    assert filas[1][0] is None and "bytes" in filas[1][1]
+
+
+def test_iter_ndjson_linea_grande_no_se_acumula():
+    leidos = []
+
+    class Stream(io.BytesIO):
+        def readline(self, n=-1):
+            linea = super().readline(n)
+            leidos.append(len(linea))
+            return linea
+
+    filas = list(iter_ndjson(Stream(b"x" * (5 * 1024 * 1024) + b'\n{"b": 2}\n'), linea_max=1000))
+    assert filas[0][0] is None and filas[1] == ({"b": 2}, None)
+    assert max(leidos) <= 1001
+
+
+def test_decode_cursor():
+    assert decode_cursor(encode_cursor(after_id=10)) == (10, None)
+    assert decode_cursor(encode_cursor(before_id=3)) == (None, 3)
+
+
+@pytest.mark.parametrize("token", ["", "no-es-base64!", encode_cursor(after_id="10"),
+                                   "eyJhIjoxLCJiIjoyfQ", "W10"])  # {"a":1,"b":2} y []
+def test_decode_cursor_invalido(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.mark.parametrize("query", ["page_size=0", "page_size=-5", "page_size=1001", "page=0", "page=-1"])
+def test_listar_rechaza_paginacion_fuera_de_rango(usuario, query):
+    r = usuario.get("/expedientes?" + query)
+    assert r.status_code == 400
+    assert "page" in r.get_json()["error"]
+
+
+def test_listar_rechaza_cursor_invalido(usuario):
+    r = usuario.get("/expedientes?cursor=no-es-base64!")
+    assert r.status_code == 400
+
+
+EXPEDIENTE = {"aseguradora_id": 1, "usuario_id": 1, "juzgado_id": 1, "caso_id": 1,
+              "estado": "Pendiente", "fecha": "2024-01-01"}
+
+
+@pytest.mark.parametrize("valor", [1.5, True, "1a", None, [1]])
+def test_crear_rechaza_fk_no_entero(admin, valor):
+    r = admin.post("/expedientes", json={**EXPEDIENTE, "caso_id": valor})
+    assert r.status_code == 400
+    assert "caso_id" in r.get_json()["error"]
+
+
+def test_actualizar_rechaza_fk_no_entero(admin):
+    r = admin.put("/expedientes/1", json={"usuario_id": 2.5})
+    assert r.status_code == 400
+
+
+def test_normalizar_fks():
+    from app import normalizar_fks
+    assert normalizar_fks({"usuario_id": "7", "caso_id": 3, "estado": "Cerrado"}) == ({"usuario_id": 7, "caso_id": 3}, None)
+    refs, error = normalizar_fks({"usuario_id": 1.0})
+    assert refs is None and "usuario_id" in error
+
+
+class CacheCatalogos:
+    def __init__(self, ids):
+        self.ids, self.invalidadas = ids, []
+
+    def ids_cacheados(self, tabla):
+        return self.ids.get(tabla)
+
+    def invalidar(self, tabla):
+        self.invalidadas.append(tabla)
+
+
+class CursorFilas:
+    def __init__(self, filas):
+        self.filas, self.consultas = filas, []
+
+    def execute(self, sql, params):
+        self.consultas.append((sql, params))
+
+    def fetchall(self):
+        return self.filas
+
+
+def test_fks_existentes_invalida_solo_entradas_vigentes_desactualizadas(monkeypatch):
+    import app
+    cache = CacheCatalogos({"usuario": frozenset({1}), "caso": frozenset({5})})
+    monkeypatch.setattr(app, "catalogo_cache", cache)
+    # usuario 2 y 3 faltan en la caché vigente; aseguradora no tiene entrada
+    cur = CursorFilas([("usuario_id", 2), ("usuario_id", 3), ("aseguradora_id", 9)])
+    existentes = app.fks_existentes(cur, {"usuario_id": {1, 2, 3}, "aseguradora_id": {9}, "caso_id": {5}})
+    assert existentes == {"usuario_id": {1, 2, 3}, "aseguradora_id": {9}, "caso_id": {5}}
+    assert cache.invalidadas == ["usuario"]  # una vez, y no aseguradora (fría)
+    assert len(cur.consultas) == 1 and cur.consultas[0][1][0] == "usuario_id"  # caso no se consulta
+
+
+def test_fks_existentes_todo_en_cache_no_consulta(monkeypatch):
+    import app
+    monkeypatch.setattr(app, "catalogo_cache", CacheCatalogos({"usuario": frozenset({1})}))
+    cur = CursorFilas([])
+    assert app.fks_existentes(cur, {"usuario_id": {1}}) == {"usuario_id": {1}}
+    assert cur.consultas == []
@@ -0,0 +1,94 @@
+import time
+import conexion
+import consultas_lentas
+from consultas_lentas import normalizar
+
+
+def test_normalizar_literales_y_parametros():
+    assert normalizar("SELECT *  FROM expediente\n WHERE id = 12 AND estado = 'Cerrado' AND fecha >= %s") == \
+        "SELECT * FROM expediente WHERE id = ? AND estado = ? AND fecha >= ?"
+
+
+def test_normalizar_listas_in():
+    corta = normalizar("SELECT id FROM caso WHERE id IN (%s, %s)")
+    larga = normalizar("SELECT id FROM caso WHERE id IN (%s, %s, %s, %s, %s)")
+    assert corta == larga == "SELECT id FROM caso WHERE id IN (?+)"
+
+
+def test_normalizar_filas_values():
+    una = normalizar("INSERT INTO expediente (a, b) VALUES (%s, %s)")
+    tres = normalizar("INSERT INTO expediente (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)")
+    assert tres == "INSERT INTO expediente (a, b) VALUES (?+), ..."
+    assert una == "INSERT INTO expediente (a, b) VALUES (?+)"
+
+
+def test_normalizar_no_toca_identificadores():
+    assert normalizar("SELECT t1.id FROM expediente_resumen t1") == "SELECT t1.id FROM expediente_resumen t1"
+
+
+class Pool:
+    """Pool de prueba: registra préstamos, devoluciones y lo ejecutado."""
+    def __init__(self, agotado=False):
+        self.agotado, self.prestadas, self.devueltas, self.sql = agotado, 0, 0, []
+
+    def get_connection(self, timeout=None):
+        if self.agotado:
+            raise conexion.PoolAgotado("sin conexiones")
+        self.prestadas += 1
+        return Conexion(self)
+
+
+class Conexion:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, **kwargs):
+        return Cursor(self.pool)
+
+    def close(self):
+        self.pool.devueltas += 1
+
+
+class Cursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def execute(self, sql, params=None):
+        self.pool.sql.append(sql)
+
+    def fetchall(self):
+        return [{"table": "e", "rows": 10}]
+
+    def close(self):
+        pass
+
+
+def esperar_plan(registro, forma):
+    for _ in range(200):
+        f = registro._formas[forma]
+        if f["plan"] is not None:
+            return f["plan"]
+        time.sleep(0.01)
+    raise AssertionError("sin plan")
+
+
+def test_explain_usa_el_pool_de_la_consulta(monkeypatch):
+    monkeypatch.setattr(consultas_lentas, "LENTAS_EXPLAIN_INTERVALO", 0)
+    registro = consultas_lentas.ConsultasLentas(umbral_ms=0)
+    primario, replica = Pool(), Pool()
+    registro.consulta("SELECT * FROM expediente WHERE id = %s", (1,), 1.0, replica)
+    assert esperar_plan(registro, "SELECT * FROM expediente WHERE id = ?") == [{"table": "e", "rows": 10}]
+    assert replica.sql == ["EXPLAIN SELECT * FROM expediente WHERE id = %s"] and replica.devueltas == 1
+    assert primario.prestadas == 0
+
+
+def test_explain_con_pool_agotado_se_reintenta(monkeypatch):
+    monkeypatch.setattr(consultas_lentas, "LENTAS_EXPLAIN_INTERVALO", 0)
+    registro = consultas_lentas.ConsultasLentas(umbral_ms=0)
+    registro.consulta("SELECT 1 FROM caso", None, 1.0, Pool(agotado=True))
+    forma = registro._formas["SELECT ? FROM caso"]
+    for _ in range(200):
+        if forma["plan_pedido"] == 0.0:
+            break
+        time.sleep(0.01)
+    assert forma["plan_pedido"] == 0.0 and forma["plan"] is None
@@ -0,0 +1,29 @@
+import pytest
+from formatos import formatear_filas
+
+COLUMNAS = ("id", "estado")
+FILAS = [(2, "Cerrado"), (1, "Pendiente")]
+
+
+def test_objects():
+    assert formatear_filas(COLUMNAS, FILAS, "objects") == {
+        "data": [{"id": 2, "estado": "Cerrado"}, {"id": 1, "estado": "Pendiente"}],
+    }
+
+
+def test_rows():
+    assert formatear_filas(COLUMNAS, FILAS, "rows") == {
+        "columns": ["id", "estado"], "data": [[2, "Cerrado"], [1, "Pendiente"]],
+    }
+
+
+def test_columns():
+    assert formatear_filas(COLUMNAS, FILAS, "columns") == {
+        "columns": ["id", "estado"], "data": {"id": [2, 1], "estado": ["Cerrado", "Pendiente"]},
+    }
+
+
+@pytest.mark.parametrize("formato", ["objects", "rows", "columns"])
+def test_sin_filas(formato):
+    cuerpo = formatear_filas(COLUMNAS, [], formato)
+    assert cuerpo["data"] in ([], {"id": [], "estado": []})
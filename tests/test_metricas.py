@@ -0,0 +1,39 @@
+import pytest
+import metricas
+from app import app
+
+
+@pytest.fixture
+def cliente():
+    return app.test_client()
+
+
+def sesion(cliente, username):
+    with cliente.session_transaction() as s:
+        s["user_id"], s["username"] = 1, username
+
+
+def test_metrics_sin_credenciales(cliente):
+    assert cliente.get("/metrics").status_code == 401
+
+
+def test_metrics_usuario_no_admin(cliente):
+    sesion(cliente, "usuario")
+    assert cliente.get("/metrics").status_code == 403
+
+
+def test_metrics_admin(cliente):
+    sesion(cliente, "admin")
+    r = cliente.get("/metrics")
+    assert r.status_code == 200 and b"db_pool_connections" in r.data
+
+
+def test_metrics_token(cliente, monkeypatch):
+    monkeypatch.setattr(metricas, "METRICAS_TOKEN", "secreto")
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer secreto"}).status_code == 200
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer otro"}).status_code == 401
+
+
+def test_metrics_token_vacio_no_habilita(cliente, monkeypatch):
+    monkeypatch.setattr(metricas, "METRICAS_TOKEN", "")
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 401
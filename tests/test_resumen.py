@@ -0,0 +1,42 @@
+from collections import Counter
+import resumen
+
+
+class Cursor:
+    def __init__(self):
+        self.consultas = []
+
+    def execute(self, sql, params=None):
+        self.consultas.append((sql, params))
+
+
+def fila(usuario_id, estado):
+    return {"usuario_id": usuario_id, "aseguradora_id": 1, "juzgado_id": 1, "caso_id": 1, "estado": estado}
+
+
+def claves(cur):
+    params = cur.consultas[0][1]
+    return [params[i:i + 5] for i in range(0, len(params), 6)]
+
+
+def test_mover_en_ambos_sentidos_bloquea_en_el_mismo_orden():
+    a, b = fila(2, "Pendiente"), fila(1, "Cerrado")
+    ida, vuelta = Cursor(), Cursor()
+    resumen.mover(ida, a, b)
+    resumen.mover(vuelta, b, a)
+    assert claves(ida) == claves(vuelta) == [(1, 1, 1, 1, "Cerrado"), (2, 1, 1, 1, "Pendiente")]
+
+
+def test_ajustar_ordena_e_ignora_deltas_nulos():
+    cur = Cursor()
+    resumen.ajustar(cur, Counter({(3, 1, 1, 1, "Cerrado"): 2, (1, 1, 1, 1, "Cerrado"): -1,
+                                  (2, 1, 1, 1, "Cerrado"): 0, (1, 1, 1, 1, None): 4}))
+    sql, params = cur.consultas[0]
+    assert sql.count("(%s, %s, %s, %s, %s, %s)") == 2
+    assert params == (1, 1, 1, 1, "Cerrado", -1, 3, 1, 1, 1, "Cerrado", 2)
+
+
+def test_ajustar_sin_cambios_no_consulta():
+    cur = Cursor()
+    resumen.mover(cur, fila(1, "Cerrado"), fila(1, "Cerrado"))
+    assert cur.consultas == []
@@ -0,0 +1,13 @@
+"""
+Punto de entrada WSGI para producción.
+
+    gunicorn wsgi:app          # toma la configuración de gunicorn.conf.py
+
+gunicorn.conf.py crea el admin una sola vez en el master, dimensiona el pool
+de cada worker según sus hilos y cierra las conexiones al apagar. Con otro
+servidor WSGI de un solo proceso, DB_POOL_SIZE debe igualar a sus hilos.
+`python app.py` sigue siendo el servidor de desarrollo (debug + reloader).
+"""
+from app import app
+
+application = app